@@ -0,0 +1,82 @@
+"""! Registry of the samplers the solve functions can use.
+
+Every backend is registered with a factory that imports its dependencies only when the backend is selected.
+Importing the generators therefore doesn't import dwave.system(or the cloud client), so simulated annealing
+runs start fast and work on hosts without the cloud client.
+
+Structured backends(QPUs and their stand-ins) are wrapped in an EmbeddingComposite unless embed=False is given.
+
+Example:
+    sampler = backends.getSampler('SA')
+    backends.register('RANDOM', 'Uniformly random samples', dimod.RandomSampler)
+"""
+
+class Backend:
+    """! A registered sampler"""
+
+    def __init__(this, name, description, factory, structured=False):
+        """! Constructs a backend
+
+        @param name Name of the backend, used by the -m flag of the command line interfaces
+        @param description One line description
+        @param factory Function that receives the keyword arguments of getSampler() and returns a new sampler.
+               It should import the dependencies of the sampler itself
+        @param structured Whether the sampler has a fixed topology(and needs an embedding)
+        """
+        this.name = name
+        this.description = description
+        this.factory = factory
+        this.structured = structured
+
+    def sampler(this, embed=True, **config):
+        """! Returns a new sampler of the backend
+
+        @param embed Wrap structured samplers in an EmbeddingComposite
+        @param **config Keyword arguments of the factory
+        """
+        sampler = this.factory(**config)
+        if this.structured and embed:
+            from dwave.system import EmbeddingComposite
+            sampler = EmbeddingComposite(sampler)
+        return sampler
+
+BACKENDS = {}
+
+def register(name, description, factory, structured=False):
+    """! Registers a backend, replacing an existing one with the same name. See Backend()"""
+    BACKENDS[name] = Backend(name, description, factory, structured)
+    return BACKENDS[name]
+
+def get(name):
+    """! Returns the backend with the given name"""
+    if name not in BACKENDS:
+        raise ValueError('Backend must be one of '+str(names())+', not '+str(name))
+    return BACKENDS[name]
+
+def names():
+    """! Returns the names of all registered backends"""
+    return list(BACKENDS)
+
+def getSampler(name, embed=True, **config):
+    """! Returns a new sampler of the backend with the given name, see Backend.sampler()"""
+    return get(name).sampler(embed, **config)
+
+def helpText():
+    """! Returns the description of all backends for the help of the command line interfaces"""
+    return ', '.join(backend.name+': '+backend.description for backend in BACKENDS.values())
+
+def simulatedAnnealing(**config):
+    from neal.sampler import SimulatedAnnealingSampler
+    return SimulatedAnnealingSampler(**config)
+
+def dwave(**config):
+    from dwave.system import DWaveSampler
+    return DWaveSampler(**config)
+
+def offline(**config):
+    from offlineSampler import OfflineDWaveSampler
+    return OfflineDWaveSampler(**config)
+
+register('SA', 'Simulated annealing', simulatedAnnealing)
+register('QA', 'D-Wave quantum annealer', dwave, structured=True)
+register('OFFLINE', 'Local stand-in of the QPU(see offlineSampler)', offline, structured=True)
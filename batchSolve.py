@@ -0,0 +1,167 @@
+"""! Solves several small instances with one QPU submission.
+
+The bqms of the instances are merged into one disjoint union whose variables are (instance index, variable) tuples.
+Every instance is embedded on the qubits the previous instances left free, so the instances sit side by side on
+separate regions of the target graph and are sampled at once. Afterwards the sampleset is split into one sampleset
+per instance with the same info as the samplesets of solveDWave().
+
+Instances that don't fit onto the QPU anymore are moved to the next submission.
+"""
+import dimod
+import minorminer
+import networkx as nx
+
+import backends
+from stacking import StackingQUBOGenerator
+from stackingPallet import PalletQUBOGenerator
+from qaUtils import saveSampleset
+
+def buildGenerators(instances, model='pallet', dec_bound=1, penaltyMul=50, penaltyScales=None, encoding='onehot'):
+    """! Returns one generator with a full bqm per instance
+
+    @param instances List of instances. Each instance is a list of sequences
+    @param model Either 'bin' or 'pallet'
+    """
+    generators = []
+    for sequences in instances:
+        if model == 'bin':
+            generator = StackingQUBOGenerator(sequences, dec_bound, penaltyScales, encoding)
+            generator.generateBQM()
+        elif model == 'pallet':
+            generator = PalletQUBOGenerator(sequences, penaltyMul=penaltyMul, penaltyScales=penaltyScales, encoding=encoding)
+        else:
+            raise ValueError('Model must be either bin or pallet, not '+str(model))
+        generators.append(generator)
+    return generators
+
+def mergeBQMs(bqms, normalize=True):
+    """! Returns the disjoint union of the bqms. Variable v of the i-th bqm is called (i, v).
+
+    @param normalize Scales every bqm to a largest absolute bias of 1 first. The QPU scales the whole problem
+           at once, so otherwise an instance with large penalties would compress the biases of all others
+    """
+    merged = dimod.BinaryQuadraticModel(dimod.Vartype.BINARY)
+    for index, bqm in enumerate(bqms):
+        scale = 1
+        if normalize:
+            largest = max([abs(bias) for bias in bqm.linear.values()] + [abs(bias) for bias in bqm.quadratic.values()] + [1e-12])
+            scale = 1/largest
+        for var, bias in bqm.linear.items():
+            merged.add_variable((index, var), bias*scale)
+        for (u, v), bias in bqm.quadratic.items():
+            merged.add_interaction((index, u), (index, v), bias*scale)
+        merged.offset += bqm.offset*scale
+    return merged
+
+def embedBatch(bqms, targetEdges, first=0, tries=3, seed=None):
+    """! Embeds the bqms one after another on the qubits the previous ones left free.
+
+    @param bqms The bqms to embed
+    @param targetEdges Edges of the target graph
+    @param first Index of the first bqm to embed
+    @param tries Number of attempts of minorminer per bqm
+    @param seed Seed of minorminer
+
+    @returns (embedding of the merged bqm of the embedded bqms(see mergeBQMs()), index after the last bqm that could be embedded)
+    """
+    target = nx.Graph(targetEdges)
+    embedding = {}
+    index = first
+    while index < len(bqms):
+        source = list(bqms[index].quadratic) + [(var, var) for var in bqms[index].variables if bqms[index].degree(var) == 0]
+        chains = minorminer.find_embedding([edge for edge in source if edge[0] != edge[1]], target.edges,
+                tries=tries, random_seed=seed)
+        isolated = [edge[0] for edge in source if edge[0] == edge[1]]
+        if len(chains) == 0 and len(source) > len(isolated):
+            break
+
+        #Isolated variables don't occur in the edges, give them their own free qubit
+        used = set(qubit for chain in chains.values() for qubit in chain)
+        free = [qubit for qubit in target.nodes if qubit not in used]
+        if len(free) < len(isolated):
+            break
+        for var, qubit in zip(isolated, free):
+            chains[var] = [qubit]
+
+        for var, chain in chains.items():
+            embedding[(index-first, var)] = list(chain)
+            target.remove_nodes_from(chain)
+        index += 1
+    return embedding, index
+
+def splitSampleset(sampleset, generators, first=0, info=None):
+    """! Splits the sampleset of a merged bqm into one sampleset per instance.
+    The energies are calculated with the original, unnormalized bqms.
+
+    @param sampleset Sampleset of the merged bqm
+    @param generators Generators of the instances in the merged bqm, in the order they were merged
+    @param first Index of the first instance of the merged bqm in the whole batch
+    @param info Additional info to store in every sampleset
+
+    @returns List of samplesets
+    """
+    columns = {var:i for i, var in enumerate(sampleset.variables)}
+    samplesets = []
+    for index, generator in enumerate(generators):
+        variables = list(generator.bqm.variables)
+        samples = sampleset.record.sample[:, [columns[(index, var)] for var in variables]]
+        part = dimod.SampleSet.from_samples((samples, variables), dimod.Vartype.BINARY,
+                energy=generator.bqm.energies((samples, variables)),
+                num_occurrences=sampleset.record.num_occurrences)
+        if info is not None:
+            part.info.update(info)
+        part.info['bqm'] = generator.bqm
+        part.info['sequences'] = generator.sequences
+        part.info['penaltyFactor'] = generator.penaltyFactor
+        part.info['penaltyScales'] = generator.penaltyScales
+        part.info['encoding'] = generator.encoding
+        part.info['batch'] = {'index':first+index, 'submissionSize':len(generators)}
+        samplesets.append(part)
+    return samplesets
+
+def solveBatch(instances, num_reads, model='pallet', sampler=None, offline=False, dec_bound=1, penaltyMul=50,
+        penaltyScales=None, encoding='onehot', save=True, seed=None, **args):
+    """! Approximates solutions of several instances with as few QPU submissions as possible
+
+    @param instances List of instances. Each instance is a list of sequences
+    @param num_reads Number of samples to generate for every instance
+    @param model Either 'bin' or 'pallet'
+    @param sampler The structured sampler to use. A DWaveSampler(or the offline stand-in) if omitted
+    @param offline Use the local stand-in of the QPU(see offlineSampler) if no sampler is given
+    @param save Save every sampleset like solveDWave() does
+    @param seed Seed of the embedding
+    @param **args Additional keyword arguments are forwarded to the sampler
+
+    @returns List with one sampleset per instance, in the order of the instances
+    """
+    if sampler is None:
+        sampler = backends.getSampler('OFFLINE' if offline else 'QA', embed=False)
+
+    generators = buildGenerators(instances, model, dec_bound, penaltyMul, penaltyScales, encoding)
+    bqms = [generator.bqm for generator in generators]
+
+    results = []
+    first = 0
+    submission = 0
+    while first < len(generators):
+        embedding, end = embedBatch(bqms, sampler.edgelist, first, seed=seed)
+        if end == first:
+            raise RuntimeError('Instance '+str(first)+' does not fit onto the sampler')
+
+        merged = mergeBQMs(bqms[first:end])
+        from dwave.system import FixedEmbeddingComposite
+        composite = FixedEmbeddingComposite(sampler, embedding)
+        sampleset = composite.sample(merged, num_reads=num_reads, **args)
+
+        info = {'submission':submission}
+        if 'timing' in sampleset.info:
+            info['timing'] = sampleset.info['timing']
+        parts = splitSampleset(sampleset, generators[first:end], first, info)
+        for part in parts:
+            if save:
+                saveSampleset(part, 'data/'+('pallet/' if model == 'pallet' else '')+'QA-batch-'+str(part.info['batch']['index'])+'-')
+        results += parts
+        first = end
+        submission += 1
+
+    return results
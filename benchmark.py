@@ -0,0 +1,245 @@
+"""! Performance benchmarks of the QUBO generators with stored baselines.
+
+Every case of the grid generates one seeded instance and measures
+ - the time generateBQM() (or the construction of a PalletQUBOGenerator) takes,
+ - the number of variables and couplers of the resulting bqm,
+ - the peak memory allocated while the bqm is constructed,
+ - the sampling throughput of simulated annealing on the bqm and
+ - the time calcConstraintStats() needs to analyse the sampleset.
+
+The results can be stored as a JSON baseline. Later runs are compared against it and
+every metric that got worse by more than the tolerance is reported as a regression.
+"""
+import contextlib
+import io
+import json
+import os
+import platform
+import time
+import tracemalloc
+
+from neal.sampler import SimulatedAnnealingSampler
+
+from stacking import StackingQUBOGenerator
+from stackingPallet import PalletQUBOGenerator
+import collectConstStats
+import collectConstStatsPallet
+import instanceGenerator
+
+DEFAULT_BASELINE = 'data/benchmarkBaseline.json'
+
+#(labelCount, labelSize) of the instances of every model. Two sequences each
+DEFAULT_GRID = {'bin':[(2,2), (3,2), (4,2), (3,3), (5,2)],
+                'pallet':[(3,2), (4,2), (6,2), (4,3), (8,2)]}
+QUICK_GRID = {'bin':[(2,2), (3,2)], 'pallet':[(3,2), (4,2)]}
+
+#Metrics that are compared against the baseline. Lower values are better for all of them but the throughput
+TIMING_METRICS = ['generateTime', 'analysisTime']
+COUNT_METRICS = ['variables', 'interactions']
+MEMORY_METRICS = ['peakMemory']
+THROUGHPUT_METRICS = ['readsPerSecond']
+
+def caseName(model, labelCount, labelSize, encoding='onehot'):
+    """! Returns the key of a benchmark case in the results"""
+    return model+'-l'+str(labelCount)+'-s'+str(labelSize)+'-'+encoding
+
+def buildGenerator(model, sequences, dec_bound=1, encoding='onehot'):
+    """! Returns a generator of the given model with the full bqm"""
+    if model == 'bin':
+        generator = StackingQUBOGenerator(sequences, dec_bound, encoding=encoding)
+        generator.generateBQM()
+        return generator
+    elif model == 'pallet':
+        return PalletQUBOGenerator(sequences, encoding=encoding)
+    raise ValueError('Model must be either bin or pallet, not '+str(model))
+
+def measureGeneration(model, sequences, repeats=3, dec_bound=1, encoding='onehot'):
+    """! Measures the construction of the bqm.
+    The time is the fastest of repeats runs, the peak memory is measured in a separate run
+    because tracemalloc slows down the allocations.
+
+    @returns (generator of the last run, dict of metrics)
+    """
+    best = None
+    for _ in range(0, repeats):
+        start = time.perf_counter()
+        generator = buildGenerator(model, sequences, dec_bound, encoding)
+        elapsed = time.perf_counter()-start
+        if best is None or elapsed < best:
+            best = elapsed
+
+    tracemalloc.start()
+    buildGenerator(model, sequences, dec_bound, encoding)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return generator, {'generateTime':best, 'variables':len(generator.bqm),
+            'interactions':generator.bqm.num_interactions, 'peakMemory':peak}
+
+def measureSampling(generator, num_reads=100, num_sweeps=1000, seed=0):
+    """! Measures the throughput of simulated annealing on the bqm of the generator
+
+    @returns (sampleset, dict of metrics)
+    """
+    sampler = SimulatedAnnealingSampler()
+    start = time.perf_counter()
+    sampleset = sampler.sample(generator.bqm, num_reads=num_reads, num_sweeps=num_sweeps, seed=seed)
+    elapsed = time.perf_counter()-start
+    sampleset.info['sequences'] = generator.sequences
+    sampleset.info['encoding'] = generator.encoding
+    return sampleset, {'sampleTime':elapsed, 'readsPerSecond':num_reads/elapsed}
+
+def measureAnalysis(model, sampleset, repeats=3, dec_bound=1):
+    """! Measures the fastest of repeats runs of calcConstraintStats() for the sampleset"""
+    best = None
+    for _ in range(0, repeats):
+        start = time.perf_counter()
+        #The statistics print variables that are missing in the sampleset
+        with contextlib.redirect_stdout(io.StringIO()):
+            if model == 'bin':
+                collectConstStats.calcConstraintStats(sampleset, dec_bound)
+            else:
+                collectConstStatsPallet.calcConstraintStats(sampleset)
+        elapsed = time.perf_counter()-start
+        if best is None or elapsed < best:
+            best = elapsed
+    return {'analysisTime':best}
+
+def runCase(model, sequences, encoding='onehot', repeats=3, num_reads=100, num_sweeps=1000, seed=0):
+    """! Runs all measurements of one benchmark case and returns its metrics"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        generator, metrics = measureGeneration(model, sequences, repeats, encoding=encoding)
+    sampleset, sampling = measureSampling(generator, num_reads, num_sweeps, seed)
+    metrics.update(sampling)
+    metrics.update(measureAnalysis(model, sampleset, repeats))
+    metrics['sequences'] = sequences
+    return metrics
+
+def machineInfo():
+    """! Returns information about the machine the benchmarks run on"""
+    return {'python':platform.python_version(), 'machine':platform.machine(), 'node':platform.node(),
+            'created':time.strftime('%Y-%m-%d %H:%M:%S')}
+
+def runSuite(grid=DEFAULT_GRID, encodings=['onehot'], verbose=True, seed=0, **caseArgs):
+    """! Runs every case of the grid.
+
+    @param grid dict that maps the models to lists of (labelCount, labelSize)
+    @param encodings Encodings of the plan variables to benchmark
+    @param seed Seed of the instances(see instanceGenerator.twoSequences()) and of the sampler
+    @param **caseArgs Additional keyword arguments are forwarded to runCase()
+
+    @returns dict with information about the machine('meta') and the metrics of every case('cases')
+    """
+    cases = {}
+    for model, sizes in grid.items():
+        for encoding in encodings:
+            for labelCount, labelSize in sizes:
+                name = caseName(model, labelCount, labelSize, encoding)
+                sequences = instanceGenerator.twoSequences(labelCount, labelSize, seed)
+                cases[name] = runCase(model, sequences, encoding, seed=seed, **caseArgs)
+                if verbose:
+                    print(formatCase(name, cases[name]))
+    return {'meta':machineInfo(), 'cases':cases}
+
+def runCorpus(path, models=['bin', 'pallet'], encodings=['onehot'], verbose=True, **caseArgs):
+    """! Runs the benchmark for every instance of a corpus(see instanceGenerator).
+    The cases are named after the ids of the instances, so runs on the same corpus can be compared.
+
+    @param path Path of the corpus
+    @param models Models to benchmark every instance with
+    """
+    cases = {}
+    for instance in instanceGenerator.readCorpus(path):
+        for model in models:
+            for encoding in encodings:
+                name = model+'-'+instance['id']+'-'+encoding
+                cases[name] = runCase(model, instance['sequences'], encoding, **caseArgs)
+                if verbose:
+                    print(formatCase(name, cases[name]))
+    return {'meta':dict(machineInfo(), corpus=path), 'cases':cases}
+
+def formatCase(name, metrics):
+    """! Returns a one line summary of the metrics of a case"""
+    return '{:<36} gen {:8.4f}s  vars {:6d}  couplers {:7d}  mem {:8.1f}KiB  SA {:9.1f} reads/s  stats {:7.4f}s'.format(
+            name, metrics['generateTime'], metrics['variables'], metrics['interactions'],
+            metrics['peakMemory']/1024, metrics['readsPerSecond'], metrics['analysisTime'])
+
+def compare(results, baseline, tolerance=0.25, memoryTolerance=0.1, minDifference=0.005):
+    """! Compares results against a baseline.
+
+    @param results Results of runSuite()
+    @param baseline Results of an earlier run
+    @param tolerance Allowed relative slowdown of the timing and throughput metrics
+    @param memoryTolerance Allowed relative growth of the peak memory. The number of variables and couplers must not grow at all
+    @param minDifference Slowdowns of the timing metrics below this many seconds are treated as noise
+
+    @returns List of (case, metric, baseline value, current value) for every regression
+    """
+    regressions = []
+    for name, metrics in results['cases'].items():
+        if name not in baseline['cases']:
+            continue
+        old = baseline['cases'][name]
+        for metric in TIMING_METRICS:
+            if metrics[metric] > old[metric]*(1+tolerance) and metrics[metric]-old[metric] > minDifference:
+                regressions.append((name, metric, old[metric], metrics[metric]))
+        for metric in COUNT_METRICS:
+            if metrics[metric] > old[metric]:
+                regressions.append((name, metric, old[metric], metrics[metric]))
+        for metric in MEMORY_METRICS:
+            if metrics[metric] > old[metric]*(1+memoryTolerance):
+                regressions.append((name, metric, old[metric], metrics[metric]))
+        for metric in THROUGHPUT_METRICS:
+            if metrics[metric] < old[metric]/(1+tolerance):
+                regressions.append((name, metric, old[metric], metrics[metric]))
+    return regressions
+
+def loadBaseline(path=DEFAULT_BASELINE):
+    """! Returns the baseline stored at path or None if there is none"""
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as baselineFile:
+        return json.load(baselineFile)
+
+def storeBaseline(results, path=DEFAULT_BASELINE):
+    """! Writes results to path"""
+    directory = os.path.dirname(path)
+    if directory != '':
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w') as baselineFile:
+        json.dump(results, baselineFile, indent=2, sort_keys=True)
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description='Benchmark the QUBO generators and compare the results against a baseline')
+    parser.add_argument('-b', type=str, action='store', dest='baseline', metavar='Path of the baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('-t', type=float, action='store', dest='tolerance', metavar='Allowed relative slowdown', default=0.25)
+    parser.add_argument('-enc', type=str, action='store', dest='encodings', nargs='+', default=['onehot'], help='Encodings of the plan variables to benchmark')
+    parser.add_argument('-nr', type=int, action='store', dest='num_reads', metavar='Number of reads of the sampling benchmark', default=100)
+    parser.add_argument('-corpus', type=str, action='store', dest='corpus', metavar='Benchmark the instances of this corpus instead of the grid', default=None)
+    parser.add_argument('--quick', action='store_true', dest='quick', help='Only run the smallest cases')
+    parser.add_argument('--update', action='store_true', dest='update', help='Store the results as the new baseline')
+
+    args = parser.parse_args(sys.argv[1:])
+    if args.corpus is not None:
+        results = runCorpus(args.corpus, encodings=args.encodings, num_reads=args.num_reads)
+    else:
+        results = runSuite(QUICK_GRID if args.quick else DEFAULT_GRID, args.encodings, num_reads=args.num_reads)
+
+    baseline = loadBaseline(args.baseline)
+    if args.update or baseline is None:
+        storeBaseline(results, args.baseline)
+        print('Stored baseline at', args.baseline)
+        sys.exit(0)
+
+    if baseline['meta'].get('node') != results['meta']['node']:
+        print('WARNING: The baseline was recorded on a different machine('+str(baseline['meta'].get('node'))+')')
+
+    regressions = compare(results, baseline, args.tolerance)
+    for name, metric, old, new in regressions:
+        print('REGRESSION', name, metric+':', old, '->', new)
+    if len(regressions) > 0:
+        sys.exit(1)
+    print('No regressions against', args.baseline)
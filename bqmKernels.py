@@ -0,0 +1,178 @@
+"""! Compiled sparse form of a bqm for batched energy and flip delta evaluation.
+
+CompiledBQM stores the upper triangular QUBO matrix U of a bqm in compressed sparse rows(see qaUtils.bqmArrays()).
+The samples are stored as boolean matrix X with one column per sample. The energies are h X + colsum(X * (U^T X))
++ offset, evaluated in one of two ways instead of one walk over the dict based bqm per sample:
+  - Large batches: The interactions are grouped by their bias, the penalty constraints only use a handful of
+    different biases. The energy of a group is its bias times the number of interactions whose variables are both 1,
+    which is counted with boolean ANDs over whole rows of X. This costs one pass over two rows of X per interaction.
+  - Small batches: One sparse matrix product U^T X per chunk of samples, which has less overhead per interaction.
+Samples of SPIN bqms are mapped to binary values first, the energies don't depend on the vartype.
+
+Flipping variable i of a binary sample x changes the energy by (1-2x_i)(h_i + (S x)_i), where S = U + U^T.
+flipDeltas() evaluates this for every variable of a batch of samples, flip() updates the deltas of one sample
+after a flip in time proportional to the degree of the flipped variable, which is what local search needs.
+
+Building X takes about as long as evaluating one bqm, so several bqms over the same variables, e.g. the partial
+bqms of collectConstStats, should be compiled with the labels of the sampleset and share one matrix.
+
+Example:
+    compiled = generator.compiledBQM()
+    energies = compiled.energies(sampleset)
+"""
+import numpy as np
+
+import dimod
+from qaUtils import bqmArrays
+
+#Largest number of entries of the dense intermediate matrix of the sparse matrix product, which bounds its memory
+CHUNK_ENTRIES = 1 << 24
+
+#Batches with at least this many samples count the interactions per bias instead of using the sparse matrix product
+PAIR_SAMPLES = 1024
+
+class CompiledBQM:
+    """! CSR form of a bqm"""
+
+    def __init__(this, bqm, labels=None):
+        """! Compiles the bqm. Requires scipy
+
+        @param labels Optional order of the variables, e.g. the variables of a sampleset, so its samples can be used
+               without reordering. Has to contain every variable of the bqm, additional labels get no biases
+        """
+        import scipy.sparse
+
+        this.vartype = bqm.vartype
+        bqmLabels, bqmLinear, rows, cols, values, offset = bqmArrays(bqm)
+        if labels is None:
+            labels, linear = bqmLabels, bqmLinear
+        else:
+            labels = list(labels)
+            position = {label:i for i, label in enumerate(labels)}
+            missing = [label for label in bqmLabels if label not in position]
+            if len(missing) > 0:
+                raise ValueError('The labels lack variables of the bqm, e.g. '+str(missing[0]))
+            permutation = np.array([position[label] for label in bqmLabels], dtype=np.int64)
+            linear = np.zeros(len(labels))
+            linear[permutation] = bqmLinear
+            rows, cols = np.minimum(permutation[rows], permutation[cols]), np.maximum(permutation[rows], permutation[cols])
+        this.labels = labels
+        this.index = {label:i for i, label in enumerate(labels)}
+        this.linear = linear
+        this.offset = offset
+        size = len(labels)
+        this.upper = scipy.sparse.csr_matrix((values, (rows, cols)), shape=(size, size))
+        this.lower = this.upper.T.tocsr()
+        this.symmetric = (this.upper + this.lower).tocsr()
+
+        #Interactions grouped by their bias as (bias, rows, columns) and the variables with a linear bias
+        coo = this.upper.tocoo()
+        biases, group = np.unique(coo.data, return_inverse=True)
+        this.groups = [(bias, coo.row[group == k], coo.col[group == k]) for k, bias in enumerate(biases) if bias != 0]
+        this.linearSupport = np.nonzero(linear)[0]
+
+    def __len__(this):
+        return len(this.labels)
+
+    def matrix(this, samples):
+        """! Returns the samples as boolean matrix with one column per sample and the rows in the order of the labels
+
+        @param samples A sampleset, a (samples, labels) tuple or anything else dimod.as_samples() accepts.
+               Variables the bqm doesn't have are ignored
+        """
+        if isinstance(samples, dimod.SampleSet):
+            array, labels = samples.record.sample, list(samples.variables)
+            vartype = samples.vartype
+        else:
+            array, labels = dimod.as_samples(samples)
+            vartype = this.vartype
+        if labels == this.labels:
+            matrix = np.asarray(array).T
+        else:
+            column = {label:i for i, label in enumerate(labels)}
+            missing = [label for label in this.labels if label not in column]
+            if len(missing) > 0:
+                raise ValueError('The samples lack variables of the bqm, e.g. '+str(missing[0]))
+            matrix = np.asarray(array).T[[column[label] for label in this.labels]]
+        return np.ascontiguousarray(matrix > 0 if vartype is dimod.SPIN else matrix != 0)
+
+    def rows(this, samples):
+        """! Returns the samples as binary float matrix with one row per sample, e.g. for flip()"""
+        return np.ascontiguousarray(this.matrix(samples).T, dtype=np.float64)
+
+    def energies(this, samples):
+        """! Returns the energies of the samples, see matrix()"""
+        return this.matrixEnergies(this.matrix(samples))
+
+    def matrixEnergies(this, matrix):
+        """! Returns the energies of the columns of a boolean matrix whose rows are in the order of the labels"""
+        matrix = np.asarray(matrix, dtype=bool)
+        count = matrix.shape[1]
+        if count >= PAIR_SAMPLES:
+            res = np.full(count, float(this.offset))
+            res += this.linear[this.linearSupport] @ matrix[this.linearSupport]
+            both = np.zeros(count, dtype=np.int64)
+            for bias, rows, cols in this.groups:
+                both[:] = 0
+                for row, col in zip(rows, cols):
+                    both += matrix[row] & matrix[col]
+                res += bias*both
+            return res
+
+        chunk = max(1, CHUNK_ENTRIES//max(1, len(this.labels)))
+        res = np.empty(count)
+        for start in range(0, count, chunk):
+            block = matrix[:, start:start+chunk].astype(np.float64)
+            res[start:start+chunk] = this.linear @ block + np.einsum('ij,ij->j', block, this.lower @ block) + this.offset
+        return res
+
+    def flipDeltas(this, samples):
+        """! Returns a matrix with the energy change of flipping every variable(columns) of every sample(rows),
+        in the layout of rows()"""
+        matrix = this.matrix(samples).astype(np.float64)
+        fields = this.symmetric @ matrix + this.linear[:, None]
+        return np.ascontiguousarray(((1-2*matrix)*fields).T)
+
+    def flip(this, sample, deltas, i):
+        """! Flips variable i of one binary sample in place and updates its flip deltas in place
+
+        @param sample Row of rows()
+        @param deltas Row of flipDeltas() of the sample
+        @param i Index of the variable to flip
+        """
+        change = 1-2*sample[i]
+        sample[i] += change
+        deltas[i] = -deltas[i]
+        begin, end = this.symmetric.indptr[i], this.symmetric.indptr[i+1]
+        neighbors = this.symmetric.indices[begin:end]
+        deltas[neighbors] += (1-2*sample[neighbors])*this.symmetric.data[begin:end]*change
+
+    def sampleset(this, rows, num_occurrences=None):
+        """! Returns a binary sampleset of rows of rows() with the energies of this bqm"""
+        rows = np.asarray(rows)
+        return dimod.SampleSet.from_samples((rows.astype(np.int8), this.labels), dimod.BINARY,
+                this.matrixEnergies(np.ascontiguousarray(rows.T != 0)), num_occurrences=num_occurrences)
+
+def fingerprint(bqm):
+    """! Returns a cheap fingerprint of the bqm that changes when variables, interactions, biases or the offset change.
+    The biases are hashed from the numpy vectors of the bqm, which takes a few percent of the time of compiling it
+    """
+    vectors = bqm.to_numpy_vectors()
+    checksum = hash((tuple(bqm.variables), vectors.linear_biases.tobytes(), vectors.quadratic.row_indices.tobytes(),
+                     vectors.quadratic.col_indices.tobytes(), vectors.quadratic.biases.tobytes()))
+    return (len(bqm), bqm.num_interactions, float(bqm.offset), bqm.vartype, checksum)
+
+def compiled(owner, bqm, labels=None, refresh=False):
+    """! Returns the cached CompiledBQM of the bqm of owner, compiling it if the fingerprint of the bqm
+    or the order of the labels changed
+
+    @param owner Object the compiled bqm is cached on, usually a generator
+    @param labels Optional order of the variables, see CompiledBQM
+    @param refresh Compile even if the fingerprint didn't change
+    """
+    key = (fingerprint(bqm), None if labels is None else tuple(labels))
+    cache = getattr(owner, 'compiledCache', None)
+    if refresh or cache is None or cache[0] != key:
+        cache = (key, CompiledBQM(bqm, labels))
+        owner.compiledCache = cache
+    return cache[1]
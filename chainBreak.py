@@ -0,0 +1,235 @@
+"""! Structure aware resolution of broken chains of embedded samples.
+
+The majority vote of dwave.embedding decides every broken chain on its own. Samples of the plan variables often break
+chains of several variables of the same row or column of the permutation, and independent votes then leave two or no
+plan variables of the row set, so the sample no longer describes a plan. ChainBreakResolver decides the broken chains
+of a read together, for all reads at once:
+  1. Every chain starts from its vote fraction, the share of its qubits that are 1. Intact chains keep their value.
+  2. One-hot repair: The groups of plan variables of which exactly one is 1(the rows and columns of the onehot
+     encoding, see oneHotGroups() of the generators) are visited one after another. If an already decided variable of
+     the group is 1, its undecided broken chains become 0, otherwise one broken chain becomes 1 and the others 0.
+     The chosen chain is the one with the largest vote fraction among those whose other groups(the column of a row)
+     don't have a 1 yet, or among all broken chains of the group if every one of them conflicts. The chains of a
+     visited group count as decided for the later groups. Reads whose majority vote describes a plan keep it.
+  3. Greedy descent on the energy of the logical bqm: The broken chain outside of the groups whose flip lowers the
+     energy the most is flipped until no such flip lowers it, which resolves the chains of the number and boolean
+     variables from the interactions with their logical neighbors. The plan variables of the groups are left alone,
+     a flip that lowers the energy of badly resolved auxiliary variables would break the permutation.
+
+Example:
+    resolver = ChainBreakResolver(generator.bqm, generator.oneHotGroups())
+    sampleset = EmbeddingComposite(DWaveSampler()).sample(generator.bqm, chain_break_method=resolver)
+    python chainBreak.py -s 0,1,2-2,1,0 -nr 200 -cs 0.5
+"""
+import numpy as np
+
+import dimod
+import bqmKernels
+
+#Energy changes of flips that are at least this close to 0 don't count as improvement
+TOLERANCE = 1e-9
+
+class ChainBreakResolver:
+    """! Chain break method for unembed_sampleset(), EmbeddingComposite and FixedEmbeddingComposite"""
+
+    def __init__(this, bqm, groups=None, descent=True):
+        """! Prepares the resolution for the logical bqm
+
+        @param bqm The logical bqm that was embedded. The chains of a call have to be in the order of its variables
+        @param groups Lists of variables of which exactly one is 1 in every valid sample. Variables the bqm doesn't
+               have are ignored
+        @param descent Whether the broken chains are also decided by greedy descent on the energy
+        """
+        #unembed_sampleset() records the name of the chain break method in the embedding context
+        this.__name__ = 'structureAware'
+        this.variables = list(bqm.variables)
+        this.vartype = bqm.vartype
+        this.compiled = bqmKernels.CompiledBQM(bqm, this.variables)
+        this.groups = []
+        for group in groups or []:
+            indices = [this.compiled.index[var] for var in dict.fromkeys(group) if var in this.compiled.index]
+            if len(indices) > 0:
+                this.groups.append(np.array(indices, dtype=np.int64))
+        #Indices of the groups of every variable
+        this.memberships = [[] for var in this.variables]
+        for g, group in enumerate(this.groups):
+            for index in group:
+                this.memberships[index].append(g)
+        this.grouped = np.array([len(groupIds) > 0 for groupIds in this.memberships], dtype=bool)
+        this.descent = descent
+        #Statistics of the last call
+        this.stats = {}
+
+    def __call__(this, samples, chains):
+        """! Returns the logical samples and the indices of the reads they came from, like the chain break methods
+        of dwave.embedding.chain_breaks
+
+        @param samples The embedded samples, BINARY or SPIN
+        @param chains One chain(iterable of qubits) per variable of the bqm
+        """
+        samples, labels = dimod.as_samples(samples)
+        chains = [list(chain) for chain in chains]
+        if len(chains) != len(this.variables):
+            raise ValueError('Expected '+str(len(this.variables))+' chains, got '+str(len(chains)))
+        if labels != range(len(labels)):
+            relabel = {v:idx for idx, v in enumerate(labels)}
+            chains = [[relabel[v] for v in chain] for chain in chains]
+
+        fractions = voteFractions(samples > 0, chains)
+        broken = (fractions > 0) & (fractions < 1)
+        values = fractions >= 0.5
+        this.stats = {'brokenChains':int(broken.sum()), 'brokenReads':int(broken.any(axis=1).sum()), 'flips':0}
+        if this.stats['brokenChains'] > 0:
+            values = this.repair(values, fractions, broken)
+            if this.descent:
+                values = this.descend(values, broken)
+
+        if this.vartype is dimod.SPIN:
+            return 2*values.astype(np.int8)-1, np.arange(len(samples))
+        return values.astype(np.int8), np.arange(len(samples))
+
+    def repair(this, values, fractions, broken):
+        """! Decides the broken chains of the one-hot groups, see step 2 of the module documentation
+
+        @param values Boolean matrix with one row per read and one column per variable, changed in place
+        """
+        undecided = broken.copy()
+        reads = np.arange(len(values))
+        #Number of decided variables of every group(columns) that are 1 in every read(rows)
+        ones = np.zeros((len(values), len(this.groups)), dtype=np.int64)
+        for g, group in enumerate(this.groups):
+            ones[:, g] = (values[:, group] & ~broken[:, group]).sum(axis=1)
+
+        for g, group in enumerate(this.groups):
+            free = undecided[:, group]
+            if not free.any():
+                continue
+            conflicts = np.zeros(free.shape, dtype=bool)
+            for k, index in enumerate(group):
+                others = [other for other in this.memberships[index] if other != g]
+                if len(others) > 0:
+                    conflicts[:, k] = (ones[:, others] > 0).any(axis=1)
+            best = np.where(free, fractions[:, group]-conflicts, -2.0).argmax(axis=1)
+            chosen = np.zeros_like(free)
+            chosen[reads, best] = ones[:, g] == 0
+            chosen &= free
+            block = values[:, group]
+            block[free] = chosen[free]
+            values[:, group] = block
+            undecided[:, group] = False
+            for k, index in enumerate(group):
+                ones[:, this.memberships[index]] += chosen[:, k:k+1]
+        return values
+
+    def descend(this, values, broken):
+        """! Flips broken chains outside of the groups while that lowers the energy of the bqm, see step 3 of the
+        module documentation. All reads with such a chain take one flip per iteration"""
+        flippable = broken & ~this.grouped
+        active = np.nonzero(flippable.any(axis=1))[0]
+        matrix = values[active].astype(np.float64)
+        flippable = flippable[active]
+        symmetric = this.compiled.symmetric
+        fields = np.asarray(symmetric @ matrix.T).T + this.compiled.linear
+        rows = np.arange(len(active))
+        flips = 0
+        while len(rows) > 0:
+            deltas = np.where(flippable[rows], (1-2*matrix[rows])*fields[rows], 0.0)
+            best = deltas.argmin(axis=1)
+            improving = deltas[np.arange(len(rows)), best] < -TOLERANCE
+            rows, best = rows[improving], best[improving]
+            if len(rows) == 0:
+                break
+            change = 1-2*matrix[rows, best]
+            matrix[rows, best] += change
+            fields[rows] += symmetric[best].multiply(change[:, None]).toarray()
+            flips += len(rows)
+        values[active] = matrix != 0
+        this.stats['flips'] = flips
+        return values
+
+def voteFractions(values, chains):
+    """! Returns the share of the qubits of every chain(columns) that are 1 in every read(rows)
+
+    @param values Boolean matrix with one row per read and one column per qubit
+    @param chains Lists of column indices
+    """
+    lengths = np.array([len(chain) for chain in chains], dtype=np.int64)
+    if len(chains) == 0:
+        return np.zeros((len(values), 0))
+    starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    qubits = np.concatenate([np.asarray(chain, dtype=np.int64) for chain in chains])
+    return np.add.reduceat(values[:, qubits].astype(np.int32), starts, axis=1)/lengths
+
+def resolver(generator, bqm=None, descent=True):
+    """! Returns the ChainBreakResolver of the bqm of a generator with the one-hot groups of its plan variables
+
+    @param bqm The bqm that is embedded, e.g. the bqm of rangeCompiler. The bqm of the generator if omitted
+    """
+    return ChainBreakResolver(generator.bqm if bqm is None else bqm, generator.oneHotGroups(), descent)
+
+def validFraction(generator, sampleset):
+    """! Returns the share of the reads of the sampleset that describe a valid plan of the generator"""
+    decode = generator.decodeRemovalOrder if hasattr(generator, 'decodeRemovalOrder') else generator.decodeOpeningOrder
+    valid = 0
+    for sample, occurrences in zip(sampleset.samples(sorted_by=None), sampleset.record.num_occurrences):
+        if decode(sample) is not None:
+            valid += occurrences
+    return valid/sampleset.record.num_occurrences.sum()
+
+def compare(generator, num_reads, backend='OFFLINE', prefactor=1.414, seed=None, **args):
+    """! Samples the embedded bqm of a generator once and unembeds the reads with the majority vote and with
+    the structure aware resolution
+
+    @param backend Structured backend, see backends
+    @param prefactor Prefactor of the uniform torque compensation chain strength. Smaller values break more chains
+    @param **args Further keyword arguments of the sampler
+    @returns Dict with the share of valid reads of both methods and the statistics of the resolver
+    """
+    from dwave.embedding import embed_bqm, unembed_sampleset
+    from dwave.embedding.chain_breaks import majority_vote
+    from dwave.embedding.chain_strength import uniform_torque_compensation
+    import backends
+    from batchSolve import embedBatch
+
+    bqm = generator.bqm
+    child = backends.getSampler(backend, embed=False)
+    chains, embedded = embedBatch([bqm], child.edgelist, seed=seed)
+    if embedded == 0:
+        raise ValueError('No embedding found')
+    embedding = {var:chain for (_, var), chain in chains.items()}
+    target = embed_bqm(bqm, embedding, child.adjacency, chain_strength=uniform_torque_compensation(bqm, embedding, prefactor))
+    targetSampleset = child.sample(target, num_reads=num_reads, **args)
+
+    structured = resolver(generator)
+    res = {}
+    for name, method in (('majorityVote', majority_vote), ('structureAware', structured)):
+        res[name] = validFraction(generator, unembed_sampleset(targetSampleset, embedding, bqm, chain_break_method=method))
+    res.update(structured.stats)
+    return res
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+    from stacking import parseSequences, StackingQUBOGenerator
+    from stackingPallet import PalletQUBOGenerator
+
+    parser = argparse.ArgumentParser(description='Compare the share of valid reads of the majority vote and of the structure aware chain break resolution')
+    parser.add_argument('-s', type=str, action='store', dest='seqs',
+            metavar='Sequences. Entries are separated by commas. Sequences are separated by -.Labels are numbers', required = True)
+    parser.add_argument('-model', type=str, action='store', dest='model', choices=['pallet', 'bin'], default='pallet')
+    parser.add_argument('-nr', type=int, action='store', dest='num_reads', metavar='Number of samples to generate.', default=100)
+    parser.add_argument('-db', type=int, action='store', dest='dec_bound', metavar='Boundary for decision problem(bin model)', default=1)
+    parser.add_argument('-cs', type=float, action='store', dest='prefactor', default=1.414, help='Prefactor of the chain strength')
+    parser.add_argument('-m', type=str, action='store', dest='method', default='OFFLINE', help='Structured backend to use, see backends')
+
+    args = parser.parse_args(sys.argv[1:])
+    sequences = parseSequences(args.seqs)
+    if args.model == 'pallet':
+        generator = PalletQUBOGenerator(sequences)
+    else:
+        generator = StackingQUBOGenerator(sequences, args.dec_bound)
+        generator.generateBQM()
+    res = compare(generator, args.num_reads, args.method, args.prefactor)
+    print('Valid reads with majority vote:', res['majorityVote'])
+    print('Valid reads with structure aware resolution:', res['structureAware'])
+    print('Broken chains:', res['brokenChains'], 'in', res['brokenReads'], 'reads,', res['flips'], 'flips of the descent')
@@ -1,7 +1,9 @@
 """! This Script collects statistics about which constraints are being violated how much in a given sampleset"""
 from stacking import StackingQUBOGenerator
+import dimod
 import numpy as np
 import qaUtils
+import symmetry
 
 def addMissingVariables(bqm, sampleset):
     """! Adds variables that are present in the sampleset but not the bqm to the bqm o facilitate the calculation of energy with
@@ -15,14 +17,10 @@ def addMissingVariables(bqm, sampleset):
         if var not in bqm.variables:
             bqm.add_variable(var, 0)
 
-def countGreaterZero(energies, occs):
-    acc = 0
-
-    for i,energy in enumerate(energies):
-        if energy > 0:
-            acc += occs[i]
-    
-    return acc
+def countGreaterZero(energies, occs, tolerance=1e-9):
+    """! Sums up the occurrences of the samples with positive energy. Energies up to tolerance count as 0,
+    because the compiled energies are summed up in a different order than the ones of dimod"""
+    return int(np.sum(np.asarray(occs)[np.asarray(energies) > tolerance]))
     
 
 def completePartialBQM(sampleset, generator):
@@ -30,8 +28,10 @@ def completePartialBQM(sampleset, generator):
     generator.generateLinears()
     generator.fixPlanVariables()
 
-    for var in generator.toFix:
-        generator.bqm.fix_variable(generator.variableName(var[0], var[1]),0)
+    for var, value in generator.toFix.items():
+        generator.bqm.fix_variable(generator.planVariableName(var[0], var[1]),value)
+    if generator.symmetry:
+        symmetry.contractBins(generator)
 
     addMissingVariables(generator.bqm, sampleset)
 
@@ -47,6 +47,21 @@ def countOverlaps(inList, occs):
 
     return res
 
+def partialGenerator(sampleset, dec_bound, orderings=False):
+    """! Returns a generator without constraints for the instance and the options the sampleset was generated with.
+    The plan variables are fixed like in the sampled bqm, including the fixings and contractions of broken symmetries
+
+    @param orderings Whether to add the ordering penalties of identical sequences, which belong to SEQUENCE_ORDER"""
+    info = sampleset.info
+    generator = StackingQUBOGenerator(info['sequences'], dec_bound, encoding=info.get('encoding', 'onehot'),
+            symmetry=info.get('symmetry', False), tightSlack=info.get('tightSlack', False))
+    generator.fixPlanVariables()
+    if generator.symmetry:
+        symmetry.breakBinSymmetries(generator)
+        if not orderings:
+            generator.bqm = dimod.BinaryQuadraticModel(dimod.Vartype.BINARY)
+    return generator
+
 def calcConstraintStats(sampleset, dec_bound=1):
     """! Berechnet, wie oft die einzelnen Constraint des FIFO-Stack up Problems im angegebenen Sampleset verletzt werden.
     
@@ -54,30 +69,33 @@ def calcConstraintStats(sampleset, dec_bound=1):
 
     @returns dict{String:List} Dictionary mit den einzelnen Constraints als Keys und Statistiken über diese Constraints"""
     res = {}
-    sequences = sampleset.info['sequences']
     
-    permutGen = StackingQUBOGenerator(sequences, dec_bound)
+    permutGen = partialGenerator(sampleset, dec_bound)
     permutGen.permutationConstraint()
     completePartialBQM(sampleset, permutGen) 
 
-    orderGen = StackingQUBOGenerator(sequences, dec_bound)
+    orderGen = partialGenerator(sampleset, dec_bound, orderings=True)
     orderGen.sequenceOrder()
     completePartialBQM(sampleset, orderGen)
     
-    ftcGen = StackingQUBOGenerator(sequences, dec_bound)
-    ftcGen.fixPlanVariables()
+    ftcGen = partialGenerator(sampleset, dec_bound)
     ftcGen.ftcConstraint()
     completePartialBQM(sampleset, ftcGen)
 
-    countGen = StackingQUBOGenerator(sequences, dec_bound)
+    #With tight slacks only the modeled f(t,c) are counted, so they are modeled and then dropped from the bqm
+    countGen = partialGenerator(sampleset, dec_bound)
+    if countGen.tightSlack:
+        countGen.ftcConstraint()
+        countGen.bqm = dimod.BinaryQuadraticModel(dimod.Vartype.BINARY)
     countGen.countStackingPlacesConstraint()
     completePartialBQM(sampleset, countGen)
     
     occs = sampleset.record['num_occurrences']
-    permEnergies = permutGen.bqm.energies(sampleset)
-    seqEnergies = orderGen.bqm.energies(sampleset)
-    ftcEnergies = ftcGen.bqm.energies(sampleset)
-    countEnergies = countGen.bqm.energies(sampleset)
+    #The partial bqms share the column order of the sampleset, so the sample matrix is built once
+    variables = list(sampleset.variables)
+    compiled = [gen.compiledBQM(variables) for gen in [permutGen, orderGen, ftcGen, countGen]]
+    matrix = compiled[0].matrix(sampleset)
+    permEnergies, seqEnergies, ftcEnergies, countEnergies = [part.matrixEnergies(matrix) for part in compiled]
 
     res['Permutation'] = countGreaterZero(permEnergies,occs)
     res['SequenceOrder'] =  countGreaterZero(seqEnergies,occs)
@@ -1,7 +1,9 @@
 """! This Script collects statistics about which constraints are being violated how much in a given sampleset"""
 from stackingPallet import PalletQUBOGenerator
+import dimod
 import numpy as np
 import qaUtils
+import symmetry
 
 def addMissingVariables(bqm, sampleset):
     """! Adds variables that are present in the sampleset but not the bqm to the bqm o facilitate the calculation of energy with
@@ -15,20 +17,34 @@ def addMissingVariables(bqm, sampleset):
         if var not in bqm.variables:
             bqm.add_variable(var, 0)
 
-def countGreaterZero(energies, occs):
-    acc = 0
-
-    for i,energy in enumerate(energies):
-        if energy > 0:
-            acc += occs[i]
-    
-    return acc
+def countGreaterZero(energies, occs, tolerance=1e-9):
+    """! Sums up the occurrences of the samples with positive energy. Energies up to tolerance count as 0,
+    because the compiled energies are summed up in a different order than the ones of dimod"""
+    return int(np.sum(np.asarray(occs)[np.asarray(energies) > tolerance]))
     
 
 def completePartialBQM(sampleset, generator):
     """!   Completes BQM not using all conditions for testing"""
+    for name, value in generator.fixed.items():
+        if name in generator.bqm.variables:
+            generator.bqm.fix_variable(name, value)
     addMissingVariables(generator.bqm, sampleset)
 
+def partialGenerator(sampleset, orderings=False):
+    """! Returns a generator without constraints for the instance and the options the sampleset was generated with.
+    If the symmetries were broken, the generator knows the fixed plan variables(see symmetry.breakPalletSymmetries())
+
+    @param orderings Whether to add the ordering penalties of the twin labels, which belong to the permutation constraint"""
+    info = sampleset.info
+    generator = PalletQUBOGenerator(info['sequences'], autoGenerate = False, encoding = info.get('encoding', 'onehot'),
+            symmetry = info.get('symmetry', False), tightSlack = info.get('tightSlack', False))
+    if generator.symmetry:
+        generator.constructSequenceGraph()
+        symmetry.breakPalletSymmetries(generator)
+        if not orderings:
+            generator.bqm = dimod.BinaryQuadraticModel(vartype='BINARY')
+    return generator
+
 def calcConstraintStats(sampleset):
     """! Calculates the number of violations of each contstraint in a sampletset 
     
@@ -36,25 +52,28 @@ def calcConstraintStats(sampleset):
 
     @returns dict{String:List} Dictionary of constraint names and number of violations"""
     res = {}
-    sequences = sampleset.info['sequences']
     
-    permutGen = PalletQUBOGenerator(sequences, autoGenerate = False)
+    permutGen = partialGenerator(sampleset, orderings = True)
     permutGen.permutationConstraint()
     completePartialBQM(sampleset, permutGen) 
 
-    yjcGen = PalletQUBOGenerator(sequences, autoGenerate = False)
+    yjcGen = partialGenerator(sampleset)
     yjcGen.constructSequenceGraph()
     yjcGen.yjc()
     completePartialBQM(sampleset, yjcGen)
 
-    countGen = PalletQUBOGenerator(sequences, autoGenerate = False)
+    countGen = partialGenerator(sampleset)
     countGen.inequalityConstraints()
     completePartialBQM(sampleset, countGen)
     
     occs = sampleset.record['num_occurrences']
-    res['Permutation'] = countGreaterZero(permutGen.bqm.energies(sampleset),occs)
-    res['Y(j,c)'] =  countGreaterZero(yjcGen.bqm.energies(sampleset),occs)
-    res['Count'] =  countGreaterZero(countGen.bqm.energies(sampleset),occs)
+    #The partial bqms share the column order of the sampleset, so the sample matrix is built once
+    variables = list(sampleset.variables)
+    compiled = [gen.compiledBQM(variables) for gen in [permutGen, yjcGen, countGen]]
+    matrix = compiled[0].matrix(sampleset)
+    res['Permutation'] = countGreaterZero(compiled[0].matrixEnergies(matrix),occs)
+    res['Y(j,c)'] =  countGreaterZero(compiled[1].matrixEnergies(matrix),occs)
+    res['Count'] =  countGreaterZero(compiled[2].matrixEnergies(matrix),occs)
     
     return res
 
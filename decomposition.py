@@ -0,0 +1,263 @@
+"""! Splits an instance into blocks of labels that can be solved separately.
+
+The blocks are the strongly connected components of the precedence graph of the labels(a precedes b if a bin of a
+comes before a bin of b in some sequence, see lowerBounds.predecessors()), in topological order. Labels that never
+share a sequence end up in different blocks, and so do labels of a sequence that are only ever removed one after
+another. The bins of a block are contiguous in every sequence, so every sequence splits into segments of one block each.
+
+Solving the blocks one after another in topological order is a valid plan for both models:
+  - Bin model: While the bins of a block are removed, every label of an earlier block is closed and no label of a later
+    block is open, so the plan needs the maximum of the stacking places of the blocks. No plan needs fewer, because
+    the bins of a single block removed in the order of any plan open at most the labels the plan opens.
+  - Pallet model: A predecessor of a label is in the same block or an earlier one. While the pallets of a block are
+    opened, the pallets of earlier blocks have all their predecessors opened, so w is the maximum of w of the blocks.
+    Again no opening order is better, because the labels of a block in that order already count for the block alone.
+A block with n labels has about n**2 plan variables in the pallet model and (bins of the block)**2 in the bin model,
+so splitting a large instance reduces the size of the bqms superlinearly. The blocks are solved in parallel
+worker processes and every block keeps the better of its best valid sample and the plan of the heuristics.
+Only exact splits are made: Weakly coupled blocks, which would need a coordination of their plans, stay together.
+
+Example:
+    python decomposition.py -s 1,2,1-2,1,2-3,4,3-5,6 -M pallet -nr 100 -w 4
+"""
+import heapq
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import backends
+import heuristics
+import lowerBounds
+
+#Models that can be decomposed, the bin model of StackingQUBOGenerator and the pallet model of PalletQUBOGenerator
+MODELS = ['bin', 'pallet']
+
+def components(sequences):
+    """! Returns the strongly connected components of the precedence graph of the labels in topological order
+
+    @param sequences The sequences of the problem instance
+    @returns List of sorted label lists. A predecessor of a label is in the same list or an earlier one. Among the
+             components whose predecessors are all listed, the one with the smallest label comes first
+    """
+    successors = {label:set() for label in heuristics.binLabels(sequences)}
+    for label, preds in lowerBounds.predecessors(sequences).items():
+        for pred in preds:
+            successors[pred].add(label)
+
+    #Iterative version of Tarjan's algorithm
+    index = {}
+    lowlink = {}
+    stack = []
+    onStack = set()
+    found = []
+    for root in sorted(successors):
+        if root in index:
+            continue
+        work = [(root, iter(sorted(successors[root])))]
+        index[root] = lowlink[root] = len(index)
+        stack.append(root)
+        onStack.add(root)
+        while work:
+            label, children = work[-1]
+            child = next(children, None)
+            if child is None:
+                work.pop()
+                if work:
+                    lowlink[work[-1][0]] = min(lowlink[work[-1][0]], lowlink[label])
+                if lowlink[label] == index[label]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        onStack.discard(member)
+                        component.append(member)
+                        if member == label:
+                            break
+                    found.append(sorted(component))
+            elif child not in index:
+                index[child] = lowlink[child] = len(index)
+                stack.append(child)
+                onStack.add(child)
+                work.append((child, iter(sorted(successors[child]))))
+            elif child in onStack:
+                lowlink[label] = min(lowlink[label], index[child])
+
+    #Topological order of the condensation
+    member = {label:j for j, component in enumerate(found) for label in component}
+    edges = [set() for _ in found]
+    inDegree = [0]*len(found)
+    for label, children in successors.items():
+        for child in children:
+            if member[child] != member[label] and member[child] not in edges[member[label]]:
+                edges[member[label]].add(member[child])
+                inDegree[member[child]] += 1
+    ready = [(component[0], j) for j, component in enumerate(found) if inDegree[j] == 0]
+    heapq.heapify(ready)
+    res = []
+    while ready:
+        _, j = heapq.heappop(ready)
+        res.append(found[j])
+        for child in edges[j]:
+            inDegree[child] -= 1
+            if inDegree[child] == 0:
+                heapq.heappush(ready, (found[child][0], child))
+    return res
+
+def subInstance(sequences, labels):
+    """! Returns the segments of the sequences that belong to the given block of labels
+
+    @param sequences The sequences of the problem instance
+    @param labels The labels of the block, see components()
+    @returns Dict with the sequences of the block with the labels renamed to 0..len(labels)-1(the pallet model
+             needs consecutive labels), 'labels' that maps the new labels to the original ones and 'bins' that maps the
+             bin indices of the block to the bin indices of the instance
+    """
+    rename = {label:j for j, label in enumerate(labels)}
+    blockSequences = []
+    bins = []
+    for sequence, indices in zip(sequences, heuristics.binIndices(sequences)):
+        segment = [(rename[label], elem) for label, elem in zip(sequence, indices) if label in rename]
+        if segment:
+            blockSequences.append([label for label, _ in segment])
+            bins.extend(elem for _, elem in segment)
+    return {'sequences':blockSequences, 'labels':list(labels), 'bins':bins}
+
+def decompose(sequences):
+    """! Returns the sub-instances of all blocks of the instance in topological order, see subInstance()"""
+    return [subInstance(sequences, labels) for labels in components(sequences)]
+
+def planVariables(sequences, model):
+    """! Returns the number of plan variables of the monolithic bqm of the instance
+
+    @param model One of MODELS
+    """
+    if model == 'bin':
+        return len(heuristics.binLabels(sequences))**2
+    return len(set(heuristics.binLabels(sequences)))**2
+
+def heuristicPlan(sequences, model):
+    """! Returns the objective and the plan of the fast heuristics, a removal order of the bins for the bin model
+    and an opening order of the labels for the pallet model"""
+    if model == 'bin':
+        return heuristics.upperBound(sequences)
+    return heuristics.palletUpperBound(sequences)
+
+def samplePlan(sequences, model, num_reads, backend='SA', seed=None, **params):
+    """! Samples the bqm of the model and returns the objective, the best valid plan and the number of variables.
+    The objective and the plan are None if no sample is valid.
+
+    @param **params Additional keyword arguments are passed to the generator, like dec_bound or tightSlack
+    """
+    if model == 'bin':
+        from stacking import StackingQUBOGenerator
+        generator = StackingQUBOGenerator(sequences, **params)
+        generator.generateBQM()
+        decode = generator.decodeRemovalOrder
+        objective = heuristics.stackingPlaces
+    else:
+        from stackingPallet import PalletQUBOGenerator
+        generator = PalletQUBOGenerator(sequences, **params)
+        decode = generator.decodeOpeningOrder
+        objective = heuristics.palletObjective
+
+    args = {} if seed is None else {'seed':seed}
+    sampleset = backends.getSampler(backend).sample(generator.bqm, num_reads=num_reads, **args)
+    best = (None, None)
+    for sample in sampleset.samples():
+        plan = decode(sample)
+        if plan is None:
+            continue
+        value = objective(sequences, plan)
+        if best[0] is None or value < best[0]:
+            best = (value, plan)
+    return best[0], best[1], len(generator.bqm)
+
+def solveBlock(block, model, num_reads, backend='SA', seed=None, params=None):
+    """! Solves the sub-instance of one block. Blocks where the heuristics meet the lower bound aren't sampled.
+
+    @param block The sub-instance, see subInstance()
+    @param model One of MODELS
+    @param params Dict of keyword arguments for the generator
+    @returns Dict with the objective, the plan in the bins or labels of the instance, the number of variables of the
+             sampled bqm(0 if it wasn't sampled), the source of the plan('heuristic' or 'sample') and the time in seconds
+    """
+    start = time.time()
+    sequences = block['sequences']
+    objective, plan = heuristicPlan(sequences, model)
+    if model == 'bin':
+        bound = lowerBounds.binLowerBound(sequences)
+    else:
+        bound = lowerBounds.palletLowerBound(sequences)
+
+    res = {'objective':objective, 'source':'heuristic', 'variables':0}
+    if objective > bound:
+        value, sampled, res['variables'] = samplePlan(sequences, model, num_reads, backend, seed, **(params or {}))
+        if value is not None and value < objective:
+            objective, plan = value, sampled
+            res.update({'objective':value, 'source':'sample'})
+
+    names = block['bins'] if model == 'bin' else block['labels']
+    res['plan'] = [names[elem] for elem in plan]
+    res['labels'] = block['labels']
+    res['time'] = time.time()-start
+    return res
+
+def solveDecomposed(sequences, model, num_reads, workers=1, backend='SA', seed=None, **params):
+    """! Solves the blocks of the instance separately and concatenates their plans in topological order
+
+    @param sequences The sequences of the problem instance
+    @param model One of MODELS
+    @param num_reads Number of reads of every sampled block
+    @param workers Number of worker processes that solve blocks. 1 solves them in this process
+    @param backend Name of an unstructured backend, see backends
+    @param seed Optional seed, block j is sampled with seed+j
+    @param **params Additional keyword arguments are passed to the generators of the blocks
+    @returns Dict with the combined 'plan'(removal order of the bins or opening order of the labels), its 'objective',
+             the results of the 'blocks'(see solveBlock()), the 'planVariables' of the monolithic bqm and of the
+             largest block and the 'time' in seconds
+    """
+    if model not in MODELS:
+        raise ValueError('Unknown model '+str(model))
+    start = time.time()
+    blocks = decompose(sequences)
+    seeds = [None if seed is None else seed+j for j in range(0, len(blocks))]
+    count = len(blocks)
+    if workers <= 1 or count <= 1:
+        results = list(map(solveBlock, blocks, [model]*count, [num_reads]*count, [backend]*count, seeds, [params]*count))
+    else:
+        with ProcessPoolExecutor(min(workers, count)) as pool:
+            results = list(pool.map(solveBlock, blocks, [model]*count, [num_reads]*count, [backend]*count, seeds, [params]*count))
+
+    plan = [elem for result in results for elem in result['plan']]
+    objective = heuristics.stackingPlaces(sequences, plan) if model == 'bin' else heuristics.palletObjective(sequences, plan)
+    return {'plan':plan, 'objective':objective, 'blocks':results,
+            'planVariables':{'monolithic':planVariables(sequences, model),
+                             'largestBlock':max((planVariables(block['sequences'], model) for block in blocks), default=0)},
+            'time':time.time()-start}
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+    from stacking import parseSequences
+
+    parser = argparse.ArgumentParser(description='Solve the blocks of an instance separately')
+    parser.add_argument('-s', type=str, action='store', dest='seqs',
+            metavar='Sequences. Entries are separated by commas. Sequences are separated by -.Labels are numbers', required = True)
+    parser.add_argument('-M', type=str, action='store', dest='model', choices=MODELS, default='pallet', help='Model to solve')
+    parser.add_argument('-nr', type=int, action='store', dest='num_reads', default=100, help='Number of reads of every sampled block')
+    parser.add_argument('-w', type=int, action='store', dest='workers', default=1, help='Number of worker processes')
+    parser.add_argument('-m', type=str, action='store', dest='backend', choices=backends.names(), default='SA',
+            help='Unstructured backend. '+backends.helpText())
+    parser.add_argument('-db', type=int, action='store', dest='dec_bound', default=None, help='Boundary for decision problem of the bin model')
+    parser.add_argument('-ts', action='store_true', dest='tightSlack', help='Size the slacks from bounds on the counted labels')
+    parser.add_argument('--seed', type=int, action='store', dest='seed', default=None, help='Seed of the sampler')
+
+    args = parser.parse_args(sys.argv[1:])
+    params = {'tightSlack':args.tightSlack}
+    if args.model == 'bin' and args.dec_bound is not None:
+        params['dec_bound'] = args.dec_bound
+    res = solveDecomposed(parseSequences(args.seqs), args.model, args.num_reads, args.workers, args.backend, args.seed, **params)
+    for j, block in enumerate(res['blocks']):
+        print('Block', j, 'labels', block['labels'], 'objective', block['objective'], 'from', block['source'],
+              'variables', block['variables'])
+    print('Plan:', res['plan'])
+    print('Objective:', res['objective'], 'plan variables', res['planVariables']['monolithic'], '->',
+          res['planVariables']['largestBlock'], 'in the largest block, time', round(res['time'], 3))
@@ -5,12 +5,19 @@
 
 import plotResultsPal as plotting
 import stackingPallet
+import batchSolve
+import pipeline
+import resultCache
+import sys
 
 print("Running this script will run 10 instances using approx. 7.5 seconds of computation time(depending on parameters, num_reads etc")
 input("Press Enter to continue")
 
 additional_params = {} #Add additional parameters here
                        #e.g additional_params = {'anneal_schedule':somevalue}
+#Run with -cache to return the results of identical earlier solves(data/cache) instead of sampling again,
+#-force recomputes them. Only used when instances are solved one by one, batch and pipelined solves aren't cached
+cache = resultCache.ResultCache(force='-force' in sys.argv) if '-cache' in sys.argv else None
 instances = [
         [[0,1],[1,0]],
         [[0,1,1],[1,0,1]],
@@ -26,10 +33,17 @@ instances = [
 instanceIds = [1,2,3,4,5,6,7,8,9]#x-Axis labels and leftmost table column
 
 num_reads = 10000
+batch = False #Solve all instances with as few QPU submissions as possible, see batchSolve
+pipelined = False #Generate and embed the next instance while the current one is sampled, see pipeline
 resultSamplesets = []
 
-for instance in instances:
-    print("Solving instance", instance)
-    resultSamplesets.append(stackingPallet.solveDWave(instance, num_reads, **additional_params));
+if batch:
+    resultSamplesets = batchSolve.solveBatch(instances, num_reads, **additional_params)
+elif pipelined:
+    resultSamplesets = pipeline.solveAll(instances, num_reads, **additional_params)
+else:
+    for instance in instances:
+        print("Solving instance", instance)
+        resultSamplesets.append(stackingPallet.solveDWave(instance, num_reads, cache=cache, **additional_params));
 
 plotting.plotResults(resultSamplesets, instanceIds);
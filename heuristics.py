@@ -0,0 +1,184 @@
+"""! Fast classical helpers for the stacking problem.
+
+Bins are numbered the way StackingQUBOGenerator numbers them: the bins of the first sequence come first,
+followed by the bins of the second sequence and so on. A removal order is a list of bin indices.
+"""
+import itertools
+
+def binIndices(sequences):
+    """! Returns a list that contains the bin indices of every sequence
+
+    @param sequences The sequences of the problem instance
+    """
+    res = []
+    j = 0
+    for sequence in sequences:
+        res.append(list(range(j, j+len(sequence))))
+        j += len(sequence)
+    return res
+
+def binLabels(sequences):
+    """! Returns a list that maps every bin index to its label"""
+    return [label for sequence in sequences for label in sequence]
+
+def isValidOrder(sequences, order):
+    """! Checks whether the given removal order removes every bin exactly once and respects the sequences"""
+    binCount = sum(len(sequence) for sequence in sequences)
+    if order is None or sorted(order) != list(range(0, binCount)):
+        return False
+
+    position = {elem:time for time, elem in enumerate(order)}
+    for indices in binIndices(sequences):
+        for i in range(0, len(indices)-1):
+            if position[indices[i]] > position[indices[i+1]]:
+                return False
+    return True
+
+def stackingPlacesProfile(sequences, order):
+    """! Returns the number of labels that require a stacking place after each step of the removal order.
+    A label requires a stacking place after step c if at least one of its bins has been removed
+    at step c or earlier and at least one of its bins is removed later, like f(t,c) in StackingQUBOGenerator.
+
+    @param sequences The sequences of the problem instance
+    @param order The removal order
+    """
+    labels = binLabels(sequences)
+    remaining = {}
+    for label in labels:
+        remaining[label] = remaining.get(label, 0) + 1
+
+    total = dict(remaining)
+    openCount = 0
+    profile = []
+    for elem in order:
+        label = labels[elem]
+        if remaining[label] == total[label]:
+            openCount += 1
+        remaining[label] -= 1
+        if remaining[label] == 0:
+            openCount -= 1
+        profile.append(openCount)
+    return profile
+
+def stackingPlaces(sequences, order):
+    """! Returns the highest number of stacking places the removal order requires at the same time"""
+    return max(stackingPlacesProfile(sequences, order), default=0)
+
+def greedyRemovalOrder(sequences):
+    """! Builds a removal order by always removing the first bin of the sequence that results in the fewest open labels.
+    Ties are broken in favor of bins that close their label, then bins whose label is already open
+    and then the sequence with the most remaining bins.
+
+    @param sequences The sequences of the problem instance
+    @returns The removal order
+    """
+    labels = binLabels(sequences)
+    indices = binIndices(sequences)
+    remaining = {}
+    for label in labels:
+        remaining[label] = remaining.get(label, 0) + 1
+    total = dict(remaining)
+
+    heads = [0]*len(sequences)
+    openCount = 0
+    order = []
+    for _ in range(0, len(labels)):
+        best = None
+        for s, sequence in enumerate(indices):
+            if heads[s] >= len(sequence):
+                continue
+            label = labels[sequence[heads[s]]]
+            opens = remaining[label] == total[label]
+            closes = remaining[label] == 1
+            key = (openCount + opens - closes, not closes, opens, -(len(sequence)-heads[s]))
+            if best is None or key < best[0]:
+                best = (key, s)
+
+        s = best[1]
+        elem = indices[s][heads[s]]
+        label = labels[elem]
+        openCount += (remaining[label] == total[label]) - (remaining[label] == 1)
+        remaining[label] -= 1
+        heads[s] += 1
+        order.append(elem)
+    return order
+
+def serialRemovalOrders(sequences, limit=24):
+    """! Generates removal orders that empty the sequences one after another.
+
+    @param limit Maximum number of orders to generate
+    """
+    indices = binIndices(sequences)
+    for permutation in itertools.islice(itertools.permutations(range(0, len(sequences))), limit):
+        yield [elem for s in permutation for elem in indices[s]]
+
+def upperBound(sequences):
+    """! Returns the number of stacking places of the best removal order found by the fast heuristics
+    together with that order.
+    """
+    best = greedyRemovalOrder(sequences)
+    bestPlaces = stackingPlaces(sequences, best)
+    for order in serialRemovalOrders(sequences):
+        places = stackingPlaces(sequences, order)
+        if places < bestPlaces:
+            best = order
+            bestPlaces = places
+    return bestPlaces, best
+
+def trivialLowerBound(sequences):
+    """! Returns a lower bound on the number of stacking places:
+    As soon as the first bin of a label with multiple bins is removed, the label requires a stacking place.
+    """
+    counts = {}
+    for label in binLabels(sequences):
+        counts[label] = counts.get(label, 0) + 1
+    return 1 if any(count > 1 for count in counts.values()) else 0
+
+def openingOrder(sequences, order):
+    """! Returns the labels in the order the given removal order removes their first bin,
+    which is the order the pallets of the labels are opened in.
+    """
+    labels = binLabels(sequences)
+    res = []
+    for elem in order:
+        if labels[elem] not in res:
+            res.append(labels[elem])
+    return res
+
+def palletObjective(sequences, labelOrder):
+    """! Returns the value of w of PalletQUBOGenerator for the given opening order:
+    The highest number of opened pallets that still have a label which precedes them
+    in some sequence and whose pallet hasn't been opened yet.
+
+    @param sequences The sequences of the problem instance
+    @param labelOrder List of labels in the order their pallets are opened
+    """
+    predecessors = {label:set() for label in labelOrder}
+    for sequence in sequences:
+        earlierLabels = set()
+        for label in sequence:
+            predecessors[label].update(earlierLabels - {label})
+            earlierLabels.add(label)
+
+    position = {label:j for j, label in enumerate(labelOrder)}
+    best = 0
+    for c in range(0, len(labelOrder)-1):
+        count = 0
+        for label in labelOrder[:c+1]:
+            if any(position[pred] > c for pred in predecessors[label]):
+                count += 1
+        best = max(best, count)
+    return best
+
+def palletUpperBound(sequences):
+    """! Returns the value of w of the best opening order found by the fast heuristics together with that order.
+    The candidates are the opening orders of the heuristic removal orders.
+    """
+    candidates = [greedyRemovalOrder(sequences)] + list(serialRemovalOrders(sequences))
+    best = None
+    for order in candidates:
+        labelOrder = openingOrder(sequences, order)
+        value = palletObjective(sequences, labelOrder)
+        if best is None or value < best[0]:
+            best = (value, labelOrder)
+    return best
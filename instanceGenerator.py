@@ -0,0 +1,184 @@
+"""! Seeded generation of instances of the stacking problem and an on-disk corpus format.
+
+An instance is a dict with an id, the name of its family, the parameters and seed it was generated from
+and its sequences. Corpora are JSON lines files with one instance per line(gzip compressed if the path ends with .gz).
+They are written and read one instance at a time, so corpora with large instances never have to fit into memory.
+
+Every instance is determined by its family, parameters and seed. The same corpus can therefore be regenerated
+on any machine instead of copying it around.
+"""
+import gzip
+import itertools
+import json
+import math
+import os
+import random
+
+FAMILIES = ['twoSequences', 'general']
+
+def twoSequences(labelCount, labelSize, seed=None):
+    """! Returns two shuffled sequences that contain every label labelSize times in total.
+    This is the family the sweep scripts(simAnnealTest and simAnnealTestPallet) were written for.
+
+    @param labelCount Number of labels
+    @param labelSize Number of bins of every label
+    @param seed Seed of the shuffle. Not reproducible if omitted
+    """
+    rng = random.Random(seed)
+    seq1 = []
+    seq2 = []
+    for _ in range(0, math.floor(labelSize/2)):
+        seq1 += [i for i in range(0, labelCount)]
+        seq2 += [i for i in range(0, labelCount)]
+
+    if labelSize % 2 != 0:
+        seq1 += [i for i in range(0, labelCount)]
+
+    rng.shuffle(seq1)
+    rng.shuffle(seq2)
+    return [seq1, seq2]
+
+def labelCounts(labelCount, binCount, skew, rng):
+    """! Distributes binCount bins over the labels. Every label receives at least one bin,
+    the remaining bins follow a Zipf distribution with exponent skew(0 is uniform).
+    """
+    if binCount < labelCount:
+        raise ValueError('Every label needs at least one bin: '+str(binCount)+' bins for '+str(labelCount)+' labels')
+    weights = [1/(label+1)**skew for label in range(0, labelCount)]
+    counts = [1]*labelCount
+    for label in rng.choices(range(0, labelCount), weights, k=binCount-labelCount):
+        counts[label] += 1
+    return counts
+
+def generalSequences(numSequences, labelCount, binCount, skew=0.0, interleaving=1.0, seed=None):
+    """! Returns numSequences sequences with binCount bins in total.
+
+    The bins of every label are first grouped into one block per label, the blocks are put in random order and
+    the bins are dealt to the sequences one after another, so all sequences have about the same length.
+    Interleaving moves every bin away from its block: With 0 the bins of a label stay next to each other,
+    with 1 the order of the bins is uniformly random.
+
+    @param numSequences Number of sequences
+    @param labelCount Number of labels
+    @param binCount Total number of bins
+    @param skew Exponent of the Zipf distribution of the number of bins per label
+    @param interleaving Value in [0,1] that controls how much the bins of different labels are mixed
+    @param seed Seed of the instance. Not reproducible if omitted
+    """
+    rng = random.Random(seed)
+    counts = labelCounts(labelCount, binCount, skew, rng)
+    blocks = list(range(0, labelCount))
+    rng.shuffle(blocks)
+
+    keyed = []
+    for position, label in enumerate(blocks):
+        for _ in range(0, counts[label]):
+            keyed.append(((1-interleaving)*position + interleaving*rng.random()*labelCount, label))
+    keyed.sort(key=lambda entry: entry[0])
+
+    sequences = [[] for _ in range(0, numSequences)]
+    for j, (_, label) in enumerate(keyed):
+        sequences[j % numSequences].append(label)
+    return sequences
+
+def generateInstance(family, params, seed, instanceId=None):
+    """! Returns the instance of the family with the given parameters and seed
+
+    @param family One of FAMILIES
+    @param params dict of keyword arguments of the function of the family
+    @param seed Seed of the instance
+    @param instanceId Id of the instance. Derived from the family, parameters and seed if omitted
+    """
+    if family == 'twoSequences':
+        sequences = twoSequences(seed=seed, **params)
+    elif family == 'general':
+        sequences = generalSequences(seed=seed, **params)
+    else:
+        raise ValueError('Family must be one of '+str(FAMILIES)+', not '+str(family))
+
+    if instanceId is None:
+        instanceId = family+'-'+'-'.join(str(key)+str(params[key]) for key in sorted(params))+'-seed'+str(seed)
+    return {'id':instanceId, 'family':family, 'params':params, 'seed':seed, 'sequences':sequences}
+
+def generateFamily(family, grid, repeats=1, seed=0):
+    """! Generates the instances of every combination of the parameters in grid
+
+    @param family One of FAMILIES
+    @param grid dict that maps every parameter to the list of its values
+    @param repeats Number of instances per combination
+    @param seed Base seed. The instances get the seeds seed, seed+1, ... in the order they are generated
+    """
+    keys = sorted(grid)
+    counter = itertools.count(seed)
+    for values in itertools.product(*[grid[key] for key in keys]):
+        params = dict(zip(keys, values))
+        for _ in range(0, repeats):
+            yield generateInstance(family, params, next(counter))
+
+def openCorpus(path, mode):
+    """! Opens a corpus file in text mode, gzip compressed if the path ends with .gz"""
+    if path.endswith('.gz'):
+        return gzip.open(path, mode+'t', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+def writeCorpus(path, instances, append=False):
+    """! Writes the instances to a corpus file one at a time
+
+    @param instances Iterable of instances, for example generateFamily()
+    @param append Append to an existing corpus instead of overwriting it
+    @returns Number of written instances
+    """
+    directory = os.path.dirname(path)
+    if directory != '':
+        os.makedirs(directory, exist_ok=True)
+
+    count = 0
+    with openCorpus(path, 'a' if append else 'w') as corpus:
+        for instance in instances:
+            corpus.write(json.dumps(instance, separators=(',', ':'))+'\n')
+            count += 1
+    return count
+
+def readCorpus(path, condition=None):
+    """! Generates the instances of a corpus file one at a time
+
+    @param condition Optional function that receives an instance and returns whether to yield it
+    """
+    with openCorpus(path, 'r') as corpus:
+        for line in corpus:
+            if line.strip() == '':
+                continue
+            instance = json.loads(line)
+            if condition is None or condition(instance):
+                yield instance
+
+def readSequences(path, condition=None):
+    """! Generates only the sequences of the instances of a corpus file, ready to be passed to the generators"""
+    for instance in readCorpus(path, condition):
+        yield instance['sequences']
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description='Generate a corpus of instances of the stacking problem')
+    parser.add_argument('-o', type=str, action='store', dest='path', metavar='Path of the corpus. Compressed if it ends with .gz', required=True)
+    parser.add_argument('-f', type=str, action='store', dest='family', choices=FAMILIES, default='general', help='Family of the instances')
+    parser.add_argument('-k', type=int, action='store', dest='numSequences', nargs='+', default=[2], help='Numbers of sequences(general)')
+    parser.add_argument('-l', type=int, action='store', dest='labelCount', nargs='+', default=[4], help='Numbers of labels')
+    parser.add_argument('-n', type=int, action='store', dest='binCount', nargs='+', default=[16], help='Total numbers of bins(general)')
+    parser.add_argument('-ls', type=int, action='store', dest='labelSize', nargs='+', default=[2], help='Numbers of bins per label(twoSequences)')
+    parser.add_argument('-skew', type=float, action='store', dest='skew', nargs='+', default=[0.0], help='Zipf exponents of the label distribution(general)')
+    parser.add_argument('-il', type=float, action='store', dest='interleaving', nargs='+', default=[1.0], help='Interleaving of the labels(general)')
+    parser.add_argument('-r', type=int, action='store', dest='repeats', default=1, help='Number of instances per parameter combination')
+    parser.add_argument('-seed', type=int, action='store', dest='seed', default=0, help='Base seed of the corpus')
+    parser.add_argument('-a', action='store_true', dest='append', help='Append to an existing corpus')
+
+    args = parser.parse_args(sys.argv[1:])
+    if args.family == 'twoSequences':
+        grid = {'labelCount':args.labelCount, 'labelSize':args.labelSize}
+    else:
+        grid = {'numSequences':args.numSequences, 'labelCount':args.labelCount, 'binCount':args.binCount,
+                'skew':args.skew, 'interleaving':args.interleaving}
+    count = writeCorpus(args.path, generateFamily(args.family, grid, args.repeats, args.seed), args.append)
+    print('Wrote', count, 'instances to', args.path)
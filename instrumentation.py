@@ -0,0 +1,158 @@
+"""! Per-stage timing and size instrumentation of the generators and the solve functions.
+
+A Recorder collects one record per stage with its wall and CPU time, the number of variables and couplers
+the stage added to the bqm and, if enabled, the memory it allocated. The generators and solve functions accept
+a recorder and fall back to NULL_RECORDER, whose stages do nothing, so instrumentation costs nothing when disabled.
+
+Example:
+    recorder = Recorder()
+    generator = StackingQUBOGenerator(sequences, recorder=recorder)
+    generator.generateBQM()
+    recorder.writeJSONLines('data/instrumentation.jsonl', instance=sequences)
+"""
+import json
+import os
+import time
+import tracemalloc
+
+class Stage:
+    """! Context manager that measures one stage and appends its record to the recorder"""
+
+    def __init__(this, recorder, name, bqm, extra):
+        this.recorder = recorder
+        this.record = dict(extra, stage=name)
+        this.bqm = bqm
+
+    def __enter__(this):
+        if this.bqm is not None:
+            this.variables = len(this.bqm)
+            this.interactions = this.bqm.num_interactions
+        if this.recorder.memory:
+            this.memory = tracemalloc.get_traced_memory()[0]
+            this.childPeak = 0
+            tracemalloc.reset_peak()
+            this.recorder.active.append(this)
+        this.cpu = time.process_time()
+        this.wall = time.perf_counter()
+        return this.record
+
+    def __exit__(this, excType, excValue, traceback):
+        this.record['wall'] = time.perf_counter()-this.wall
+        this.record['cpu'] = time.process_time()-this.cpu
+        if this.bqm is not None:
+            this.record['variablesAdded'] = len(this.bqm)-this.variables
+            this.record['interactionsAdded'] = this.bqm.num_interactions-this.interactions
+            this.record['variables'] = len(this.bqm)
+            this.record['interactions'] = this.bqm.num_interactions
+        if this.recorder.memory:
+            current, peak = tracemalloc.get_traced_memory()
+            #Nested stages reset the peak, so their peaks are passed on to the enclosing stage
+            peak = max(peak, this.childPeak)
+            this.record['memoryDelta'] = current-this.memory
+            this.record['memoryPeak'] = peak-this.memory
+            this.recorder.active.pop()
+            if len(this.recorder.active) > 0:
+                parent = this.recorder.active[-1]
+                parent.childPeak = max(parent.childPeak, peak)
+        if excType is not None:
+            this.record['error'] = excType.__name__
+        this.recorder.records.append(this.record)
+        return False
+
+class Recorder:
+    """! Collects the records of all stages in the order they finish"""
+
+    def __init__(this, memory=False):
+        """! Constructs an empty recorder
+
+        @param memory Whether to record memory deltas. Starts tracemalloc, which slows down allocations noticeably
+        """
+        this.records = []
+        this.memory = memory
+        this.active = [] #Stages that are currently measured, innermost last
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def __bool__(this):
+        return True
+
+    def stage(this, name, bqm=None, **extra):
+        """! Returns a context manager that records the stage with the given name.
+        The record is returned by the with statement and can be extended inside it.
+
+        @param bqm The bqm the stage modifies. Its size before and after the stage is recorded
+        @param **extra Additional values to store in the record
+        """
+        return Stage(this, name, bqm, extra)
+
+    def add(this, name, **values):
+        """! Records values that weren't measured by a stage, for example the timing reported by a QPU"""
+        this.records.append(dict(values, stage=name))
+
+    def total(this, key='wall', prefix=''):
+        """! Returns the sum of the given value over all records whose stage starts with prefix"""
+        return sum(record.get(key, 0) for record in this.records if record['stage'].startswith(prefix))
+
+    def summary(this):
+        """! Prints one line per record"""
+        for record in this.records:
+            values = ', '.join(key+'='+formatValue(value) for key, value in record.items() if key != 'stage')
+            print('{:<40} {}'.format(record['stage'], values))
+
+    def writeJSONLines(this, path, **context):
+        """! Appends one JSON object per record to path
+
+        @param **context Values that are added to every line, for example the instance or the run id
+        """
+        directory = os.path.dirname(path)
+        if directory != '':
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'a') as out:
+            for record in this.records:
+                out.write(json.dumps(dict(context, **record), default=str)+'\n')
+
+class NullStage:
+    """! Context manager of disabled instrumentation"""
+
+    def __enter__(this):
+        return {}
+
+    def __exit__(this, excType, excValue, traceback):
+        return False
+
+class NullRecorder:
+    """! Recorder that records nothing"""
+    records = []
+    memory = False
+
+    def __init__(this):
+        this.nullStage = NullStage()
+
+    def __bool__(this):
+        return False
+
+    def stage(this, name, bqm=None, **extra):
+        return this.nullStage
+
+    def add(this, name, **values):
+        pass
+
+NULL_RECORDER = NullRecorder()
+
+def recorderOrNull(recorder):
+    """! Returns the given recorder or NULL_RECORDER if it is None"""
+    return NULL_RECORDER if recorder is None else recorder
+
+def formatValue(value):
+    """! Formats a value of a record for the summary"""
+    if isinstance(value, float):
+        return '{:.6f}'.format(value)
+    return str(value)
+
+def recordSamplesetTiming(recorder, sampleset):
+    """! Records the QPU timing and the embedding timing stored in the info of a sampleset, if present"""
+    if 'timing' in sampleset.info:
+        recorder.add('qpu', **sampleset.info['timing'])
+    embeddingTiming = sampleset.info.get('embedding_context', {}).get('timing')
+    if embeddingTiming is not None:
+        recorder.add('embedding', **embeddingTiming)
@@ -0,0 +1,248 @@
+"""! Lower bounds on the minimum number of stacking places.
+
+Both models charge a label for the time between the removal of its first and its last bin. The bounds are built from
+the precedence relation of the labels: a precedes b if a bin of a comes before a bin of b in some sequence.
+  - Bin model: If a precedes b and b precedes a, and both have at least two bins, their intervals
+    [first removal, last removal) intersect in every plan. Intervals that intersect pairwise have a common point, so
+    every clique of such labels is open at the same time and the largest clique is a lower bound(overlapBound()).
+  - Pallet model: The last label of such a clique to be opened is a predecessor of all the others, so w is at least
+    the size of the clique minus 1. If the precedence relation has a cycle, some label is opened before one of its
+    predecessors and w is at least 1(palletCliqueBound()).
+Small instances are solved exactly instead: The open labels of the bin model only depend on how many bins of every
+sequence have been removed and the value of w only depends on the set of opened labels, so the optimum is the best
+bottleneck path through these states(binStateBound() and palletSubsetBound()).
+
+A solve can stop once a valid sample meets the bound, see sampleUntilBound(). Decision bounds below
+binLowerBound() are infeasible and don't need to be sampled.
+
+Example:
+    python lowerBounds.py -s 1,2,3,1-3,2,1,2
+"""
+import itertools
+
+import numpy as np
+
+import heuristics
+import parallelSA
+
+#Largest number of states of the bin model that binStateBound() explores
+STATE_LIMIT = 100000
+
+#Largest number of labels palletSubsetBound() enumerates the subsets of
+SUBSET_LABEL_LIMIT = 20
+
+def predecessors(sequences):
+    """! Returns a dict that maps every label to the set of labels that precede one of its bins in some sequence,
+    like the predecessors of heuristics.palletObjective()"""
+    res = {label:set() for label in heuristics.binLabels(sequences)}
+    for sequence in sequences:
+        earlierLabels = set()
+        for label in sequence:
+            res[label].update(earlierLabels - {label})
+            earlierLabels.add(label)
+    return res
+
+def labelCounts(sequences):
+    """! Returns a dict that maps every label to its number of bins"""
+    counts = {}
+    for label in heuristics.binLabels(sequences):
+        counts[label] = counts.get(label, 0) + 1
+    return counts
+
+def conflictGraph(sequences, minBins=2):
+    """! Returns a dict that maps every label to the labels that precede it and that it precedes
+
+    @param minBins Labels with fewer bins are left out. The bin model needs 2, because a label with a single bin
+           never requires a stacking place
+    """
+    preds = predecessors(sequences)
+    counts = labelCounts(sequences)
+    labels = [label for label in preds if counts[label] >= minBins]
+    return {label:{other for other in labels if other in preds[label] and label in preds[other]} for label in labels}
+
+def maxClique(graph):
+    """! Returns a largest clique of the graph(dict that maps every node to the set of its neighbors) as list.
+    Bron-Kerbosch with pivoting, which is fast enough for the number of labels of the instances"""
+    best = []
+
+    def expand(clique, candidates, excluded):
+        nonlocal best
+        if len(candidates) == 0:
+            if len(excluded) == 0 and len(clique) > len(best):
+                best = list(clique)
+            return
+        if len(clique)+len(candidates) <= len(best):
+            return
+        pivot = max(candidates | excluded, key=lambda node: len(graph[node] & candidates))
+        for node in list(candidates - graph[pivot]):
+            expand(clique+[node], candidates & graph[node], excluded & graph[node])
+            candidates = candidates - {node}
+            excluded = excluded | {node}
+
+    expand([], set(graph), set())
+    return best
+
+def overlapBound(sequences):
+    """! Returns the size of the largest set of labels that are open at the same time in every plan of the bin model"""
+    return len(maxClique(conflictGraph(sequences)))
+
+def binStateBound(sequences, stateLimit=STATE_LIMIT):
+    """! Returns the minimum number of stacking places of the bin model or None if the instance has more states
+    than stateLimit. A state is the number of removed bins of every sequence"""
+    shape = tuple(len(sequence)+1 for sequence in sequences)
+    states = int(np.prod(shape))
+    if states > stateLimit:
+        return None
+
+    #Number of removed bins of every label and the resulting number of open labels in every state
+    counts = labelCounts(sequences)
+    openLabels = np.zeros(shape, dtype=np.int64)
+    for label, total in counts.items():
+        removed = np.zeros(shape, dtype=np.int64)
+        for s, sequence in enumerate(sequences):
+            prefix = np.concatenate([[0], np.cumsum([elem == label for elem in sequence])])
+            removed += prefix.reshape([-1 if i == s else 1 for i in range(0, len(sequences))])
+        openLabels += (removed > 0) & (removed < total)
+
+    #Best bottleneck to every state. Predecessors have smaller flat indices
+    places = openLabels.ravel().tolist()
+    strides = [int(np.prod(shape[s+1:])) for s in range(0, len(shape))]
+    best = [0]*states
+    for index, heads in enumerate(itertools.product(*[range(0, size) for size in shape])):
+        if index == 0:
+            continue
+        best[index] = max(places[index], min(best[index-strides[s]] for s in range(0, len(shape)) if heads[s] > 0))
+    return best[-1]
+
+def binLowerBound(sequences, stateLimit=STATE_LIMIT):
+    """! Returns the best lower bound on the number of stacking places of the bin model
+
+    @param stateLimit Largest number of states the exact bound is computed for. 0 only uses the combinatorial bounds
+    """
+    bound = max(heuristics.trivialLowerBound(sequences), overlapBound(sequences))
+    exact = binStateBound(sequences, stateLimit) if stateLimit > 0 else None
+    return bound if exact is None else max(bound, exact)
+
+def hasPrecedenceCycle(sequences):
+    """! Checks whether the labels can't be ordered such that every label comes after all of its predecessors"""
+    preds = predecessors(sequences)
+    remaining = {label:set(labels) for label, labels in preds.items()}
+    while len(remaining) > 0:
+        free = [label for label, labels in remaining.items() if len(labels) == 0]
+        if len(free) == 0:
+            return True
+        for label in free:
+            del remaining[label]
+        for labels in remaining.values():
+            labels.difference_update(free)
+    return False
+
+def palletCliqueBound(sequences):
+    """! Returns the combinatorial lower bound on w of the pallet model"""
+    clique = len(maxClique(conflictGraph(sequences, 1)))
+    return max(clique-1, 1 if hasPrecedenceCycle(sequences) else 0)
+
+def palletSubsetBound(sequences, labelLimit=SUBSET_LABEL_LIMIT):
+    """! Returns the minimum of w of the pallet model or None if the instance has more labels than labelLimit.
+    A state is the set of opened labels"""
+    labels = list(predecessors(sequences))
+    if len(labels) > labelLimit:
+        return None
+    bit = {label:1 << i for i, label in enumerate(labels)}
+    predMasks = [sum(bit[pred] for pred in preds) for preds in predecessors(sequences).values()]
+
+    #w of every set of opened labels: the opened labels with a predecessor that isn't opened
+    masks = np.arange(0, 1 << len(labels), dtype=np.int64)
+    values = np.zeros(len(masks), dtype=np.int64)
+    for i, predMask in enumerate(predMasks):
+        values += ((masks >> i) & 1).astype(bool) & ((predMask & ~masks) != 0)
+
+    #Best bottleneck to every set, set by set in order of their size
+    popcount = np.zeros(len(masks), dtype=np.int64)
+    for i in range(0, len(labels)):
+        popcount += (masks >> i) & 1
+    best = values.copy()
+    for size in range(2, len(labels)+1):
+        layer = masks[popcount == size]
+        reach = np.full(len(layer), np.iinfo(np.int64).max)
+        for i in range(0, len(labels)):
+            member = ((layer >> i) & 1).astype(bool)
+            reach[member] = np.minimum(reach[member], best[layer[member] ^ (1 << i)])
+        best[layer] = np.maximum(values[layer], reach)
+    return int(best[-1])
+
+def palletLowerBound(sequences, labelLimit=SUBSET_LABEL_LIMIT):
+    """! Returns the best lower bound on w of the pallet model
+
+    @param labelLimit Largest number of labels the exact bound is computed for. 0 only uses the combinatorial bounds
+    """
+    bound = palletCliqueBound(sequences)
+    exact = palletSubsetBound(sequences, labelLimit) if labelLimit > 0 else None
+    return bound if exact is None else max(bound, exact)
+
+def bestPalletValue(generator, sampleset, bound=None):
+    """! Returns the lowest w of a sample of the sampleset that describes a valid opening order or None
+
+    @param generator The PalletQUBOGenerator the sampleset belongs to
+    @param bound Stop looking once a sample meets this value
+    """
+    best = None
+    for sample in sampleset.samples():
+        order = generator.decodeOpeningOrder(sample)
+        if order is None:
+            continue
+        value = heuristics.palletObjective(generator.sequences, order)
+        if best is None or value < best:
+            best = value
+            if bound is not None and best <= bound:
+                break
+    return best
+
+def sampleUntilBound(sample, num_reads, bound, value, rounds=4):
+    """! Samples in rounds and stops as soon as a valid sample meets the lower bound
+
+    @param sample Function that returns a sampleset for (number of reads, index of the round)
+    @param num_reads Total number of reads, split evenly across the rounds
+    @param bound The lower bound
+    @param value Function that returns the best objective value of a valid sample of a sampleset or None
+    @returns The concatenated sampleset. info['lowerBound'] contains the bound, the best value, the rounds and reads
+             that were sampled and whether the solve stopped early
+    """
+    import dimod
+
+    samplesets = []
+    best = None
+    reads = parallelSA.shardReads(num_reads, rounds)
+    for index, count in enumerate(reads):
+        samplesets.append(sample(count, index))
+        current = value(samplesets[-1])
+        if current is not None and (best is None or current < best):
+            best = current
+        if best is not None and best <= bound:
+            break
+
+    sampleset = dimod.concatenate(samplesets) if len(samplesets) > 1 else samplesets[0]
+    sampleset.info.update(samplesets[0].info)
+    sampleset.info['lowerBound'] = {'bound':bound, 'best':best, 'rounds':len(samplesets),
+            'num_reads':sum(reads[:len(samplesets)]), 'stoppedEarly':len(samplesets) < len(reads)}
+    return sampleset
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+    from stacking import parseSequences
+
+    parser = argparse.ArgumentParser(description='Compute lower bounds on the number of stacking places')
+    parser.add_argument('-s', type=str, action='store', dest='seqs',
+            metavar='Sequences. Entries are separated by commas. Sequences are separated by -.Labels are numbers', required = True)
+    parser.add_argument('-sl', type=int, action='store', dest='stateLimit', default=STATE_LIMIT,
+            help='Largest number of states of the exact bound of the bin model')
+    parser.add_argument('-ll', type=int, action='store', dest='labelLimit', default=SUBSET_LABEL_LIMIT,
+            help='Largest number of labels of the exact bound of the pallet model')
+
+    args = parser.parse_args(sys.argv[1:])
+    sequences = parseSequences(args.seqs)
+    print('Bin model:    overlap bound', overlapBound(sequences), 'exact', binStateBound(sequences, args.stateLimit),
+          'heuristic', heuristics.upperBound(sequences)[0])
+    print('Pallet model: clique bound', palletCliqueBound(sequences), 'exact', palletSubsetBound(sequences, args.labelLimit),
+          'heuristic', heuristics.palletUpperBound(sequences)[0])
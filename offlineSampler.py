@@ -0,0 +1,55 @@
+"""! Offline stand-in for the QPU.
+
+OfflineDWaveSampler has the interface and the topology of a DWaveSampler but samples the embedded problem
+with simulated annealing, so the QA code paths(embedding, chains, reverse annealing) can be run without access to the cloud.
+"""
+import time
+
+from dwave.system.testing import MockDWaveSampler
+from neal.sampler import SimulatedAnnealingSampler, default_beta_range
+
+class OfflineDWaveSampler(MockDWaveSampler):
+    """! Samples the problems that would be sent to a QPU locally with simulated annealing.
+    Reverse anneals(initial_state and anneal_schedule) start every read from the initial state
+    at a temperature that corresponds to the lowest anneal fraction of the schedule."""
+
+    def __init__(this, topology_type='pegasus', topology_shape=[16], num_sweeps=100, **config):
+        """! Constructs the stand-in
+
+        @param topology_type Topology of the emulated QPU
+        @param topology_shape Shape of the emulated QPU, the default matches an Advantage system
+        @param num_sweeps Number of sweeps of every read
+        """
+        super().__init__(topology_type=topology_type, topology_shape=topology_shape,
+                substitute_sampler=SimulatedAnnealingSampler(), substitute_kwargs={'num_sweeps':num_sweeps},
+                parameter_warnings=False, **config)
+
+    def sample(this, bqm, **kwargs):
+        """! Samples the given (embedded) bqm
+
+        @param **kwargs Parameters of DWaveSampler.sample(). Only num_reads, initial_state and anneal_schedule have an effect
+        """
+        for kw in kwargs:
+            if kw not in this.parameters:
+                raise ValueError('kwarg '+repr(kw)+' invalid for OfflineDWaveSampler()')
+
+        args = dict(this.substitute_kwargs)
+        args['num_reads'] = kwargs.get('num_reads', 1)
+
+        initialState = kwargs.get('initial_state')
+        schedule = kwargs.get('anneal_schedule')
+        if initialState is not None and schedule is not None:
+            state = dict(initialState)
+            variables = list(bqm.variables)
+            reversePoint = min(point[1] for point in schedule)
+            hot, cold = default_beta_range(bqm)
+            args['initial_states'] = ([[state.get(var, 0) for var in variables]], variables)
+            args['initial_states_generator'] = 'tile'
+            args['beta_range'] = (hot**(1-reversePoint)*cold**reversePoint, cold)
+
+        start = time.perf_counter()
+        sampleset = this.substitute_sampler.sample(bqm, **args)
+        elapsed = (time.perf_counter()-start)*1e6
+        sampleset.info['timing'] = {'qpu_sampling_time':elapsed, 'qpu_access_time':elapsed,
+                'qpu_programming_time':0.0, 'qpu_anneal_time_per_sample':elapsed/args['num_reads']}
+        return sampleset
@@ -0,0 +1,173 @@
+"""! Finds the minimum number of stacking places of an instance by searching the bound of the decision problem.
+
+Instead of solving the decision version of StackingQUBOGenerator for every dec_bound, the bound is bisected
+between a classical lower bound(see lowerBounds) and the value of a classical heuristic. Every valid plan a solver returns is
+evaluated classically, so a plan that is better than the tested bound shrinks the search interval right away.
+Only the classical bounds prove a lower bound. On small instances the exact bound of lowerBounds meets the value of the
+heuristics or a solver call at it, so the search ends without testing infeasible bounds.
+Each step is warm-started from the best known plan and the best samples of the previous step.
+"""
+from neal.sampler import SimulatedAnnealingSampler
+
+from stacking import StackingQUBOGenerator
+import heuristics
+import lowerBounds
+
+def completeInitialState(bqm, known, sweeps=3):
+    """! Builds a full assignment of the bqm from the values of some of its variables.
+    Variables without a known value are initialized with 0 and then set greedily
+    to the value that lowers the energy while the known values are kept.
+
+    @param bqm The BinaryQuadraticModel to build the assignment for
+    @param known Mapping of variable names to values. Variables that are not in the bqm are ignored
+    @param sweeps Number of greedy sweeps over the unknown variables
+    """
+    state = {var:known.get(var, 0) for var in bqm.variables}
+    free = [var for var in bqm.variables if var not in known]
+
+    for _ in range(0, sweeps):
+        changed = False
+        for var in free:
+            field = bqm.get_linear(var)
+            for neighbor, bias in bqm.adj[var].items():
+                field += bias*state[neighbor]
+            value = 1 if field < 0 else 0
+            if value != state[var]:
+                state[var] = value
+                changed = True
+        if not changed:
+            break
+    return state
+
+def warmStartStates(generator, samples):
+    """! Maps samples of another decision bound onto the variables of the given generator.
+    Plan variables and shared auxiliary variables keep their values, everything else is completed greedily.
+
+    @param generator The generator of the next decision problem
+    @param samples List of samples(mappings of variable names to values) of the previous decision problem
+    @returns List of full assignments of generator.bqm
+    """
+    states = []
+    for sample in samples:
+        known = {var:value for var, value in sample.items() if var in generator.bqm.variables and not var.startswith(('f(', 's', 'p_'))}
+        states.append(completeInitialState(generator.bqm, known))
+    return states
+
+def solveDecision(sequences, dec_bound, num_reads, sampler, encoding='onehot', penaltyScales=None, initialStates=None, seedOrder=None, **sampleArgs):
+    """! Solves the decision problem for one bound.
+
+    @param initialStates Samples of a previous decision problem that seed the sampler
+    @param seedOrder Removal order whose full assignment(see StackingQUBOGenerator.sampleFromOrder()) seeds the sampler
+
+    @returns (best number of stacking places of a valid plan or None, that plan, the best samples, the sampleset)
+    """
+    generator = StackingQUBOGenerator(sequences, dec_bound, penaltyScales, encoding)
+    generator.generateBQM()
+
+    states = []
+    if seedOrder is not None:
+        states.append(generator.sampleFromOrder(seedOrder))
+    if initialStates is not None:
+        states += warmStartStates(generator, initialStates)
+
+    if len(states) > 0 and 'initial_states' in sampler.parameters:
+        variables = list(generator.bqm.variables)
+        sampleArgs['initial_states'] = ([[state[var] for var in variables] for state in states], variables)
+
+    sampleset = sampler.sample(generator.bqm, num_reads=num_reads, **sampleArgs)
+
+    bestPlaces = None
+    bestOrder = None
+    for sample in sampleset.samples():
+        order = generator.decodeRemovalOrder(sample)
+        if order is None:
+            continue
+        places = heuristics.stackingPlaces(sequences, order)
+        if bestPlaces is None or places < bestPlaces:
+            bestPlaces = places
+            bestOrder = order
+
+    return bestPlaces, bestOrder, sampleset, generator
+
+def minimizeStackingPlaces(sequences, num_reads=1000, sampler=None, encoding='onehot', penaltyScales=None,
+        lowerBound=None, upperBound=None, warmStarts=10, verbose=True, stateLimit=lowerBounds.STATE_LIMIT, **sampleArgs):
+    """! Finds the minimum number of stacking places with a logarithmic number of solver calls.
+    A bound the solver finds no valid plan for isn't proven to be infeasible. The search continues above it, but the
+    bound is reported as unresolved and the result is only an upper bound unless it meets the proven lower bound.
+
+    @param sequences The sequences of the problem instance
+    @param num_reads Number of samples to generate per solver call
+    @param sampler The dimod sampler to use. Simulated annealing if omitted
+    @param encoding Encoding of the plan variables, see stacking.PLAN_ENCODINGS
+    @param penaltyScales Optional per constraint family penalty factors, see penaltyCalibration
+    @param lowerBound Known lower bound. A classical lower bound is used if omitted
+    @param upperBound Known upper bound. The value of the classical heuristics is used if omitted
+    @param warmStarts Number of best samples of a step that seed the next step
+    @param stateLimit Largest state space the exact lower bound is computed for, see lowerBounds.binLowerBound()
+    @param **sampleArgs Additional keyword arguments are forwarded to sampler.sample()
+
+    @returns dict with the number of stacking places('places'), the corresponding removal order('order'),
+             the proven lower bound('lowerBound'), whether places is proven to be the minimum('optimal'), the highest
+             bound below places the solver found no plan for('unresolved', None if there is none), the number of
+             solver calls('calls') and every tested bound with its result('history')
+    """
+    if sampler is None:
+        sampler = SimulatedAnnealingSampler()
+
+    heuristicPlaces, heuristicOrder = heuristics.upperBound(sequences)
+    high = heuristicPlaces
+    bestOrder = heuristicOrder
+    if upperBound is not None and upperBound < high:
+        high = upperBound
+        bestOrder = None
+
+    low = lowerBounds.binLowerBound(sequences, stateLimit)
+    if lowerBound is not None:
+        low = max(low, lowerBound)
+
+    history = []
+    seeds = None
+    searchLow = low
+    unresolved = None
+    while searchLow < high:
+        bound = (searchLow+high)//2
+        places, order, sampleset, generator = solveDecision(sequences, bound, num_reads, sampler, encoding, penaltyScales, seeds, bestOrder, **sampleArgs)
+        history.append((bound, places))
+        if verbose:
+            print('dec_bound', bound, 'best valid plan needs', places, 'stacking places')
+
+        seeds = [sample for sample in sampleset.truncate(warmStarts).samples()]
+        if places is not None and places < high:
+            high = places
+            bestOrder = order
+        if places is None or places > bound:
+            #No plan within the bound was found, which doesn't prove that there is none
+            unresolved = bound
+            searchLow = bound+1
+    if unresolved is not None and unresolved >= high:
+        unresolved = None
+
+    return {'places':high, 'order':bestOrder, 'lowerBound':low, 'optimal':high <= low, 'unresolved':unresolved,
+            'calls':len(history), 'history':history}
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+    import stacking
+
+    parser = argparse.ArgumentParser(description='Find the minimum number of stacking places by searching the bound of the decision problem')
+    parser.add_argument('-s', type=str, action='store', dest='seqs',
+            metavar='Sequences. Entries are separated by commas. Sequences are\
+ separated by -.Labels are numbers', required = True)
+    parser.add_argument('-nr', type=int, action='store', dest='num_reads', metavar='Number of samples to generate per solver call.', default=1000)
+    parser.add_argument('-enc', type=str, action='store', dest='encoding', choices=stacking.PLAN_ENCODINGS, default='onehot', help='Encoding of the plan variables')
+
+    args = parser.parse_args(sys.argv[1:])
+    sequences = stacking.parseSequences(args.seqs)
+    res = minimizeStackingPlaces(sequences, args.num_reads, encoding=args.encoding)
+    if res['optimal']:
+        print('Minimum number of stacking places:', res['places'], 'after', res['calls'], 'solver calls')
+    else:
+        print('At most', res['places'], 'stacking places after', res['calls'], 'solver calls, proven lower bound', res['lowerBound'],
+              ', no plan found for', res['unresolved'])
+    print('Removal order:', res['order'])
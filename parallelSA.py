@@ -0,0 +1,137 @@
+"""! Splits the reads of one simulated annealing solve across worker processes.
+
+The bqm is written once into a shared memory block(linear biases, the coordinates and biases of the interactions and
+the offset as numpy vectors). Every worker rebuilds the bqm from that block when it starts, so only the labels and
+small shard descriptions are pickled. The shards get independent seed streams spawned from one
+numpy.random.SeedSequence, so a seeded solve is reproducible for a given number of workers. The samplesets of the
+shards are merged and aggregated: Identical samples are combined and their num_occurrences summed up.
+
+A long running process(see solveDaemon) can keep one pool of workers for many solves. Its shards carry the
+description of the shared memory block and the workers rebuild the bqm when the block changes.
+
+Example:
+    sampleset = sampleParallel(generator.bqm, 50000, workers=8, seed=1)
+"""
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import dimod
+import numpy as np
+
+import backends
+
+#The bqm of a worker process and the name of the shared memory block it was read from, see attachBQM()
+workerBQM = None
+workerBlock = None
+
+def shareBQM(bqm):
+    """! Writes the bqm into a new shared memory block
+
+    @returns (shared memory block, description of the block for attachBQM()). The caller has to unlink the block
+    """
+    linear, (rows, cols, quadratic), offset, labels = bqm.to_numpy_vectors(return_labels=True)
+    arrays = [np.asarray(linear, dtype=np.float64), np.asarray(rows, dtype=np.int64),
+              np.asarray(cols, dtype=np.int64), np.asarray(quadratic, dtype=np.float64)]
+    size = sum(array.nbytes for array in arrays)
+    block = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    layout = []
+    start = 0
+    for array in arrays:
+        np.ndarray(array.shape, array.dtype, buffer=block.buf, offset=start)[:] = array
+        layout.append((start, len(array), array.dtype.str))
+        start += array.nbytes
+    return block, {'name':block.name, 'layout':layout, 'offset':float(offset), 'labels':list(labels), 'vartype':bqm.vartype}
+
+def readBQM(buffer, description):
+    """! Builds the bqm from a buffer with the layout of shareBQM()"""
+    linear, rows, cols, quadratic = [np.ndarray((length,), np.dtype(dtype), buffer=buffer, offset=start)
+                                     for start, length, dtype in description['layout']]
+    return dimod.BinaryQuadraticModel.from_numpy_vectors(linear, (rows, cols, quadratic), description['offset'],
+            description['vartype'], variable_order=description['labels'])
+
+def attachBQM(description):
+    """! Initializer of the worker processes: Builds the bqm from the shared memory block"""
+    global workerBQM, workerBlock
+    block = shared_memory.SharedMemory(name=description['name'])
+    try:
+        workerBQM = readBQM(block.buf, description)
+        workerBlock = description['name']
+    finally:
+        block.close()
+
+def sampleShard(backend, num_reads, seed, args, description=None):
+    """! Samples one shard in a worker process
+
+    @param description Description of the shared memory block of the bqm for workers of a pool that outlives
+           the solve. The bqm is rebuilt if the worker read another block before
+    @returns (samples, labels of the columns, num_occurrences, info, seconds spent sampling)
+    """
+    if description is not None and description['name'] != workerBlock:
+        attachBQM(description)
+    start = time.perf_counter()
+    sampleset = backends.getSampler(backend).sample(workerBQM, num_reads=num_reads, seed=seed, **args)
+    return (sampleset.record.sample, list(sampleset.variables), sampleset.record.num_occurrences,
+            sampleset.info, time.perf_counter()-start)
+
+def shardReads(num_reads, shards):
+    """! Splits num_reads into at most shards nonempty parts whose sizes differ by at most 1"""
+    shards = max(1, min(shards, num_reads))
+    return [num_reads//shards + (1 if i < num_reads%shards else 0) for i in range(0, shards)]
+
+def shardSeeds(seed, shards):
+    """! Returns independent 31 bit seeds for the shards, spawned from SeedSequence(seed). neal rejects larger seeds"""
+    return [int(child.generate_state(1, dtype=np.uint32)[0] >> 1) for child in np.random.SeedSequence(seed).spawn(shards)]
+
+def mergeShards(bqm, results):
+    """! Merges the results of sampleShard() into one aggregated sampleset of the bqm"""
+    variables = list(bqm.variables)
+    samples = []
+    occurrences = []
+    for shardSamples, labels, shardOccurrences, _, _ in results:
+        column = {var:i for i, var in enumerate(labels)}
+        samples.append(shardSamples[:, [column[var] for var in variables]])
+        occurrences.append(shardOccurrences)
+    sampleset = dimod.SampleSet.from_samples_bqm((np.concatenate(samples), variables), bqm,
+            num_occurrences=np.concatenate(occurrences))
+    return sampleset.aggregate()
+
+def sampleParallel(bqm, num_reads, workers=None, backend='SA', seed=None, executor=None, **args):
+    """! Samples the bqm with num_reads reads split across worker processes
+
+    @param bqm The bqm to sample
+    @param num_reads Total number of reads
+    @param workers Number of worker processes. Defaults to the number of cores. 1 samples in this process
+           with the given seed
+    @param backend Name of an unstructured backend, see backends
+    @param seed Optional seed. The shards get independent seeds derived from it
+    @param executor Optional concurrent.futures.ProcessPoolExecutor to sample with instead of a new pool
+    @param **args Additional keyword arguments are forwarded to the sampler of every shard
+    @returns Aggregated sampleset. info['parallel'] contains the workers and the reads, seed and time of every shard
+    """
+    workers = os.cpu_count() if workers is None else workers
+    reads = shardReads(num_reads, workers)
+    if len(reads) <= 1:
+        if seed is not None:
+            args['seed'] = seed
+        return backends.getSampler(backend).sample(bqm, num_reads=num_reads, **args)
+    seeds = shardSeeds(seed, len(reads))
+
+    block, description = shareBQM(bqm)
+    try:
+        if executor is not None:
+            results = list(executor.map(sampleShard, [backend]*len(reads), reads, seeds, [args]*len(reads), [description]*len(reads)))
+        else:
+            with ProcessPoolExecutor(len(reads), initializer=attachBQM, initargs=(description,)) as pool:
+                results = list(pool.map(sampleShard, [backend]*len(reads), reads, seeds, [args]*len(reads)))
+    finally:
+        block.close()
+        block.unlink()
+
+    sampleset = mergeShards(bqm, results)
+    sampleset.info.update(results[0][3])
+    sampleset.info['parallel'] = {'workers':len(reads),
+            'shards':[{'num_reads':count, 'seed':shardSeed, 'time':result[4]}
+                      for count, shardSeed, result in zip(reads, seeds, results)]}
+    return sampleset
@@ -0,0 +1,208 @@
+"""! Calibrates the penalties of the single constraint families of the QUBO generators.
+
+Both generators use one global penalty factor that is large enough for every constraint.
+This module searches the smallest factor per constraint family (see PENALTY_FAMILIES in
+stacking and stackingPallet) for which short simulated annealing runs never find a sample that
+undercuts the known optimum or reaches it with an invalid plan. The results are cached per instance class.
+"""
+import json
+import math
+import os
+
+from neal.sampler import SimulatedAnnealingSampler
+
+import stacking
+import stackingPallet
+from qaUtils import dataPath
+
+DEFAULT_CACHE = 'data/penaltyCalibration.json'
+
+def instanceClass(sequences, model, dec_bound=1, penaltyMul=50, encoding='onehot'):
+    """! Returns the key under which calibrated penalties of the given instance are cached.
+    Instances with the same number of sequences, labels and bins share their penalties.
+
+    @param sequences The sequences of the problem instance
+    @param model Either 'bin' or 'pallet'
+    @param dec_bound Boundary for the decision problem(only used by the bin model)
+    @param penaltyMul Penalty multiplier(only used by the pallet model)
+    @param encoding Encoding of the plan variables
+    """
+    labels = set()
+    for sequence in sequences:
+        labels.update(sequence)
+    binCount = sum(len(sequence) for sequence in sequences)
+
+    key = model+'-k'+str(len(sequences))+'-l'+str(len(labels))+'-n'+str(binCount)
+    if model == 'bin':
+        key += '-db'+str(dec_bound)
+    else:
+        key += '-p'+str(penaltyMul)
+    if encoding != 'onehot':
+        key += '-'+encoding
+    return key
+
+def penaltyFamilies(model):
+    """! Returns the names of the constraint families of the given model"""
+    if model == 'bin':
+        return stacking.PENALTY_FAMILIES
+    elif model == 'pallet':
+        return stackingPallet.PENALTY_FAMILIES
+    raise ValueError('Model must be either bin or pallet, not '+str(model))
+
+def buildGenerator(sequences, model, penaltyScales=None, dec_bound=1, penaltyMul=50, encoding='onehot'):
+    """! Returns a generator of the given model which already contains the full bqm"""
+    if model == 'bin':
+        generator = stacking.StackingQUBOGenerator(sequences, dec_bound, penaltyScales, encoding)
+        generator.generateBQM()
+        return generator
+    elif model == 'pallet':
+        return stackingPallet.PalletQUBOGenerator(sequences, penaltyMul=penaltyMul, penaltyScales=penaltyScales, encoding=encoding)
+    raise ValueError('Model must be either bin or pallet, not '+str(model))
+
+def decodePlan(generator, sample):
+    """! Returns the plan described by the sample or None if the plan is invalid"""
+    if isinstance(generator, stacking.StackingQUBOGenerator):
+        return generator.decodeRemovalOrder(sample)
+    return generator.decodeOpeningOrder(sample)
+
+def isSafe(generator, sampleset, optimum, tolerance=1e-6):
+    """! Checks whether the penalties of the generator are large enough for the given sampleset.
+    They are not, if a sample has a lower energy than the optimum or reaches the optimum
+    with an invalid plan.
+
+    @param generator The generator the sampleset was sampled from
+    @param sampleset The sampleset to check
+    @param optimum Energy of the optimal solutions of the instance
+    """
+    for sample, energy in sampleset.data(['sample', 'energy']):
+        if energy < optimum-tolerance:
+            return False
+        if energy > optimum+tolerance:
+            #Samples are sorted by energy
+            break
+        if decodePlan(generator, sample) is None:
+            return False
+    return True
+
+def referenceOptimum(sequences, model, num_reads=1000, dec_bound=1, penaltyMul=50, seed=None, encoding='onehot'):
+    """! Estimates the optimal energy of an instance with the uncalibrated penalties.
+
+    @returns The lowest energy of a sample with a valid plan or None if no such sample was found
+    """
+    generator = buildGenerator(sequences, model, None, dec_bound, penaltyMul, encoding)
+    sampleset = SimulatedAnnealingSampler().sample(generator.bqm, num_reads=num_reads, seed=seed)
+
+    for sample, energy in sampleset.data(['sample', 'energy']):
+        if decodePlan(generator, sample) is not None:
+            return energy
+    return None
+
+def calibrate(sequences, model, optimum=None, dec_bound=1, penaltyMul=50, num_reads=200, num_sweeps=200,
+        steps=6, minScale=1/64, margin=2, seed=None, encoding='onehot'):
+    """! Searches the smallest safe penalty scale of every constraint family of the model.
+
+    The families are calibrated one after another. For each family the scale is bisected
+    (on a logarithmic scale) between minScale and 1, using one batch of short annealing runs per step.
+    The smallest safe scale is multiplied by margin to leave room for longer or noisier solves.
+
+    @param sequences The sequences of the problem instance
+    @param model Either 'bin' or 'pallet'
+    @param optimum Known optimal energy of the instance. Estimated with uncalibrated penalties if omitted
+    @param num_reads Number of reads of every batch
+    @param num_sweeps Number of sweeps of every read
+    @param steps Number of bisection steps per family
+    @param minScale Smallest scale that is tried
+    @param margin Factor the smallest safe scale is multiplied by
+    @param encoding Encoding of the plan variables
+
+    @returns dict{String:float} Penalty scale of every constraint family
+    """
+    if optimum is None:
+        optimum = referenceOptimum(sequences, model, 5*num_reads, dec_bound, penaltyMul, seed, encoding)
+        if optimum is None:
+            raise RuntimeError('No valid solution found to calibrate against')
+
+    sampler = SimulatedAnnealingSampler()
+    batch = [0]
+
+    def safe(scales):
+        generator = buildGenerator(sequences, model, scales, dec_bound, penaltyMul, encoding)
+        batchSeed = None if seed is None else seed+batch[0]
+        batch[0] += 1
+        sampleset = sampler.sample(generator.bqm, num_reads=num_reads, num_sweeps=num_sweeps, seed=batchSeed)
+        return isSafe(generator, sampleset, optimum)
+
+    scales = {family:1.0 for family in penaltyFamilies(model)}
+    for family in scales:
+        low = minScale
+        high = 1.0
+        if safe(dict(scales, **{family:low})):
+            high = low
+        else:
+            for _ in range(0, steps):
+                middle = math.sqrt(low*high)
+                if safe(dict(scales, **{family:middle})):
+                    high = middle
+                else:
+                    low = middle
+        scales[family] = min(1.0, high*margin)
+
+    #Families can interact, so back off until the combination is safe as well
+    while not safe(scales) and min(scales.values()) < 1:
+        scales = {family:min(1.0, 2*scale) for family, scale in scales.items()}
+
+    return scales
+
+def loadCache(path=DEFAULT_CACHE):
+    """! Returns the cached calibrations stored at path, a path in data/ is moved by qaUtils.dataPath()"""
+    path = dataPath(path)
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as cacheFile:
+        return json.load(cacheFile)
+
+def storeCache(cache, path=DEFAULT_CACHE):
+    """! Writes the given calibrations to path, a path in data/ is moved by qaUtils.dataPath()"""
+    path = dataPath(path)
+    directory = os.path.dirname(path)
+    if directory != '':
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w') as cacheFile:
+        json.dump(cache, cacheFile, indent=2, sort_keys=True)
+
+def getPenaltyScales(sequences, model, dec_bound=1, penaltyMul=50, path=DEFAULT_CACHE, recalibrate=False, encoding='onehot', **calibrationArgs):
+    """! Returns the calibrated penalty scales for the class of the given instance.
+    The instance is calibrated and the result cached if the class is not known yet.
+
+    @param recalibrate Calibrate even if the class is already cached
+    @param **calibrationArgs Additional keyword arguments are forwarded to calibrate()
+    """
+    key = instanceClass(sequences, model, dec_bound, penaltyMul, encoding)
+    cache = loadCache(path)
+    if key in cache and not recalibrate:
+        return cache[key]
+
+    scales = calibrate(sequences, model, dec_bound=dec_bound, penaltyMul=penaltyMul, encoding=encoding, **calibrationArgs)
+    cache[key] = scales
+    storeCache(cache, path)
+    return scales
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description='Calibrate the penalties of the constraint families for an instance class')
+    parser.add_argument('-s', type=str, action='store', dest='seqs',
+            metavar='Sequences. Entries are separated by commas. Sequences are\
+ separated by -.Labels are numbers', required = True)
+    parser.add_argument('-m', type=str, action='store', dest='model', metavar='Model to calibrate. Either bin or pallet.', required = True)
+    parser.add_argument('-db', type=int, action='store', dest='dec_bound', metavar='Boundary for decision problem', default=1)
+    parser.add_argument('-p', type=int, action='store', dest='penalty', metavar='Factor to multiply lowest possible penalty A by', default = 50)
+    parser.add_argument('-opt', type=float, action='store', dest='optimum', metavar='Known optimal energy of the instance', default=None)
+    parser.add_argument('-c', type=str, action='store', dest='cache', metavar='Path of the calibration cache', default=DEFAULT_CACHE)
+    parser.add_argument('-enc', type=str, action='store', dest='encoding', choices=stacking.PLAN_ENCODINGS, default='onehot', help='Encoding of the plan variables')
+
+    args = parser.parse_args(sys.argv[1:])
+    sequences = stacking.parseSequences(args.seqs)
+    scales = getPenaltyScales(sequences, args.model, args.dec_bound, args.penalty, args.cache, recalibrate=True, encoding=args.encoding, optimum=args.optimum)
+    print(instanceClass(sequences, args.model, args.dec_bound, args.penalty, args.encoding), scales)
@@ -0,0 +1,153 @@
+"""! Pipelined solving of many instances.
+
+solveDWave() generates, embeds, samples and saves one instance after another. SolvePipeline runs these stages
+as asyncio tasks on one bounded thread pool per stage, so the bqm of the next instance is generated and embedded
+while the current one is sampled, and samplesets are saved off the critical path.
+
+Example:
+    samplesets = pipeline.solveAll(instances, 1000, offline=True)
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import minorminer
+
+import backends
+from stacking import StackingQUBOGenerator
+from stackingPallet import PalletQUBOGenerator
+from qaUtils import saveSampleset
+
+STAGES = ['generate', 'embed', 'sample', 'save']
+
+class SolvePipeline:
+    """! Solves instances with overlapping stages. Every stage runs on its own thread pool"""
+
+    def __init__(this, sampler, num_reads, model='pallet', workers=None, maxInFlight=4, save=True,
+            dec_bound=1, penaltyMul=50, penaltyScales=None, encoding='onehot', **args):
+        """! Constructs a pipeline
+
+        @param sampler The sampler to use. Structured samplers(QPUs and their stand-ins) get an embedding stage
+        @param num_reads Number of samples to generate per instance
+        @param model Either 'bin' or 'pallet'
+        @param workers dict that maps stages(see STAGES) to their number of threads. Every stage has one thread by default
+        @param maxInFlight Maximum number of instances that are generated but not sampled yet, which bounds the memory
+        @param save Save every sampleset like solveDWave() does
+        @param **args Additional keyword arguments are forwarded to the sampler
+        """
+        if model not in ['bin', 'pallet']:
+            raise ValueError('Model must be either bin or pallet, not '+str(model))
+        this.sampler = sampler
+        this.num_reads = num_reads
+        this.model = model
+        this.maxInFlight = maxInFlight
+        this.save = save
+        this.dec_bound = dec_bound
+        this.penaltyMul = penaltyMul
+        this.penaltyScales = penaltyScales
+        this.encoding = encoding
+        this.args = args
+        this.structured = hasattr(sampler, 'edgelist')
+
+        workers = {} if workers is None else workers
+        this.executors = {stage:ThreadPoolExecutor(workers.get(stage, 1), thread_name_prefix=stage) for stage in STAGES}
+
+    def close(this):
+        """! Shuts down the thread pools"""
+        for executor in this.executors.values():
+            executor.shutdown()
+
+    def __enter__(this):
+        return this
+
+    def __exit__(this, excType, excValue, traceback):
+        this.close()
+        return False
+
+    async def run(this, stage, timings, function, *args):
+        """! Runs function on the thread pool of the stage and records when it started and finished"""
+        loop = asyncio.get_running_loop()
+        def timed():
+            start = time.perf_counter()
+            res = function(*args)
+            timings[stage] = (start, time.perf_counter())
+            return res
+        return await loop.run_in_executor(this.executors[stage], timed)
+
+    def generate(this, sequences):
+        """! Returns a generator with the full bqm of the instance"""
+        if this.model == 'bin':
+            generator = StackingQUBOGenerator(sequences, this.dec_bound, this.penaltyScales, this.encoding)
+            generator.generateBQM()
+            return generator
+        return PalletQUBOGenerator(sequences, penaltyMul=this.penaltyMul, penaltyScales=this.penaltyScales, encoding=this.encoding)
+
+    def embed(this, bqm):
+        """! Returns an embedding of the bqm onto the sampler"""
+        embedding = minorminer.find_embedding(list(bqm.quadratic), this.sampler.edgelist)
+        if len(embedding) == 0 and bqm.num_interactions > 0:
+            raise RuntimeError('No embedding found')
+        return embedding
+
+    def sample(this, bqm, embedding):
+        """! Samples the bqm, using the embedding on structured samplers"""
+        if this.structured:
+            from dwave.system import FixedEmbeddingComposite
+            return FixedEmbeddingComposite(this.sampler, embedding).sample(bqm, num_reads=this.num_reads, **this.args)
+        return this.sampler.sample(bqm, num_reads=this.num_reads, **this.args)
+
+    def saveResult(this, sampleset, index):
+        """! Saves the sampleset. The index keeps samplesets saved in the same second apart"""
+        prefix = 'data/pallet/' if this.model == 'pallet' else 'data/'
+        saveSampleset(sampleset, prefix+('QA' if this.structured else 'SA')+'-pipeline-'+str(index)+'-')
+
+    async def solve(this, sequences, index, inFlight, saves):
+        """! Runs all stages of one instance.
+        The save stage is only scheduled, so the sampleset is returned before it is saved.
+
+        @returns The sampleset of the instance
+        """
+        timings = {}
+        async with inFlight:
+            generator = await this.run('generate', timings, this.generate, sequences)
+            embedding = None
+            if this.structured:
+                embedding = await this.run('embed', timings, this.embed, generator.bqm)
+            sampleset = await this.run('sample', timings, this.sample, generator.bqm, embedding)
+
+        sampleset.info['bqm'] = generator.bqm
+        sampleset.info['sequences'] = sequences
+        sampleset.info['penaltyFactor'] = generator.penaltyFactor
+        sampleset.info['penaltyScales'] = generator.penaltyScales
+        sampleset.info['encoding'] = generator.encoding
+        sampleset.info['pipeline'] = timings
+        if this.save:
+            saves.append(asyncio.ensure_future(this.run('save', timings, this.saveResult, sampleset, index)))
+        return sampleset
+
+    async def solveAll(this, instances):
+        """! Solves all instances
+
+        @param instances Iterable of instances. Each instance is a list of sequences
+        @returns List with one sampleset per instance, in the order of the instances
+        """
+        inFlight = asyncio.Semaphore(this.maxInFlight)
+        saves = []
+        results = await asyncio.gather(*[this.solve(sequences, index, inFlight, saves) for index, sequences in enumerate(instances)])
+        await asyncio.gather(*saves)
+        return list(results)
+
+def solveAll(instances, num_reads, sampler=None, offline=False, **pipelineArgs):
+    """! Solves all instances with a SolvePipeline and waits for the results
+
+    @param instances Iterable of instances. Each instance is a list of sequences
+    @param num_reads Number of samples to generate per instance
+    @param sampler The sampler to use. A DWaveSampler(or the offline stand-in) if omitted
+    @param offline Use the local stand-in of the QPU(see offlineSampler) if no sampler is given
+    @param **pipelineArgs Additional keyword arguments are forwarded to SolvePipeline()
+    """
+    if sampler is None:
+        sampler = backends.getSampler('OFFLINE' if offline else 'QA', embed=False)
+
+    with SolvePipeline(sampler, num_reads, **pipelineArgs) as solvePipeline:
+        return asyncio.run(solvePipeline.solveAll(instances))
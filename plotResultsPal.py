@@ -1,5 +1,6 @@
 import numpy as np
 import qaUtils
+import ttsAnalysis
 from collectConstStatsPallet import calcConstraintStats
 from matplotlib import pyplot as plt
 
@@ -38,6 +39,9 @@ def plotResults(samplesets, xAxisLabels):
         
         correctCount = np.sum(ss.record[ss.record['energy'] < penaltyFactor]['num_occurrences'])
         print("Number of samples without violated constraints: " + str(correctCount))
+        tts = ttsAnalysis.analyze(ss)
+        print("Success probability: {:.4f} [{:.4f}, {:.4f}], TTS99: {:.4g}s [{:.4g}, {:.4g}]".format(
+              tts['p'], tts['pLow'], tts['pHigh'], tts['tts'], tts['ttsLow'], tts['ttsHigh']))
         correct.append(correctCount)
         incorrect.append(np.sum(ss.record['num_occurrences'])-correctCount)
 
@@ -1,20 +1,21 @@
 from datetime import datetime
+import json
 import pickle
 import dimod
-import networkx as nx
-import matplotlib.pyplot as plt
 import math
+import os
+import numpy as np
 
 def varNameToLatex(name):
     """!
       \brief Converts the given BQM variable name to LaTeX notation
     """
-    if name[0] == 'f' or name[0] == 'Y':
+    if name[0] == 'f' or name[0] == 'Y' or name[0] == 'O':
         firstLetter = name[0]
         firstIndex = str(int(name[name.find('(')+1:name.find(',')])+1)
         secondIndex = str(int(name[name.find(',')+1:name.find(')')])+1)
         return '$'+firstLetter+'('+firstIndex + ',' + secondIndex + ')$'
-    elif name[0] != 'x':
+    elif name[0] != 'x' and name[0] != 'd':
         firstIndexStr = name[1:name.find('_')]
         firstIndex = ''
         if len(firstIndexStr) > 0:
@@ -26,11 +27,12 @@ def varNameToLatex(name):
     res = '$'
     
     while len(name)>0:
+        letter = name[0]
         name = name[2:]
         firstIndex = str(int(name[:name.find(',')])+1)
         secondIndex = str(int(name[name.find(',')+1:name.find(')')])+1)
 
-        res += 'x_{' + firstIndex+ '}^{' + secondIndex+ '}'
+        res += letter + '_{' + firstIndex+ '}^{' + secondIndex+ '}'
         name = name[name.find(')')+1:]
         
         if name[:2] == 'or':
@@ -43,97 +45,377 @@ def varNameToLatex(name):
 
     return res + '$'
 
-def outputbqm(path, bqm, sep=',', latexMode=False):
-    out = open(path, 'w')
-    out.write(' ')
-    for key in bqm:
-        outKey = key
-        if latexMode:
-            outKey = varNameToLatex(key)
-        out.write(sep+str(outKey))
-    
-    if latexMode:
-        out.write('\\\\')
+def evaluateGadgets(gadgets, values):
+    """!
+      \brief Evaluates recorded boolean expressions of a generator in place
 
-    out.write('\n')
-    
-    rowCounter = 0
-    for rowKey in bqm:
-        rowOutKey = rowKey
-        if latexMode:
-            rowOutKey = varNameToLatex(rowKey)
-
-        out.write(rowOutKey)
-        colCounter = 0
-        for colKey in bqm:
-            field = 0
-            if colKey == rowKey:
-                field = bqm.linear[rowKey]
-            elif colCounter < rowCounter:
-                field = ' '
-            elif (rowKey, colKey) not in bqm.quadratic:
-                field = 0
-            else:
-                field = bqm.adj[rowKey][colKey]
-            
-            if not isinstance(field, str) and field%1 == 0:
-                field = math.floor(field)
-
-            out.write(sep+str(field))
-            colCounter += 1
-            print(rowCounter, colCounter)
-        if latexMode:
-            out.write('\\\\')
-
-        out.write('\n')
-        rowCounter += 1
+      \param gadgets List of (kind, inputs, output) tuples in the order they were modeled.
+             kind is one of 'or', 'and', 'andnot'(first input AND NOT second input), 'not', 'copy' and 'one'
+      \param values Mapping of variable names to values. Has to contain the inputs of the first expressions,
+             the outputs are added to it
+    """
+    for kind, inputs, output in gadgets:
+        inputValues = [values.get(var, 0) for var in inputs]
+        if kind == 'or':
+            values[output] = int(any(inputValues))
+        elif kind == 'and':
+            values[output] = int(all(inputValues))
+        elif kind == 'andnot':
+            values[output] = int(inputValues[0] == 1 and inputValues[1] == 0)
+        elif kind == 'not':
+            values[output] = 1-inputValues[0]
+        elif kind == 'copy':
+            values[output] = inputValues[0]
+        elif kind == 'one':
+            values[output] = 1
+        else:
+            raise ValueError('Unknown expression '+str(kind))
+    return values
+
+def binaryDigits(name, value, size):
+    """!
+      \brief Returns the values of the variables name_0 to name_{size-1} that represent value in binary notation
+    """
+    return {name+'_'+str(i):(value >> i) & 1 for i in range(0, size)}
+
+def inequalityCouplers(counts, slackSizes, objectiveSize):
+    """!
+      \brief Returns the number of couplers of the inequalities sum_c + s_c = p of the generators: the square of every sum,
+      the couplings of the summed variables and of the slack to p and the squares of the slacks and of p
+
+      \param counts dict that maps every step c to the number of summed variables
+      \param slackSizes dict that maps every step c to the number of bits of s_c
+      \param objectiveSize Number of bits of p
+    """
+    res = objectiveSize*(objectiveSize-1)//2
+    for c, count in counts.items():
+        size = slackSizes[c]
+        res += count*(count-1)//2 + count*(size+objectiveSize) + size*objectiveSize + size*(size-1)//2
+    return res
+
+#Number of lines the text exporters write at once
+EXPORT_CHUNK = 65536
+
+def bqmArrays(bqm):
+    """!
+      \brief Returns the bqm as arrays of its upper triangular QUBO matrix
+
+      \returns (list of variable labels, linear biases, row indices, column indices and biases of the couplers, offset).
+                The row index of every coupler is smaller than its column index
+    """
+    if bqm.vartype is not dimod.BINARY:
+        bqm = bqm.change_vartype(dimod.BINARY, inplace=False)
+    vectors = bqm.to_numpy_vectors(variable_order=list(bqm.variables), return_labels=True)
+    rows = np.minimum(vectors.quadratic.row_indices, vectors.quadratic.col_indices).astype(np.int64)
+    cols = np.maximum(vectors.quadratic.row_indices, vectors.quadratic.col_indices).astype(np.int64)
+    return list(vectors.labels), np.asarray(vectors.linear_biases, dtype=float), rows, cols, np.asarray(vectors.quadratic.biases, dtype=float), float(vectors.offset)
+
+def cooToCSR(numRows, rows, cols, values):
+    """!
+      \brief Converts a matrix in coordinate format to compressed sparse rows
+
+      \returns (indptr, indices, data) like scipy.sparse.csr_matrix
+    """
+    order = np.lexsort((cols, rows))
+    indptr = np.zeros(numRows+1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=numRows), out=indptr[1:])
+    return indptr, cols[order], values[order]
+
+def labelJSON(label):
+    """!
+      \brief Returns the label as JSON value. Tuples become lists, which can't be labels, so labelFromJSON() can restore them
+
+      \throws ValueError for labels that aren't strings, numbers, booleans, None or tuples of them
+    """
+    if label is None or isinstance(label, (str, int, float)):
+        return label
+    if isinstance(label, tuple):
+        return [labelJSON(part) for part in label]
+    raise ValueError('Labels of type '+type(label).__name__+' can\'t be exported, e.g. '+repr(label))
+
+def labelFromJSON(value):
+    """!
+      \brief Returns the label of a JSON value written by labelJSON()
+    """
+    if isinstance(value, list):
+        return tuple(labelFromJSON(part) for part in value)
+    return value
+
+def exportNPZ(path, bqm, layout='coo'):
+    """!
+      \brief Writes the bqm to a compressed numpy archive
+
+      The archive contains the variable labels, the linear biases, the offset and the couplers of the upper triangular
+      QUBO matrix, either as row, col and data arrays('coo') or as indptr, indices and data arrays('csr'), and the vartype
+      of the bqm. The labels are stored as UTF-8 encoded JSON list(see labelJSON()), so their types are kept.
+
+      \param path Path of the archive
+      \param bqm The bqm to export
+      \param layout Either 'coo' or 'csr'
+      \throws ValueError for labels that can't be stored, see labelJSON()
+    """
+    labels, linear, rows, cols, values, offset = bqmArrays(bqm)
+    encoded = json.dumps([labelJSON(label) for label in labels]).encode('utf-8')
+    arrays = {'labels':np.frombuffer(encoded, dtype=np.uint8), 'vartype':np.array(bqm.vartype.name),
+              'linear':linear, 'offset':np.array(offset), 'layout':np.array(layout)}
+    if layout == 'coo':
+        arrays.update(row=rows, col=cols, data=values)
+    elif layout == 'csr':
+        indptr, indices, data = cooToCSR(len(labels), rows, cols, values)
+        arrays.update(indptr=indptr, indices=indices, data=data)
+    else:
+        raise ValueError('Layout must be either coo or csr, not '+str(layout))
+    np.savez_compressed(path, **arrays)
+
+def readNPZ(path):
+    """!
+      \brief Reads the arrays of an archive written by exportNPZ()
+
+      \returns The same tuple as bqmArrays(), the arrays are the ones of the QUBO matrix for both vartypes
+    """
+    archive = np.load(path)
+    labels = []
+    if 'vartype' in archive:
+        labels = [labelFromJSON(value) for value in json.loads(archive['labels'].tobytes().decode('utf-8'))]
+    elif len(archive['labels']) > 0:
+        #Archives of older versions separate the labels by zero bytes
+        labels = archive['labels'].tobytes().decode('utf-8').split('\0')
+    if str(archive['layout']) == 'csr':
+        rows = np.repeat(np.arange(len(labels)), np.diff(archive['indptr']))
+        cols = archive['indices']
+    else:
+        rows = archive['row']
+        cols = archive['col']
+    return labels, archive['linear'], rows, cols, archive['data'], float(archive['offset'])
+
+def importNPZ(path):
+    """!
+      \brief Reads a bqm written by exportNPZ() with its labels and vartype
+    """
+    labels, linear, rows, cols, values, offset = readNPZ(path)
+    bqm = dimod.BinaryQuadraticModel.from_numpy_vectors(linear, (rows, cols, values), offset, dimod.BINARY)
+    bqm = bqm.relabel_variables(dict(enumerate(labels)), inplace=False)
+    with np.load(path) as archive:
+        vartype = str(archive['vartype']) if 'vartype' in archive else 'BINARY'
+    return bqm if vartype == 'BINARY' else bqm.change_vartype(vartype, inplace=False)
+
+def writeLines(out, lines):
+    """!
+      \brief Writes formatted lines in chunks of EXPORT_CHUNK lines
+      \param lines Iterable of lines without line breaks
+    """
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) == EXPORT_CHUNK:
+            out.write('\n'.join(chunk)+'\n')
+            chunk = []
+    if len(chunk) > 0:
+        out.write('\n'.join(chunk)+'\n')
+
+def exportMatrixMarket(path, bqm):
+    """!
+      \brief Writes the upper triangular QUBO matrix of the bqm in the Matrix Market coordinate format.
+      The indices are 1-based, the labels of the variables and the offset are stored in comments
+    """
+    labels, linear, rows, cols, values, offset = bqmArrays(bqm)
+    diagonal = np.nonzero(linear)[0]
+    with open(path, 'w') as out:
+        out.write('%%MatrixMarket matrix coordinate real general\n')
+        out.write('% offset '+repr(offset)+'\n')
+        writeLines(out, ('% '+str(i+1)+' '+str(label) for i, label in enumerate(labels)))
+        out.write(str(len(labels))+' '+str(len(labels))+' '+str(len(diagonal)+len(values))+'\n')
+        writeLines(out, (str(i+1)+' '+str(i+1)+' '+repr(float(linear[i])) for i in diagonal))
+        writeLines(out, (str(i+1)+' '+str(j+1)+' '+repr(float(v)) for i, j, v in zip(rows.tolist(), cols.tolist(), values.tolist())))
+
+def exportQubo(path, bqm):
+    """!
+      \brief Writes the bqm in the .qubo text format of qbsolv.
+      The nodes are numbered in the order of the variables of the bqm, their labels and the offset are stored in comments
+    """
+    labels, linear, rows, cols, values, offset = bqmArrays(bqm)
+    diagonal = np.nonzero(linear)[0]
+    with open(path, 'w') as out:
+        out.write('c offset '+repr(offset)+'\n')
+        writeLines(out, ('c '+str(i)+' '+str(label) for i, label in enumerate(labels)))
+        out.write('p qubo 0 '+str(len(labels))+' '+str(len(diagonal))+' '+str(len(values))+'\n')
+        writeLines(out, (str(i)+' '+str(i)+' '+repr(float(linear[i])) for i in diagonal))
+        writeLines(out, (str(i)+' '+str(j)+' '+repr(float(v)) for i, j, v in zip(rows.tolist(), cols.tolist(), values.tolist())))
+
+def denseView(bqm, sep=',', latexMode=False, maxVariables=100):
+    """!
+      \brief Returns the upper triangular QUBO matrix of a small bqm as a table, e.g. for CSV files or LaTeX documents
+
+      \param sep Separator of the columns
+      \param latexMode Whether to convert the variable names to LaTeX and end every row with \\\\
+      \param maxVariables Largest number of variables that is accepted. The table grows quadratically
+    """
+    if len(bqm) > maxVariables:
+        raise ValueError('The dense view is limited to '+str(maxVariables)+' variables, the bqm has '+str(len(bqm)))
+
+    labels, linear, rows, cols, values, offset = bqmArrays(bqm)
+    n = len(labels)
+    matrix = np.zeros((n, n))
+    matrix[np.arange(n), np.arange(n)] = linear
+    matrix[rows, cols] = values
+
+    names = [varNameToLatex(label) if latexMode else str(label) for label in labels]
+    end = '\\\\' if latexMode else ''
+    lines = [' '+sep+sep.join(names)+end]
+    for i in range(0, n):
+        fields = [' ']*i + [str(math.floor(field)) if field%1 == 0 else str(field) for field in matrix[i, i:]]
+        lines.append(names[i]+sep+sep.join(fields)+end)
+    return '\n'.join(lines)+'\n'
+
+def outputbqm(path, bqm, sep=',', latexMode=False, maxVariables=100):
+    """!
+      \brief Writes the dense view(see denseView()) of a small bqm to path.
+      Use exportNPZ(), exportMatrixMarket() or exportQubo() for larger bqms
+    """
+    with open(path, 'w') as out:
+        out.write(denseView(bqm, sep, latexMode, maxVariables))
+
+#Environment variable that moves the data directory of saved samplesets and caches, e.g. to a temporary directory
+DATA_ENVIRONMENT = 'STACKING_DATA'
+
+def dataPath(path):
+    """!Returns path with a leading data/ directory replaced by the directory in the environment variable
+    DATA_ENVIRONMENT, if that is set. Other paths are returned unchanged"""
+    directory = os.environ.get(DATA_ENVIRONMENT)
+    if directory is None or not (path == 'data' or path.startswith('data/')):
+        return path
+    return os.path.join(directory, path[len('data/'):])
 
 def saveSampleset(sampleset, prefix="", timestamp=True):
-    """!Saves the sampleset with the given prefix and a timestamp
+    """!Saves the sampleset with the given prefix and a timestamp.
+    If the sampleset has a bqm in its info, the bqm is also written to a sidecar archive(see sidecarPath()),
+    so it can be inspected without unpickling the whole sampleset
     @param sampleset The sampleset to save
-    @param prefix The prefix of the path
-    @param timestamp Whether to add a timestamp to the filename"""
+    @param prefix The prefix of the path. Prefixes in data/ are moved by dataPath(), missing directories are created
+    @param timestamp Whether to add a timestamp to the filename
+    @returns The path of the saved sampleset"""
 
     now = datetime.now()
     
-    path = prefix+now.strftime("%Y-%m-%d-%H-%M-%S")+'.dat'
+    path = dataPath(prefix)+now.strftime("%Y-%m-%d-%H-%M-%S")+'.dat'
+    directory = os.path.dirname(path)
+    if directory != '':
+        os.makedirs(directory, exist_ok=True)
+
+    with open(path, 'wb') as out:
+        pickle.dump(sampleset.to_serializable(), out)
+    if isinstance(sampleset.info.get('bqm'), dimod.BinaryQuadraticModel):
+        exportNPZ(sidecarPath(path), sampleset.info['bqm'], 'csr')
+    return path
 
-    pickle.dump(sampleset.to_serializable(), open(path, 'wb'))
+def sidecarPath(path):
+    """!Returns the path of the bqm archive that belongs to the sampleset saved at path"""
+    return path[:-len('.dat')]+'.bqm.npz' if path.endswith('.dat') else path+'.bqm.npz'
 
 def loadSampleset(path):
     """!Loads and returns a serialized sampleset at the given location"""
-    return dimod.SampleSet.from_serializable(pickle.load(open(path, 'rb')))
+    with open(path, 'rb') as source:
+        return dimod.SampleSet.from_serializable(pickle.load(source))
 
-def extractNeighborhood(bqm, var):
-    """!Generates a new BQM that only contains the node var and neighboring nodes
+class AdjacencyIndex:
+    """!Index of the adjacency of a bqm for fast neighborhood queries.
+    The couplers are stored in both directions as compressed sparse rows, so the neighbors of a set of
+    variables are found with a few array operations instead of loops over dicts."""
 
-    @param bqm The BinaryQuadraticModel to extract the neighborhood from
-    @param var The variable to extract"""
+    def __init__(this, labels, linear, rows, cols, values, offset=0.0):
+        """!Builds the index from the arrays of an upper triangular QUBO matrix, see bqmArrays()"""
+        this.labels = list(labels)
+        this.positions = {label:i for i, label in enumerate(this.labels)}
+        this.linear = np.asarray(linear, dtype=float)
+        this.rows = np.asarray(rows, dtype=np.int64)
+        this.cols = np.asarray(cols, dtype=np.int64)
+        this.values = np.asarray(values, dtype=float)
+        this.offset = offset
+        this.indptr, this.indices, _ = cooToCSR(len(this.labels), np.concatenate((this.rows, this.cols)),
+                np.concatenate((this.cols, this.rows)), np.concatenate((this.values, this.values)))
 
-    res = dimod.BinaryQuadraticModel(vartype='BINARY')
-    knownKeys = [var]
-    
-    res.add_variable(var, bqm.linear[var])
-    for key in bqm.adj[var]:
-        knownKeys.append(key)
-        res.add_variable(key, bqm.linear[key])
-        res.add_interaction(var, key, bqm.quadratic[var,key])
+    @classmethod
+    def fromBQM(cls, bqm):
+        """!Builds the index of a bqm"""
+        return cls(*bqmArrays(bqm))
 
-        for innerKey in bqm.adj[key]:
-            if innerKey in knownKeys:
-                res.add_interaction(key, innerKey, bqm.quadratic[key, innerKey])
+    @classmethod
+    def fromNPZ(cls, path):
+        """!Builds the index from an archive written by exportNPZ() without constructing the bqm"""
+        return cls(*readNPZ(path))
 
-    return res
+    def neighbors(this, nodes):
+        """!Returns the indices of all neighbors of the given variable indices(with duplicates)"""
+        starts = this.indptr[nodes]
+        lengths = this.indptr[nodes+1]-starts
+        offsets = np.repeat(starts-(np.cumsum(lengths)-lengths), lengths)
+        return this.indices[np.arange(lengths.sum())+offsets]
+
+    def neighborhood(this, seeds, hops=1):
+        """!Returns the sorted indices of all variables that are at most hops couplers away from one of the seeds
+
+        @param seeds Labels of the variables to start from
+        @param hops Maximum distance
+        """
+        reached = np.zeros(len(this.labels), dtype=bool)
+        frontier = np.array([this.positions[seed] for seed in seeds], dtype=np.int64)
+        reached[frontier] = True
+        for _ in range(0, hops):
+            if len(frontier) == 0:
+                break
+            candidates = np.unique(this.neighbors(frontier))
+            frontier = candidates[~reached[candidates]]
+            reached[frontier] = True
+        return np.nonzero(reached)[0]
+
+    def subgraph(this, seeds, hops=1):
+        """!Returns the bqm induced by the variables at most hops couplers away from one of the seeds
+
+        @param seeds Labels of the variables to start from
+        @param hops Maximum distance
+        """
+        nodes = this.neighborhood(seeds, hops)
+        inside = np.zeros(len(this.labels), dtype=bool)
+        inside[nodes] = True
+        edges = inside[this.rows] & inside[this.cols]
+
+        #Renumber the selected variables from 0
+        newIndex = np.full(len(this.labels), -1, dtype=np.int64)
+        newIndex[nodes] = np.arange(len(nodes))
+        res = dimod.BinaryQuadraticModel.from_numpy_vectors(this.linear[nodes],
+                (newIndex[this.rows[edges]], newIndex[this.cols[edges]], this.values[edges]), 0.0, dimod.BINARY)
+        return res.relabel_variables({i:this.labels[node] for i, node in enumerate(nodes)}, inplace=False)
+
+def extractNeighborhood(bqm, var, hops=1):
+    """!Generates a new BQM that only contains the node var and nodes at most hops couplers away from it
+
+    @param bqm The BinaryQuadraticModel to extract the neighborhood from
+    @param var The variable to extract
+    @param hops Maximum distance of the extracted nodes"""
+    return AdjacencyIndex.fromBQM(bqm).subgraph([var], hops)
+
+def loadAdjacencyIndex(path):
+    """!Returns the AdjacencyIndex of the bqm of the sampleset saved at path.
+    Uses the sidecar archive if it exists and only unpickles the sampleset otherwise"""
+    if os.path.exists(sidecarPath(path)):
+        return AdjacencyIndex.fromNPZ(sidecarPath(path))
+    return AdjacencyIndex.fromBQM(loadSampleset(path).info['bqm'])
+
+def drawNeighborhood(path, var, hops=1):
+    """!Draws the neighborhood of var in the bqm of the sampleset saved at path
 
-def drawNeighborhood(path, var):
-    sampleS = loadSampleset(path)
-    bqm = sampleS.info['bqm']
-    part = extractNeighborhood(bqm, var)
+    @param path Path of the sampleset, see saveSampleset()
+    @param var Label of the variable, or list of labels
+    @param hops Maximum distance of the drawn nodes"""
+    import networkx as nx
+    import matplotlib.pyplot as plt
+    seeds = var if isinstance(var, list) else [var]
+    part = loadAdjacencyIndex(path).subgraph(seeds, hops)
     graph = part.to_networkx_graph()
     
     cm = []
-    for key in part.variables:
-        if key == var:
+    for key in graph.nodes:
+        if key in seeds:
             cm.append('red')
         else:
             cm.append('blue')
@@ -0,0 +1,266 @@
+"""! Compiles bqms into the coefficient range of a QPU.
+
+The QPU scales every problem so its largest biases fit into h_range and j_range. The bqms of the generators contain
+penalty couplers of the binary numbers(weights up to penalty*2^(2*auxSize)), so after this scaling the objective
+terms(p_i or w_i with weight 2^i) end up far below the noise of the analog control. compileBQM() analyzes the
+coefficient spectrum per class of terms, greedily splits the variables of the largest terms into copies that share
+their biases and are tied together, and reports the predicted precision of every class before and after.
+
+The ties between the m copies of a variable form a clique with strength T/m, where T is the sum of the absolute
+biases of the variable. Separating k copies from the others costs 2(T/m)k(m-k) >= 2kT/m, which is at least what the
+separated copies can gain, so the ground states are preserved. CompiledModel.decode() maps samplesets back by
+majority vote over the copies. Since the ties grow with T, only variables with few strong terms can be split: On the
+generated models the largest biases are couplers between bits of the binary numbers, so splitting lowers the scale by
+about 10-15% and the objective stays below the noise. Smaller penalties(see penaltyCalibration) help more.
+
+Example:
+    compiled = compileBQM(generator.bqm, objectiveTerms(generator))
+    printReport(compiled.report)
+    sampleset = compiled.decode(sampler.sample(compiled.bqm, num_reads=100))
+"""
+import math
+import re
+
+import dimod
+import numpy as np
+
+#Coefficient ranges of an Advantage system
+DEFAULT_H_RANGE = (-4.0, 4.0)
+DEFAULT_J_RANGE = (-1.0, 1.0)
+
+#Typical magnitude of the integrated control errors of h and J. Biases below them are effectively noise
+DEFAULT_NOISE = {'h':0.05, 'J':0.015}
+
+COPY_SEPARATOR = '#'
+
+def termClass(var):
+    """! Returns the class of a variable of the generators: plan, number or boolean(auxiliary variables of expressions)"""
+    name = str(var).split(COPY_SEPARATOR)[0]
+    if name.startswith(('x(', 'd(', 'u(', 'z(')):
+        return 'plan'
+    if re.match(r'^(p|w|s\d+)_\d+$', name):
+        return 'number'
+    return 'boolean'
+
+def objectiveTerms(generator):
+    """! Returns a dict that maps the variables of the objective of a generator to their weight"""
+    prefix = 'w_' if hasattr(generator, 'decodeOpeningOrder') else 'p_'
+    return {prefix+str(i):2**i for i in range(0, generator.objectiveSize)}
+
+def spectrum(bqm):
+    """! Returns a dict with the largest and smallest nonzero absolute linear and quadratic biases of the bqm,
+    the variable or interaction of the largest bias and the dynamic range(largest/smallest nonzero bias)
+    """
+    linear, (rows, cols, quadratic), _, labels = bqm.to_numpy_vectors(return_labels=True)
+    linear = np.abs(linear)
+    quadratic = np.abs(quadratic)
+    res = {'variables':len(labels), 'interactions':len(quadratic)}
+    for name, values in [('linear', linear), ('quadratic', quadratic)]:
+        nonzero = values[values > 0]
+        res['max'+name.capitalize()] = float(values.max()) if len(values) > 0 else 0.0
+        res['min'+name.capitalize()] = float(nonzero.min()) if len(nonzero) > 0 else 0.0
+
+    if res['maxQuadratic'] >= res['maxLinear'] and len(quadratic) > 0:
+        i = int(np.argmax(quadratic))
+        res['largest'] = (labels[rows[i]], labels[cols[i]])
+    elif len(linear) > 0:
+        res['largest'] = labels[int(np.argmax(linear))]
+    largest = max(res['maxLinear'], res['maxQuadratic'])
+    smallest = min([value for value in [res['minLinear'], res['minQuadratic']] if value > 0], default=0)
+    res['dynamicRange'] = largest/smallest if smallest > 0 else math.inf
+    return res
+
+def autoScale(ising, hRange=DEFAULT_H_RANGE, jRange=DEFAULT_J_RANGE):
+    """! Returns the factor the QPU divides the biases of the ising model by(auto_scale)"""
+    linear = list(ising.linear.values())
+    quadratic = list(ising.quadratic.values())
+    candidates = [max(linear, default=0)/hRange[1], min(linear, default=0)/hRange[0],
+                  max(quadratic, default=0)/jRange[1], min(quadratic, default=0)/jRange[0]]
+    return max(max(candidates), 1e-300)
+
+def precisionReport(ising, objective=None, hRange=DEFAULT_H_RANGE, jRange=DEFAULT_J_RANGE, noise=DEFAULT_NOISE):
+    """! Returns the predicted precision of every class of terms of the ising model after auto scaling.
+
+    A class of linear terms is named after the class of its variable(see termClass()), a class of quadratic
+    terms after the classes of both variables. Every class has its number of terms, the largest and smallest
+    scaled absolute bias, the number of terms below the noise and the bits of precision of its smallest term
+    (log2 of the smallest bias over the noise). 'objective' describes the objective weight 1 of the binary model,
+    which is the resolution the sampler needs to tell plans of different quality apart.
+
+    @param ising Ising model(SPIN bqm)
+    @param objective Optional dict of the objective terms, see objectiveTerms()
+    """
+    scale = autoScale(ising, hRange, jRange)
+    classes = {}
+    def add(name, bias, floor):
+        bias = abs(bias)/scale
+        if bias == 0:
+            return
+        entry = classes.setdefault(name, {'count':0, 'max':0.0, 'min':math.inf, 'belowNoise':0, 'noise':floor})
+        entry['count'] += 1
+        entry['max'] = max(entry['max'], bias)
+        entry['min'] = min(entry['min'], bias)
+        entry['belowNoise'] += bias < floor
+
+    for var, bias in ising.linear.items():
+        add('h:'+termClass(var), bias, noise['h'])
+    for (u, v), bias in ising.quadratic.items():
+        add('J:'+'-'.join(sorted([termClass(u), termClass(v)])), bias, noise['J'])
+    if objective:
+        #x = (s+1)/2, so a binary weight w becomes the linear bias w/2
+        add('objective', min(objective.values())/2, noise['h'])
+
+    for entry in classes.values():
+        entry['bits'] = math.log2(entry['min']/entry['noise'])
+        del entry['noise']
+    return {'scale':scale, 'classes':classes, 'spectrum':spectrum(ising)}
+
+def totalBias(ising, var):
+    """! Returns the sum of the absolute biases of the variable"""
+    return abs(ising.linear[var]) + sum(abs(bias) for bias in ising.adj[var].values())
+
+def largestTerm(ising, hRange=DEFAULT_H_RANGE, jRange=DEFAULT_J_RANGE):
+    """! Returns the term that determines the auto scaling as (variables of the term, bias relative to the J range)"""
+    term, largest = (), 0.0
+    for var, bias in ising.linear.items():
+        if abs(bias)*jRange[1]/hRange[1] > largest:
+            term, largest = (var,), abs(bias)*jRange[1]/hRange[1]
+    for (u, v), bias in ising.quadratic.items():
+        if abs(bias) > largest:
+            term, largest = (u, v), abs(bias)
+    return term, largest
+
+def splitVariable(ising, var, count, tie):
+    """! Replaces the variable by count copies that share its biases and are tied together with strength tie, in place.
+    Returns the names of the copies"""
+    names = [str(var)+COPY_SEPARATOR+str(i) for i in range(0, count)]
+    neighbors = dict(ising.adj[var])
+    linear = ising.linear[var]
+    ising.remove_variable(var)
+    for name in names:
+        ising.add_variable(name, linear/count)
+        for neighbor, bias in neighbors.items():
+            ising.add_interaction(name, neighbor, bias/count)
+    for i in range(0, count):
+        for j in range(i+1, count):
+            ising.add_interaction(names[i], names[j], -tie)
+    return names
+
+def splitVariables(ising, target, maxCopies=4, tieMargin=1.1, hRange=DEFAULT_H_RANGE, jRange=DEFAULT_J_RANGE):
+    """! Greedily splits the variables of the largest term into copies, in place, while this lowers the largest bias.
+
+    A variable with total bias T can only be split into m copies if the ties tieMargin*T/m stay below the largest
+    bias, so variables with many strong couplers(like the bits of the binary numbers) often can't be split.
+
+    @param ising Ising model(SPIN bqm)
+    @param target Largest absolute bias(relative to the J range) to aim for
+    @param maxCopies Maximum number of copies per variable
+    @param tieMargin Factor the strength of the ties is multiplied by, so broken ties have strictly higher energy
+    @returns dict that maps the split variables to the list of their copies
+    """
+    copies = {}
+    split = set() #Copies aren't split again
+    while True:
+        term, largest = largestTerm(ising, hRange, jRange)
+        if largest <= target:
+            break
+        candidates = []
+        for var in term:
+            if var in split:
+                continue
+            total = totalBias(ising, var)
+            count = math.floor(tieMargin*total/largest)+1
+            if count <= maxCopies:
+                candidates.append((count, var, total))
+        if len(candidates) == 0:
+            break
+        count, var, total = min(candidates, key=lambda candidate: candidate[0])
+        count = max(count, 2)
+        copies[var] = splitVariable(ising, var, count, tieMargin*total/count)
+        split.update(copies[var])
+    return copies
+
+class CompiledModel:
+    """! Result of compileBQM()"""
+
+    def __init__(this, bqm, original, copies, report):
+        this.bqm = bqm #Ising model to sample
+        this.original = original
+        this.copies = copies #Maps split variables to their copies
+        this.report = report
+
+    def encode(this, sample):
+        """! Maps a sample of the original bqm onto the spins of the compiled model, e.g. for reverse annealing"""
+        res = {}
+        for var, value in sample.items():
+            spin = 2*value-1 if this.original.vartype is dimod.BINARY else value
+            for name in this.copies.get(var, [var]):
+                res[name] = spin
+        return res
+
+    def decode(this, sampleset):
+        """! Maps a sampleset of the compiled model onto the original bqm.
+        Every split variable gets the value of the majority of its copies(the first copy on ties).
+        The energies are those of the original bqm.
+        """
+        columns = {var:i for i, var in enumerate(sampleset.variables)}
+        spins = sampleset.change_vartype(dimod.SPIN, inplace=False).record.sample
+        variables = list(this.original.variables)
+        samples = np.empty((len(spins), len(variables)), dtype=np.int8)
+        broken = np.zeros(len(spins), dtype=bool)
+        for i, var in enumerate(variables):
+            if var in this.copies:
+                block = spins[:, [columns[name] for name in this.copies[var]]]
+                votes = block.sum(axis=1)
+                samples[:, i] = np.where(votes == 0, block[:, 0], np.sign(votes))
+                broken |= np.abs(votes) != block.shape[1]
+            else:
+                samples[:, i] = spins[:, columns[var]]
+        if this.original.vartype is dimod.BINARY:
+            samples = (samples+1)//2
+
+        res = dimod.SampleSet.from_samples_bqm((samples, variables), this.original,
+                num_occurrences=sampleset.record.num_occurrences)
+        res.info.update(sampleset.info)
+        res.info['rangeCompiler'] = this.report
+        res.info['brokenCopies'] = float(broken.mean()) if len(broken) > 0 else 0.0
+        return res
+
+def compileBQM(bqm, objective=None, rangeBudget=1000, maxCopies=4, hRange=DEFAULT_H_RANGE, jRange=DEFAULT_J_RANGE, noise=DEFAULT_NOISE):
+    """! Compiles the bqm for a QPU
+
+    @param bqm The bqm to compile
+    @param objective Optional dict of the objective terms, see objectiveTerms()
+    @param rangeBudget Largest allowed ratio of the largest absolute bias to the objective weight 1
+           (or to the smallest bias if no objective is given). Variables with larger biases are split
+    @param maxCopies Maximum number of copies per variable
+    @param hRange, jRange Coefficient ranges of the QPU
+    @param noise dict with the noise of h and J, see DEFAULT_NOISE
+    @returns CompiledModel whose report contains the precision report before and after compiling
+    """
+    ising = bqm.change_vartype(dimod.SPIN, inplace=False)
+    before = precisionReport(ising, objective, hRange, jRange, noise)
+
+    if objective:
+        unit = min(objective.values())/2
+    else:
+        stats = before['spectrum']
+        unit = min([value for value in [stats['minLinear'], stats['minQuadratic']] if value > 0], default=1)
+    copies = splitVariables(ising, unit*rangeBudget, maxCopies, hRange=hRange, jRange=jRange)
+
+    after = precisionReport(ising, objective, hRange, jRange, noise)
+    _, largest = largestTerm(ising, hRange, jRange)
+    report = {'before':before, 'after':after, 'copies':{str(var):len(names) for var, names in copies.items()},
+              'rangeBudget':rangeBudget, 'withinBudget':largest <= unit*rangeBudget*(1+1e-9)}
+    return CompiledModel(ising, bqm, copies, report)
+
+def printReport(report):
+    """! Prints the precision report of compileBQM() as table"""
+    print('{:<28} {:>8} {:>12} {:>12} {:>8} {:>8}'.format('Class', 'Terms', 'Max', 'Min', '<Noise', 'Bits'))
+    for stage in ['before', 'after']:
+        print(stage, '(scale 1/{:.4g})'.format(report[stage]['scale']))
+        for name, entry in sorted(report[stage]['classes'].items()):
+            print('{:<28} {:>8} {:>12.4g} {:>12.4g} {:>8} {:>8.2f}'.format(name, entry['count'], entry['max'], entry['min'],
+                    entry['belowNoise'], entry['bits']))
+    print('Split variables:', len(report['copies']), 'copies:', sum(report['copies'].values()),
+          'within budget:', report['withinBudget'])
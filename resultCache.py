@@ -0,0 +1,166 @@
+"""! Content addressed cache of samplesets.
+
+The key of a solve is the sha256 hash of the canonical JSON of the instance, the generator parameters,
+the name and parameters of the sampler(including the seed) and the version of the code that builds the bqms.
+Changing any of them results in a new key, so stale results are never returned.
+
+Entries are stored as pickled serializable samplesets(like saveSampleset() does) in one directory.
+When the directory grows beyond its size limit, the least recently used entries are removed.
+
+Note that runs without a seed are cached as well. A hit then returns the samples of an earlier run
+instead of new random samples. Use force=True to recompute.
+"""
+import hashlib
+import json
+import os
+import pickle
+import re
+
+import dimod
+
+from qaUtils import dataPath
+
+DEFAULT_DIRECTORY = 'data/cache'
+
+#Modules of the solvers. They and the modules of this directory they import determine the results
+SOLVER_MODULES = ['stacking.py', 'stackingPallet.py']
+
+IMPORT_PATTERN = re.compile(r'^\s*(?:from\s+(\w+)\s+import|import\s+(\w+(?:\s+as\s+\w+)?(?:\s*,\s*\w+(?:\s+as\s+\w+)?)*))', re.MULTILINE)
+
+MAIN_PATTERN = re.compile(r'^if __name__\s*==', re.MULTILINE)
+
+codeHash = None
+
+def codeModules(directory=None):
+    """! Returns the file names of the modules of the directory the solvers import, directly or through other modules
+    of the directory and including imports inside of functions, in sorted order. Imports of the command line
+    interfaces are left out"""
+    directory = os.path.dirname(os.path.abspath(__file__)) if directory is None else directory
+    found = set()
+    pending = list(SOLVER_MODULES)
+    while pending:
+        module = pending.pop()
+        path = os.path.join(directory, module)
+        if module in found or not os.path.exists(path):
+            continue
+        found.add(module)
+        with open(path, 'r') as source:
+            #Imports of the command line interface don't take part in solves
+            code = MAIN_PATTERN.split(source.read())[0]
+            for fromName, names in IMPORT_PATTERN.findall(code):
+                for name in [fromName] if fromName else [part.split()[0] for part in names.split(',')]:
+                    pending.append(name+'.py')
+    return sorted(found)
+
+def codeVersion():
+    """! Returns the hash of the source of the modules in codeModules()"""
+    global codeHash
+    if codeHash is None:
+        digest = hashlib.sha256()
+        directory = os.path.dirname(os.path.abspath(__file__))
+        for module in codeModules(directory):
+            with open(os.path.join(directory, module), 'rb') as source:
+                digest.update(source.read())
+        codeHash = digest.hexdigest()
+    return codeHash
+
+def canonicalJSON(value):
+    """! Returns a JSON representation of value that doesn't depend on the order of dict keys"""
+    return json.dumps(value, sort_keys=True, separators=(',', ':'), default=str)
+
+def solveKey(model, sequences, generatorParams, samplerName, samplerParams):
+    """! Returns the cache key of a solve
+
+    @param model Either 'bin' or 'pallet'
+    @param sequences The sequences of the problem instance
+    @param generatorParams dict of the parameters of the generator, e.g. dec_bound, penaltyScales and encoding
+    @param samplerName Name of the sampler
+    @param samplerParams dict of the parameters of the sampler, including num_reads and seed
+    """
+    content = {'model':model, 'sequences':[[int(label) for label in sequence] for sequence in sequences],
+               'generator':generatorParams, 'sampler':samplerName, 'samplerParams':samplerParams,
+               'seed':samplerParams.get('seed'), 'code':codeVersion()}
+    return hashlib.sha256(canonicalJSON(content).encode('utf-8')).hexdigest()
+
+class ResultCache:
+    """! Directory of cached samplesets with a size limit"""
+
+    def __init__(this, directory=DEFAULT_DIRECTORY, maxBytes=1 << 30, force=False):
+        """! Opens(and creates if necessary) the cache in the given directory
+
+        @param directory Directory of the cache. A directory in data/ is moved by qaUtils.dataPath()
+        @param maxBytes Size limit of the directory. Least recently used entries are evicted beyond it
+        @param force Ignore existing entries, so every solve is recomputed(and stored again)
+        """
+        this.directory = dataPath(directory)
+        this.maxBytes = maxBytes
+        this.force = force
+        os.makedirs(this.directory, exist_ok=True)
+
+    def path(this, key):
+        return os.path.join(this.directory, key+'.dat')
+
+    def get(this, key):
+        """! Returns the cached sampleset of the key or None"""
+        if this.force:
+            return None
+        path = this.path(key)
+        try:
+            with open(path, 'rb') as entry:
+                sampleset = dimod.SampleSet.from_serializable(pickle.load(entry))
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return None
+        os.utime(path) #Marks the entry as recently used
+        sampleset.info['cacheHit'] = True
+        return sampleset
+
+    def put(this, key, sampleset):
+        """! Stores the sampleset under the key and evicts old entries if the cache is too large"""
+        path = this.path(key)
+        temporary = path+'.tmp'
+        with open(temporary, 'wb') as entry:
+            pickle.dump(sampleset.to_serializable(), entry)
+        os.replace(temporary, path)
+        this.evict()
+
+    def entries(this):
+        """! Returns (last use, size, path) of every entry, least recently used first"""
+        res = []
+        for name in os.listdir(this.directory):
+            if name.endswith('.dat'):
+                path = os.path.join(this.directory, name)
+                stat = os.stat(path)
+                res.append((stat.st_mtime, stat.st_size, path))
+        return sorted(res)
+
+    def size(this):
+        """! Returns the number of bytes used by the entries"""
+        return sum(size for _, size, _ in this.entries())
+
+    def evict(this):
+        """! Removes least recently used entries until the cache is within its size limit"""
+        entries = this.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= this.maxBytes:
+                break
+            os.remove(path)
+            total -= size
+
+    def clear(this):
+        """! Removes all entries"""
+        for _, _, path in this.entries():
+            os.remove(path)
+
+def cachedResult(cache, key, build):
+    """! Returns the cached sampleset of the key or None without building the bqm of the solve.
+    Only entries without a bqm in their info get the one of build()
+
+    @param cache A ResultCache or None
+    @param key Key of the solve, see solveKey()
+    @param build Function without arguments that returns the generator of the solve
+    """
+    sampleset = None if cache is None else cache.get(key)
+    if sampleset is not None and 'bqm' not in sampleset.info:
+        sampleset.info['bqm'] = build().bqm
+    return sampleset
@@ -0,0 +1,367 @@
+"""! Rolling horizon solving of the pallet model for streaming bin arrivals.
+
+Bins keep arriving at the tails of the sequences while the first pallets of the plan are already being opened.
+IncrementalPalletGenerator keeps the domain wall encoded bqm of PalletQUBOGenerator up to date instead of
+rebuilding it:
+
+- A bin whose label is already known only adds edges to the sequence graph. Every new predecessor extends the
+  conjunction chain of the open indicators O(i,c) by one AND and retargets the indicators to the new chain.
+- A bin with a new label adds a position: one column of walls, one row of count and wall constraints, the open
+  indicators of the new position and one more inequality. Only if the number of bits of w grows(the label count
+  reaches a power of 2) the penalties change and the bqm is rebuilt.
+- Committed pallets are opened at fixed positions. Their walls and the walls of the taken positions are fixed and
+  removed from the bqm, terms added later are folded with the fixed values.
+
+So the work per update is proportional to the number of changed terms, not to the size of the horizon.
+RollingHorizon drives the generator: Every solve starts from the best plan so far, extended by the new labels.
+
+Example:
+    horizon = RollingHorizon([[0,1],[1,0]])
+    horizon.solve()
+    horizon.commit(1)
+    horizon.append(0, 2)
+    horizon.solve()
+"""
+import math
+
+import backends
+import heuristics
+import warmStart
+from instrumentation import recorderOrNull
+from stackingPallet import PalletQUBOGenerator
+
+class IncrementalPalletGenerator(PalletQUBOGenerator):
+    """! Domain wall encoded pallet model that can be extended by appended bins and committed pallets"""
+
+    def __init__(this, sequences, penaltyMul=50, penaltyScales=None, recorder=None):
+        """! Generates the bqm of the sequences
+
+        @param sequences List of sequences. The labels have to be 0 to the number of labels-1
+        @param penaltyMul Value to mutiply the minimum possible penalty for violation of constraints by
+        @param penaltyScales Optional per constraint family penalty factors, see penaltyCalibration
+        @param recorder Optional instrumentation.Recorder that records the stages of generateBQM()
+        """
+        this.chains = None #Maps every label to its predecessors in the order of its conjunction chain
+        this.openGadgets = {} #Maps the open indicators to their expressions
+        this.committed = [] #Labels of the committed pallets in the order they are opened
+        super().__init__([list(sequence) for sequence in sequences], True, penaltyMul, penaltyScales, 'domainwall', recorder)
+        this.chains = super().predecessors()
+        this.edges = set(this.sequenceGraph)
+
+    @property
+    def gadgets(this):
+        """! Boolean expressions in the order they can be evaluated. No expression depends on the open indicators,
+        so their expressions can be replaced without reordering the others"""
+        return this.conjunctions + list(this.openGadgets.values())
+
+    @gadgets.setter
+    def gadgets(this, value):
+        this.conjunctions = list(value)
+
+    def predecessors(this):
+        if this.chains is None:
+            return super().predecessors()
+        return this.chains
+
+    def addLinear(this, name, bias):
+        """! Adds the linear bias, folded into the offset if the variable is fixed"""
+        if name in this.fixed:
+            this.bqm.offset += bias*this.fixed[name]
+        else:
+            this.bqm.add_linear(name, bias)
+
+    def addQuadratic(this, left, right, bias):
+        """! Adds the quadratic bias, folded into linear biases or the offset if variables are fixed.
+        Interactions that cancel out are removed"""
+        if left in this.fixed:
+            this.addLinear(right, bias*this.fixed[left])
+        elif right in this.fixed:
+            this.addLinear(left, bias*this.fixed[right])
+        else:
+            this.bqm.add_quadratic(left, right, bias)
+            if this.bqm.get_quadratic(left, right) == 0:
+                this.bqm.remove_interaction(left, right)
+
+    def modelAnd(this, left, right, auxName):
+        this.conjunctions.append(('and', [left, right], auxName))
+        penalty = this.penalty('and')
+        this.addQuadratic(left, right, penalty)
+        this.addQuadratic(left, auxName, -2*penalty)
+        this.addQuadratic(right, auxName, -2*penalty)
+        this.addLinear(auxName, 3*penalty)
+
+    def modelAndNot(this, left, right, auxName, sign=1):
+        """! Models auxName = left AND NOT right, see PalletQUBOGenerator.modelAndNot().
+        sign=-1 removes the terms of an expression modeled before"""
+        if sign > 0:
+            this.openGadgets[auxName] = ('andnot', [left, right], auxName)
+        penalty = sign*this.penalty('and')
+        this.addLinear(auxName, penalty)
+        this.addLinear(left, penalty)
+        this.addQuadratic(left, right, -penalty)
+        this.addQuadratic(left, auxName, -2*penalty)
+        this.addQuadratic(right, auxName, 2*penalty)
+
+    def conjunction(this, chain, c):
+        """! Models the conjunction of the walls of the labels in chain at position c and returns its variable.
+        The chain is folded from the left, like in openIndicators(), so chains with the same prefix share variables"""
+        res = this.wallName(chain[0], c)
+        for label in chain[1:]:
+            right = this.wallName(label, c)
+            auxName = res + 'and' + right
+            if auxName not in this.bqm.variables:
+                this.modelAnd(res, right, auxName)
+            res = auxName
+        return res
+
+    def fixedWall(this, i, j):
+        """! Returns the value of d(i,j) that follows from the committed pallets or None if it isn't determined"""
+        if i in this.committed:
+            return 1 if this.committed.index(i) <= j else 0
+        if j < len(this.committed):
+            return 0
+        return None
+
+    def fixWall(this, i, j):
+        """! Fixes d(i,j) if its value follows from the committed pallets"""
+        name = this.wallName(i, j)
+        value = this.fixedWall(i, j)
+        if value is None or name in this.fixed:
+            return
+        this.fixed[name] = value
+        if name in this.bqm.variables:
+            this.bqm.fix_variable(name, value)
+
+    def addIndicator(this, c, name, others):
+        """! Adds the open indicator to the inequality of position c, see inequalityConstraints()
+
+        @param others The indicators of the inequality it is coupled to
+        """
+        penalty = this.penalty('inequality')
+        this.addLinear(name, penalty)
+        for other in others:
+            this.addQuadratic(name, other, 2*penalty)
+        for i in range(0, this.auxSize):
+            this.addQuadratic(name, 's'+str(c)+'_'+str(i), penalty*2*pow(2,i))
+            this.addQuadratic(name, 'w_'+str(i), -penalty*2*pow(2,i))
+
+    def addInequality(this, c):
+        """! Models the inequality of a new position c, see inequalityConstraints()"""
+        penalty = this.penalty('inequality')
+        this.slackSizes[c] = this.auxSize
+        indicators = this.countedIndicators(c)
+        for j in range(0, len(indicators)):
+            this.addIndicator(c, indicators[j], indicators[j+1:])
+        for i in range(0, this.auxSize):
+            for j in range(0, this.auxSize):
+                this.addQuadratic('s'+str(c)+'_'+str(i), 'w_'+str(j), -penalty*2*pow(2,i)*pow(2,j))
+        this.squareAux('w', penalty)
+        this.squareAux('s'+str(c), penalty)
+
+    def addPredecessor(this, label, pred):
+        """! Adds pred to the labels which have to be opened before the pallet of label can be closed"""
+        chain = this.chains[label]
+        for c in range(0, this.numLabels-1):
+            indicator = this.oName(label, c)
+            if len(chain) > 0:
+                #Retarget the indicator from the old chain to the chain extended by pred
+                old = this.openGadgets[indicator][1][1]
+                this.modelAndNot(this.wallName(label, c), old, indicator, -1)
+            this.modelAndNot(this.wallName(label, c), this.conjunction(chain+[pred], c), indicator)
+        if len(chain) == 0:
+            for c in range(0, this.numLabels-1):
+                this.addIndicator(c, this.oName(label, c), this.countedIndicators(c))
+        chain.append(pred)
+
+    def addLabel(this):
+        """! Adds a label without predecessors and the position it needs"""
+        penalty = this.penalty('permutation')
+        label = this.numLabels
+        this.numLabels += 1
+        this.chains[label] = []
+        last = this.numLabels-2 #The new column of walls
+        for i in range(0, this.numLabels):
+            for j in range(0, this.numLabels-1):
+                if i == label or j == last:
+                    this.fixWall(i, j)
+
+        #Each label is opened once: d(i,j) => d(i,j+1)
+        for i in range(0, this.numLabels):
+            for j in (range(0, last) if i == label else range(last-1, last)):
+                if j >= 0:
+                    this.addLinear(this.wallName(i,j), penalty)
+                    this.addQuadratic(this.wallName(i,j), this.wallName(i,j+1), -penalty)
+
+        #Exactly j+1 pallets are opened at position j: The new label joins the old rows, the new row is complete
+        for j in range(0, this.numLabels-1):
+            members = range(0, this.numLabels) if j == last else [label]
+            for i in members:
+                iName = this.wallName(i,j)
+                this.addLinear(iName, (1-2*(j+1))*penalty)
+                for i2 in range(0, this.numLabels):
+                    if i2 != i and (j != last or i2 > i):
+                        this.addQuadratic(iName, this.wallName(i2,j), 2*penalty)
+            if j == last:
+                this.bqm.offset += (j+1)**2*penalty
+
+        for other, chain in this.chains.items():
+            if len(chain) > 0:
+                this.modelAndNot(this.wallName(other, last), this.conjunction(chain, last), this.oName(other, last))
+        this.addInequality(last)
+
+    def appendBin(this, s, label):
+        """! Appends a bin to the tail of a sequence and updates the bqm
+
+        @param s Index of the sequence. len(sequences) starts a new sequence
+        @param label Label of the bin. New labels have to be the number of labels so far
+        @returns False if the bqm can't be updated because w needs more bits. Nothing is changed then
+        """
+        if label > this.numLabels or s > len(this.sequences):
+            raise ValueError('Labels have to be numbered consecutively and sequences appended one at a time')
+        if label == this.numLabels and math.floor(math.log(this.numLabels+1,2))+1 != this.auxSize:
+            return False
+
+        if s == len(this.sequences):
+            this.sequences.append([])
+        earlier = sorted(set(this.sequences[s]) - {label})
+        this.sequences[s].append(label)
+        if label == this.numLabels:
+            this.addLabel()
+        for pred in earlier:
+            if (pred, label) not in this.edges:
+                this.edges.add((pred, label))
+                this.sequenceGraph.append((pred, label))
+                this.addPredecessor(label, pred)
+        return True
+
+    def commit(this, labels):
+        """! Opens the pallets of the labels at the next positions and fixes the walls that follow from that"""
+        for label in labels:
+            if label in this.committed:
+                raise ValueError('The pallet of label '+str(label)+' is already committed')
+            this.committed.append(label)
+            for other in range(0, this.numLabels):
+                this.fixWall(other, len(this.committed)-1)
+            for j in range(0, this.numLabels-1):
+                this.fixWall(label, j)
+
+class RollingHorizon:
+    """! Solves a stream of bin arrivals. Every solve is warm started from the best plan found so far"""
+
+    def __init__(this, sequences, penaltyMul=50, penaltyScales=None, backend='SA', num_reads=100, recorder=None, **args):
+        """! Generates the model of the initial sequences
+
+        @param sequences Initial sequences. The labels have to be 0 to the number of labels-1
+        @param penaltyMul Value to mutiply the minimum possible penalty for violation of constraints by
+        @param penaltyScales Optional per constraint family penalty factors, see penaltyCalibration
+        @param backend Name of the backend to sample with, see backends
+        @param num_reads Number of samples per solve
+        @param recorder Optional instrumentation.Recorder that records every update and solve
+        @param **args Additional keyword arguments are forwarded to the sampler
+        """
+        this.recorder = recorderOrNull(recorder)
+        this.penaltyMul = penaltyMul
+        this.penaltyScales = penaltyScales
+        this.backend = backend
+        this.num_reads = num_reads
+        this.args = args
+        this.sampler = None
+        this.best = None #Best opening order so far
+        with this.recorder.stage('build') as record:
+            this.generator = IncrementalPalletGenerator(sequences, penaltyMul, penaltyScales)
+            record['variables'] = len(this.generator.bqm)
+
+    def append(this, s, label):
+        """! Appends a bin with the given label to sequence s, see IncrementalPalletGenerator.appendBin()"""
+        with this.recorder.stage('append', this.generator.bqm, sequence=s, label=label) as record:
+            record['rebuilt'] = not this.generator.appendBin(s, label)
+            if record['rebuilt']:
+                sequences = [list(sequence) for sequence in this.generator.sequences]
+                if s == len(sequences):
+                    sequences.append([])
+                sequences[s].append(label)
+                this.rebuild(sequences)
+
+    def rebuild(this, sequences):
+        """! Replaces the generator by a new one of the sequences and commits the committed pallets again"""
+        committed = this.generator.committed
+        this.generator = IncrementalPalletGenerator(sequences, this.penaltyMul, this.penaltyScales)
+        this.generator.commit(committed)
+
+    def commit(this, count):
+        """! Commits the next count pallets of the best plan so far
+
+        @returns The labels of the committed pallets
+        """
+        order = this.seedOrder()
+        done = len(this.generator.committed)
+        labels = order[done:done+count]
+        with this.recorder.stage('commit', this.generator.bqm, count=len(labels)):
+            this.generator.commit(labels)
+        return labels
+
+    def seedOrder(this):
+        """! Returns the best opening order so far extended by the labels that arrived since.
+        Before the first solve, the order of the heuristics is used. Committed pallets come first"""
+        generator = this.generator
+        order = this.best
+        if order is None:
+            order = heuristics.palletUpperBound(generator.sequences)[1]
+        order = generator.committed + [label for label in order if label not in generator.committed]
+        return order + [label for label in range(0, generator.numLabels) if label not in order]
+
+    def solve(this):
+        """! Samples the current model, starting from the seed order, and updates the best plan
+
+        @returns (best opening order, its number of stacking places w, sampleset)
+        """
+        generator = this.generator
+        seed = this.seedOrder()
+        state = generator.sampleFromOrder(seed)
+        backend = backends.get(this.backend)
+        if backend.structured:
+            args = dict(warmStart.reverseAnnealArgs(state), **this.args)
+        else:
+            args = dict(warmStart.annealWarmStartArgs(generator.bqm, state), **this.args)
+        if this.sampler is None:
+            this.sampler = backends.getSampler(this.backend)
+
+        with this.recorder.stage('solve', generator.bqm, num_reads=this.num_reads) as record:
+            sampleset = this.sampler.sample(generator.bqm, num_reads=this.num_reads, **args)
+            best = (heuristics.palletObjective(generator.sequences, seed), seed)
+            for sample in sampleset.lowest().samples():
+                order = generator.decodeOpeningOrder(sample)
+                if order is not None and order[:len(generator.committed)] == generator.committed:
+                    best = min(best, (heuristics.palletObjective(generator.sequences, order), order))
+            record['w'] = best[0]
+        this.best = best[1]
+        return best[1], best[0], sampleset
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+    from instrumentation import Recorder
+    from stacking import parseSequences
+
+    parser = argparse.ArgumentParser(description='Solve a stream of bin arrivals with a rolling horizon')
+    parser.add_argument('-s', type=str, action='store', dest='seqs',
+            metavar='Initial sequences. Entries are separated by commas. Sequences are separated by -.Labels are numbers', required = True)
+    parser.add_argument('-a', type=str, action='store', dest='arrivals',
+            metavar='Arrivals as sequence:label separated by commas. A solve follows every arrival', required = True)
+    parser.add_argument('-c', type=int, action='store', dest='commit', metavar='Pallets to commit after every solve', default=0)
+    parser.add_argument('-m', type=str, action='store', dest='method', choices=backends.names(), default='SA', help='Backend to use. '+backends.helpText())
+    parser.add_argument('-nr', type=int, action='store', dest='num_reads', metavar='Number of samples per solve', default=100)
+
+    args = parser.parse_args(sys.argv[1:])
+    recorder = Recorder()
+    horizon = RollingHorizon(parseSequences(args.seqs), backend=args.method, num_reads=args.num_reads, recorder=recorder)
+    print('Initial plan:', horizon.solve()[:2])
+    for arrival in args.arrivals.split(','):
+        s, label = arrival.split(':')
+        horizon.append(int(s), int(label))
+        order, w, _ = horizon.solve()
+        update = recorder.records[-2]
+        print('After {}: plan {} w={} update {:.2f}ms{}'.format(arrival, order, w, update['wall']*1000,
+                ' (rebuilt)' if update['rebuilt'] else ''))
+        if args.commit > 0:
+            print('Committed:', horizon.commit(args.commit))
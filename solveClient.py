@@ -0,0 +1,102 @@
+"""! Thin client of the solve daemon(see solveDaemon).
+
+Only the standard library is imported, so a request costs a connection and the solve itself instead of the imports
+and the generation of the bqm of a new process. The command line interface takes the flags of stacking.py and
+stackingPallet.py.
+
+Example:
+    python solveClient.py -s 0,1,2-2,1,0 -m SA -nr 100 -bounds
+    python solveClient.py -model bin -s 0,1,2,0-2,1,0,1 -m SA -nr 100 -db 2
+"""
+import json
+import socket
+
+#Default address of the daemon, see solveDaemon.DEFAULT_ADDRESS
+DEFAULT_ADDRESS = '/tmp/stackingSolveDaemon.sock'
+
+class SolveClient:
+    """! Connection to the daemon that can send any number of requests"""
+
+    def __init__(this, address=DEFAULT_ADDRESS, timeout=None):
+        """! Connects to the daemon
+
+        @param address Path of the Unix socket or host:port
+        @param timeout Timeout of the socket in seconds. None waits as long as the solve takes
+        """
+        host, _, port = address.rpartition(':')
+        if host != '' and port.isdigit() and '/' not in address:
+            this.socket = socket.create_connection((host, int(port)), timeout)
+        else:
+            this.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            this.socket.settimeout(timeout)
+            this.socket.connect(address)
+        this.reader = this.socket.makefile('rb')
+
+    def request(this, payload):
+        """! Sends one request and returns the response"""
+        this.socket.sendall((json.dumps(payload)+'\n').encode('utf-8'))
+        line = this.reader.readline()
+        if line == b'':
+            raise ConnectionError('The daemon closed the connection')
+        return json.loads(line)
+
+    def solve(this, sequences, model='pallet', method='SA', num_reads=100, **options):
+        """! Solves an instance, see solveDaemon for the options and the response"""
+        return this.request(dict(options, op='solve', sequences=sequences, model=model, method=method, num_reads=num_reads))
+
+    def close(this):
+        this.reader.close()
+        this.socket.close()
+
+    def __enter__(this):
+        return this
+
+    def __exit__(this, *args):
+        this.close()
+
+def request(payload, address=DEFAULT_ADDRESS, timeout=None):
+    """! Sends a single request over a new connection and returns the response"""
+    with SolveClient(address, timeout) as client:
+        return client.request(payload)
+
+def parseSequences(text):
+    """! Parses sequences in the format of stacking.parseSequences()"""
+    return [[int(x) for x in part.split(',')] for part in text.split('-')]
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description='Send a solve request to the solve daemon')
+    parser.add_argument('-s', type=str, action='store', dest='seqs',
+            metavar='Sequences. Entries are separated by commas. Sequences are separated by -.Labels are numbers')
+    parser.add_argument('-model', type=str, action='store', dest='model', choices=['pallet', 'bin'], default='pallet')
+    parser.add_argument('-m', type=str, action='store', dest='method', default='SA', help='Backend to use, see backends')
+    parser.add_argument('-nr', type=int, action='store', dest='num_reads', metavar='Number of samples to generate.', default=100)
+    parser.add_argument('-db', type=int, action='store', dest='dec_bound', metavar='Boundary for decision problem(bin model)', default=1)
+    parser.add_argument('-p', type=int, action='store', dest='penalty', metavar='Factor to multiply lowest possible penalty A by(pallet model)', default=50)
+    parser.add_argument('-enc', type=str, action='store', dest='encoding', default='onehot', help='Encoding of the plan variables')
+    parser.add_argument('-sym', action='store_true', dest='symmetry', help='Break the symmetries of the instance, see symmetry')
+    parser.add_argument('-ts', action='store_true', dest='tightSlack', help='Size the slacks from bounds on the counted labels')
+    parser.add_argument('-ws', action='store_true', dest='warmStart', help='Start from the plan of the classical heuristics')
+    parser.add_argument('-w', type=int, action='store', dest='workers', default=None, help='Number of processes the reads of SA are split across')
+    parser.add_argument('-seed', type=int, action='store', dest='seed', default=None)
+    parser.add_argument('-bounds', action='store_true', dest='bounds', help='Also return the lower and heuristic upper bound')
+    parser.add_argument('-op', type=str, action='store', dest='op', choices=['solve', 'bounds', 'ping', 'stats', 'shutdown'], default='solve')
+    parser.add_argument('-a', type=str, action='store', dest='address', default=DEFAULT_ADDRESS, help='Path of the Unix socket or host:port of the daemon')
+
+    args = parser.parse_args(sys.argv[1:])
+    payload = {'op':args.op}
+    if args.seqs is not None:
+        payload.update(sequences=parseSequences(args.seqs), model=args.model)
+    if args.op == 'solve':
+        if args.seqs is None:
+            parser.error('-s is required to solve')
+        payload.update(method=args.method, num_reads=args.num_reads, dec_bound=args.dec_bound, penaltyMul=args.penalty,
+                       encoding=args.encoding, symmetry=args.symmetry, tightSlack=args.tightSlack, warmStart=args.warmStart,
+                       seed=args.seed, bounds=args.bounds)
+        if args.workers is not None:
+            payload['workers'] = args.workers
+    response = request(payload, args.address)
+    print(json.dumps(response))
+    sys.exit(0 if response.get('ok') else 1)
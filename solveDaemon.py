@@ -0,0 +1,331 @@
+"""! Long running solve server that keeps imports, generators, embeddings, samplers and workers warm.
+
+The daemon listens on a Unix socket(or a TCP port of a loopback address, other hosts are rejected because the
+daemon has no authentication) and speaks JSON lines: every request is one JSON
+object on one line and gets one JSON object on one line as response. A connection may send any number of requests.
+
+Requests have an 'op' field, 'solve' if it is missing:
+  - solve: 'sequences' and optionally 'model'('pallet' or 'bin'), 'method'(backend, see backends), 'num_reads',
+    'dec_bound', 'penaltyMul', 'penaltyScales'(see penaltyCalibration), 'encoding', 'symmetry', 'tightSlack',
+    'warmStart', 'workers', 'seed', 'bounds' and 'params'(further keyword arguments of the sampler). The response contains the best valid order('order'), its objective('objective', w or
+    the number of stacking places, None without a valid sample), the lowest energy, the timing of the stages,
+    which caches were hit and, if 'bounds' is set, the lower and heuristic upper bound of the instance.
+  - bounds: The lower and upper bound of 'sequences' for 'model' without sampling, see lowerBounds
+  - ping, stats: Liveness and the sizes and hit counts of the caches
+  - shutdown: Stops the daemon after the response
+Errors, including requests that aren't JSON objects, are returned as {'ok': false, 'error': message}, the connection
+stays usable.
+
+Generators(with their bqms and bounds) and embeddings are kept in least recently used caches keyed by everything
+that changes the bqm. Solves are serialized, the sampling of one solve can use the persistent pool of workers
+(see parallelSA).
+
+Example:
+    python solveDaemon.py -a /tmp/stacking.sock -w 4
+    python solveClient.py -s 0,1,2-2,1,0 -m SA -nr 100
+"""
+import ipaddress
+import json
+import os
+import socketserver
+import stat
+import threading
+import time
+from collections import OrderedDict
+
+import heuristics
+import lowerBounds
+import parallelSA
+import backends
+from stacking import StackingQUBOGenerator
+from stackingPallet import PalletQUBOGenerator
+
+#Default address of the daemon
+DEFAULT_ADDRESS = '/tmp/stackingSolveDaemon.sock'
+
+#Default number of generators and embeddings that are cached
+CACHE_SIZE = 64
+
+#Host names of TCP addresses that are accepted besides loopback IP addresses
+LOOPBACK_HOSTS = ['localhost']
+
+class LRUCache:
+    """! Dict with a size limit that evicts the least recently used entries"""
+
+    def __init__(this, size=CACHE_SIZE):
+        this.size = size
+        this.entries = OrderedDict()
+        this.hits = 0
+        this.misses = 0
+
+    def get(this, key, build):
+        """! Returns the entry of the key, built with build() if it isn't cached
+
+        @returns (entry, whether it was cached)
+        """
+        if key in this.entries:
+            this.entries.move_to_end(key)
+            this.hits += 1
+            return this.entries[key], True
+        this.misses += 1
+        entry = build()
+        this.entries[key] = entry
+        if len(this.entries) > this.size:
+            this.entries.popitem(last=False)
+        return entry, False
+
+    def stats(this):
+        return {'entries':len(this.entries), 'hits':this.hits, 'misses':this.misses}
+
+def isLoopback(host):
+    """! Returns whether the host is a loopback address, so only processes of this machine can connect"""
+    if host in LOOPBACK_HOSTS:
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+def parseAddress(address):
+    """! Returns ('tcp', (host, port)) for addresses of the form host:port and ('unix', path) otherwise.
+    Raises ValueError for hosts that aren't loopback addresses, see isLoopback()"""
+    host, _, port = address.rpartition(':')
+    if host != '' and port.isdigit() and '/' not in address:
+        if not isLoopback(host):
+            raise ValueError('The daemon only listens on loopback addresses, not on '+host)
+        return 'tcp', (host, int(port))
+    return 'unix', address
+
+def removeSocket(path):
+    """! Removes the socket file at path if it exists. Raises FileExistsError if path is anything else"""
+    if not os.path.exists(path):
+        return
+    if not stat.S_ISSOCK(os.stat(path).st_mode):
+        raise FileExistsError(path+' exists and is not a socket')
+    os.remove(path)
+
+class SolveDaemon:
+    """! Answers the requests and owns the warm state"""
+
+    def __init__(this, workers=0, cacheSize=CACHE_SIZE):
+        """! Creates the daemon
+
+        @param workers Number of processes of the persistent pool for SA. 0 samples in the daemon process
+        @param cacheSize Number of generators and of embeddings that are cached
+        """
+        this.generators = LRUCache(cacheSize)
+        this.embeddings = LRUCache(cacheSize)
+        this.samplers = {}
+        this.workers = workers
+        this.executor = None
+        if workers > 1:
+            from concurrent.futures import ProcessPoolExecutor
+            this.executor = ProcessPoolExecutor(workers)
+        this.lock = threading.Lock()
+        this.requests = 0
+        this.started = time.time()
+
+    def close(this):
+        if this.executor is not None:
+            this.executor.shutdown()
+
+    def generatorKey(this, request):
+        """! Returns everything that changes the bqm of a solve request"""
+        model = request.get('model', 'pallet')
+        params = {'encoding':request.get('encoding', 'onehot'), 'penaltyScales':request.get('penaltyScales'),
+                  'symmetry':bool(request.get('symmetry', False)), 'tightSlack':bool(request.get('tightSlack', False))}
+        if model == 'pallet':
+            params['penaltyMul'] = request.get('penaltyMul', 50)
+        elif model == 'bin':
+            params['dec_bound'] = request.get('dec_bound', 1)
+        else:
+            raise ValueError('Unknown model '+str(model))
+        return json.dumps([model, request['sequences'], params], sort_keys=True)
+
+    def buildGenerator(this, request):
+        """! Returns a new generator of the request with its bqm"""
+        sequences = request['sequences']
+        params = {'penaltyScales':request.get('penaltyScales'), 'encoding':request.get('encoding', 'onehot'),
+                  'symmetry':bool(request.get('symmetry', False)), 'tightSlack':bool(request.get('tightSlack', False))}
+        if request.get('model', 'pallet') == 'pallet':
+            return PalletQUBOGenerator(sequences, penaltyMul=request.get('penaltyMul', 50), **params)
+        generator = StackingQUBOGenerator(sequences, request.get('dec_bound', 1), **params)
+        generator.generateBQM()
+        return generator
+
+    def bounds(this, model, sequences):
+        """! Returns the lower bound and the value of the heuristics of the instance"""
+        if model == 'pallet':
+            return {'lower':lowerBounds.palletLowerBound(sequences), 'upper':heuristics.palletUpperBound(sequences)[0]}
+        return {'lower':lowerBounds.binLowerBound(sequences), 'upper':heuristics.upperBound(sequences)[0]}
+
+    def sampler(this, method):
+        """! Returns the cached sampler of an unstructured backend or the unembedded sampler of a structured one"""
+        if method not in this.samplers:
+            this.samplers[method] = backends.getSampler(method, embed=False)
+        return this.samplers[method]
+
+    def embedding(this, key, bqm, sampler):
+        """! Returns the cached embedding of the bqm on the sampler
+
+        @returns (embedding, whether it was cached)
+        """
+        def find():
+            from batchSolve import embedBatch
+            chains, embedded = embedBatch([bqm], sampler.edgelist)
+            if embedded == 0:
+                raise ValueError('No embedding found')
+            return {var:chain for (_, var), chain in chains.items()}
+        return this.embeddings.get(key, find)
+
+    def decode(this, model, generator, sampleset):
+        """! Returns (order, objective) of the lowest energy sample that describes a valid plan or (None, None)"""
+        for sample in sampleset.samples():
+            if model == 'pallet':
+                order = generator.decodeOpeningOrder(sample)
+                if order is not None:
+                    return order, heuristics.palletObjective(generator.sequences, order)
+            else:
+                order = generator.decodeRemovalOrder(sample)
+                if order is not None:
+                    return order, heuristics.stackingPlaces(generator.sequences, order)
+        return None, None
+
+    def solve(this, request):
+        """! Answers a solve request"""
+        start = time.perf_counter()
+        model = request.get('model', 'pallet')
+        method = request.get('method', 'SA')
+        num_reads = request.get('num_reads', 100)
+        params = dict(request.get('params', {}))
+        key = this.generatorKey(request)
+
+        entry, generatorCached = this.generators.get(key, lambda: {'generator':this.buildGenerator(request)})
+        generator = entry['generator']
+        generated = time.perf_counter()
+
+        if request.get('warmStart', False):
+            import warmStart as ws
+            if backends.get(method).structured:
+                params = dict(ws.reverseAnnealArgs(ws.heuristicState(generator)), **params)
+            else:
+                params = dict(ws.annealWarmStartArgs(generator.bqm, ws.heuristicState(generator)), **params)
+
+        embeddingCached = None
+        if backends.get(method).structured:
+            from dwave.system import FixedEmbeddingComposite
+            child = this.sampler(method)
+            embedding, embeddingCached = this.embedding(key+method, generator.bqm, child)
+            sampleset = FixedEmbeddingComposite(child, embedding).sample(generator.bqm, num_reads=num_reads, **params)
+        else:
+            workers = request.get('workers', this.workers if this.workers > 1 else 1)
+            sampleset = parallelSA.sampleParallel(generator.bqm, num_reads, workers, method, request.get('seed'),
+                    this.executor if workers > 1 else None, **params)
+        sampled = time.perf_counter()
+
+        order, objective = this.decode(model, generator, sampleset)
+        response = {'ok':True, 'order':order, 'objective':objective, 'energy':float(sampleset.first.energy),
+                    'variables':len(generator.bqm), 'num_reads':int(sampleset.record.num_occurrences.sum()),
+                    'cached':{'generator':generatorCached, 'embedding':embeddingCached}}
+        if request.get('bounds', False):
+            if 'bounds' not in entry:
+                entry['bounds'] = this.bounds(model, request['sequences'])
+            response['bounds'] = entry['bounds']
+        response['timing'] = {'generate':generated-start, 'sample':sampled-generated, 'total':time.perf_counter()-start}
+        return response
+
+    def handle(this, request):
+        """! Returns the response to a request, see the module documentation"""
+        if not isinstance(request, dict):
+            return {'ok':False, 'error':'Request must be a JSON object, got '+type(request).__name__}
+        op = request.get('op', 'solve')
+        try:
+            if op == 'ping':
+                return {'ok':True}
+            if op == 'stats':
+                return {'ok':True, 'requests':this.requests, 'uptime':time.time()-this.started, 'workers':this.workers,
+                        'generators':this.generators.stats(), 'embeddings':this.embeddings.stats(), 'samplers':list(this.samplers)}
+            if op == 'bounds':
+                return dict(this.bounds(request.get('model', 'pallet'), request['sequences']), ok=True)
+            if op == 'solve':
+                with this.lock:
+                    this.requests += 1
+                    return this.solve(request)
+            if op == 'shutdown':
+                return {'ok':True}
+            raise ValueError('Unknown op '+str(op))
+        except Exception as error:
+            return {'ok':False, 'error':type(error).__name__+': '+str(error)}
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    """! Reads JSON lines from a connection and writes one response line per request"""
+
+    def handle(this):
+        for line in this.rfile:
+            if line.strip() == b'':
+                continue
+            try:
+                request = json.loads(line)
+            except ValueError as error:
+                request, response = {}, {'ok':False, 'error':'Invalid JSON: '+str(error)}
+            else:
+                response = this.server.solver.handle(request)
+            this.wfile.write((json.dumps(response)+'\n').encode('utf-8'))
+            this.wfile.flush()
+            if isinstance(request, dict) and request.get('op') == 'shutdown':
+                threading.Thread(target=this.server.shutdown).start()
+                return
+
+class UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+class TCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+def createServer(address=DEFAULT_ADDRESS, daemon=None):
+    """! Creates the server of the daemon. Call serve_forever() to answer requests
+
+    @param address Path of the Unix socket or host:port of a loopback address. An existing socket file is replaced,
+           other existing files raise FileExistsError
+    @param daemon The SolveDaemon. A new one without workers if omitted
+    """
+    kind, location = parseAddress(address)
+    if kind == 'unix':
+        removeSocket(location)
+        server = UnixServer(location, RequestHandler)
+    else:
+        server = TCPServer(location, RequestHandler)
+    server.solver = SolveDaemon() if daemon is None else daemon
+    return server
+
+def serve(address=DEFAULT_ADDRESS, workers=0, cacheSize=CACHE_SIZE):
+    """! Runs the daemon until it receives a shutdown request"""
+    daemon = SolveDaemon(workers, cacheSize)
+    server = createServer(address, daemon)
+    print('Listening on', address)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        daemon.close()
+        kind, location = parseAddress(address)
+        if kind == 'unix':
+            removeSocket(location)
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description='Answer solve requests over a local socket with warm caches')
+    parser.add_argument('-a', type=str, action='store', dest='address', default=DEFAULT_ADDRESS,
+            help='Path of the Unix socket or host:port of a loopback address to listen on')
+    parser.add_argument('-w', type=int, action='store', dest='workers', default=0, help='Number of processes of the worker pool for SA')
+    parser.add_argument('-c', type=int, action='store', dest='cacheSize', default=CACHE_SIZE, help='Number of cached generators and embeddings')
+
+    args = parser.parse_args(sys.argv[1:])
+    try:
+        parseAddress(args.address)
+    except ValueError as error:
+        parser.error(str(error))
+    serve(args.address, args.workers, args.cacheSize)
@@ -6,15 +6,29 @@
 ##
 import dimod
 import math
-from dwave.system import DWaveSampler, EmbeddingComposite
 import pickle
 from datetime import datetime
-from qaUtils import saveSampleset
-from neal.sampler import SimulatedAnnealingSampler
+from qaUtils import saveSampleset, evaluateGadgets, binaryDigits, inequalityCouplers
+from instrumentation import recorderOrNull, recordSamplesetTiming
+from resultCache import solveKey, cachedResult
+import backends
+import bqmKernels
+import chainBreak
+import parallelSA
+import rangeCompiler
+import symmetry
 import argparse
 import sys
 import time
 
+#Names of the constraint families whose penalties can be scaled independently
+PENALTY_FAMILIES = ['permutation', 'sequenceOrder', 'or', 'and', 'inequality']
+
+#Supported encodings of the removal time of a bin.
+#onehot: x(i,t) is 1 iff bin i is removed at step t
+#domainwall: d(i,t) is 1 iff bin i is removed at step t or earlier, the position of the wall is the removal time
+PLAN_ENCODINGS = ['onehot', 'domainwall']
+
 def iterN(items, n):
     """! Generator that iterates over a given collection in slices of size n.
     If len(items) is not divisible by n the last slice returned will contain
@@ -32,10 +46,23 @@ def iterN(items, n):
 class StackingQUBOGenerator:
     """! Class to convert an instance of the stacking problem to a QUBO Formulation of that instance."""
 
-    def __init__(this, sequences, dec_bound=1):
+    def __init__(this, sequences, dec_bound=1, penaltyScales=None, encoding='onehot', recorder=None, symmetry=False, tightSlack=False):
         """! Initialize the generator
         @param sequences List of sequences. Each sequence lists the labels of the bins it contains
+        @param dec_bound Boundary for the decision problem
+        @param penaltyScales Optional dict mapping names from PENALTY_FAMILIES to factors the penalty
+               of that constraint family is multiplied by. Missing families use the full penalty
+        @param encoding Encoding of the plan variables, one of PLAN_ENCODINGS
+        @param recorder Optional instrumentation.Recorder that records the stages of generateBQM()
+        @param symmetry Break the symmetries of identical sequences and repeated labels, see symmetry
+        @param tightSlack Size p and the slack of every step from bounds on the number of open labels instead of
+               auxSize bits each, see sizeSlacks()
         """
+        if encoding not in PLAN_ENCODINGS:
+            raise ValueError('Unknown encoding '+str(encoding))
+        this.encoding = encoding
+        this.recorder = recorderOrNull(recorder)
+        this.sequences = sequences
         this.bqm = dimod.BinaryQuadraticModel(dimod.Vartype.BINARY) #The resulting matrix
 
         i = 0; #Sequence index
@@ -69,20 +96,48 @@ class StackingQUBOGenerator:
         this.boolVarCount = 0
 
         this.planCount = this.binCount**2
+        if this.encoding == 'domainwall':
+            #The wall of every bin is behind the last step, so d(i,binCount-1) is always 1 and not modeled
+            this.planCount = this.binCount*(this.binCount-1)
+
+        this.toFix = {} #Maps (index, time) of fixed plan variables to their value
+        this.symmetry = symmetry
+        this.contractions = [] #Pairs of plan variables that are contracted after fixing, see symmetry.breakBinSymmetries()
+        this.aliases = {} #Maps contracted plan variables to the variable they were contracted into
 
-        this.toFix = {}
+        #Boolean expressions in the order they are modeled, see qaUtils.evaluateGadgets()
+        this.gadgets = []
+        this.fVariables = set() #Names of the modeled f(t,c), see countedLabels()
 
         #The request for the decision problem version, e.g. dec_bound=2: Can these sequences be stacked with 2 stacking places?
         #Values lower than dec_bound then only confirm that stacking with 2 stacking places is possible
         this.dec_bound = dec_bound
+
+        this.penaltyScales = {}
+        if penaltyScales is not None:
+            this.penaltyScales.update(penaltyScales)
+
+        #Steps whose stacking places are counted, the number of bits of p and of the slack of every step
+        this.inequalitySteps = list(range(this.dec_bound, this.binCount-(this.dec_bound+1)))
+        this.objectiveSize = this.auxSize
+        this.slackSizes = {c:this.auxSize for c in this.inequalitySteps}
+        this.tightSlack = tightSlack
+        if tightSlack:
+            this.sizeSlacks()
+
+    def penalty(this, family):
+        """! Return the penalty used for the constraints of the given family
+             @param family One of PENALTY_FAMILIES
+        """
+        return this.penaltyFactor*this.penaltyScales.get(family, 1)
     
     def generateLinears(this):
         """! Helper function to generate every linear entry according to binCount.
         Mostly useful for testing."""
 
         for elem in range(0, this.binCount):
-            for time in range(0, this.binCount):
-                this.bqm.add_variable(this.variableName(elem,time),0)
+            for time in range(0, this.planSteps()):
+                this.bqm.add_variable(this.planVariableName(elem,time),0)
 
     def variableName(this, index, time):
         """! Return the name of the bin with the given index at the given time
@@ -91,7 +146,44 @@ class StackingQUBOGenerator:
         """
 
         return 'x('+str(index)+','+str(time)+')'
-    
+
+    def wallName(this, index, time):
+        """! Return the name of the domain wall variable which is 1 iff the bin with the given index
+        is removed at the given time or earlier
+             @param index The index of the bin
+             @param time The step in the plan
+        """
+
+        return 'd('+str(index)+','+str(time)+')'
+
+    def planVariableName(this, index, time):
+        """! Return the name of the plan variable of the bin with the given index and time in the used encoding"""
+        if this.encoding == 'domainwall':
+            return this.wallName(index, time)
+        return this.variableName(index, time)
+
+    def planSteps(this):
+        """! Return the number of steps that have plan variables in the used encoding"""
+        if this.encoding == 'domainwall':
+            return this.binCount-1
+        return this.binCount
+
+    def oneHotGroups(this):
+        """! Return the groups of plan variables of which exactly one is 1 in every valid sample(the bins at every step
+        and the steps of every bin), as lists of variable names of the bqm, see chainBreak.
+        Fixed variables are left out, groups with a variable fixed to 1 are dropped. Empty for the domain wall encoding"""
+        if this.encoding == 'domainwall':
+            return []
+        groups = [[(index, time) for time in range(0, this.binCount)] for index in range(0, this.binCount)]
+        groups += [[(index, time) for index in range(0, this.binCount)] for time in range(0, this.binCount)]
+        res = []
+        for group in groups:
+            if any(this.toFix.get(var) == 1 for var in group):
+                continue
+            names = [this.variableName(index, time) for index, time in group if (index, time) not in this.toFix]
+            res.append(list(dict.fromkeys(this.aliases.get(name, name) for name in names)))
+        return res
+
     def fName(this, label, time):
         """!Returns the variable containing the result of f(label,time)
         """
@@ -115,12 +207,38 @@ class StackingQUBOGenerator:
             #Constraint term: a v b = c => a+b+c+ab-2ac-2bc
             if auxName not in this.bqm.variables:
                 this.boolVarCount += 1
-                this.bqm.add_variable(pair[0], this.penaltyFactor)
-                this.bqm.add_variable(pair[1], this.penaltyFactor)
-                this.bqm.add_variable(auxName, this.penaltyFactor)
-                this.bqm.add_interaction(pair[0], pair[1], this.penaltyFactor)
-                this.bqm.add_interaction(pair[0], auxName, -2*this.penaltyFactor)
-                this.bqm.add_interaction(pair[1], auxName, -2*this.penaltyFactor)
+                this.gadgets.append(('or', pair, auxName))
+                penalty = this.penalty('or')
+                this.bqm.add_variable(pair[0], penalty)
+                this.bqm.add_variable(pair[1], penalty)
+                this.bqm.add_variable(auxName, penalty)
+                this.bqm.add_interaction(pair[0], pair[1], penalty)
+                this.bqm.add_interaction(pair[0], auxName, -2*penalty)
+                this.bqm.add_interaction(pair[1], auxName, -2*penalty)
+        return values[0]
+
+    def generateAnd(this, values):
+        """! Models an AND statement over the given values. Up to len(values) auxiliary variables will be created.
+      
+        @param values The values in the and statement
+
+        @result The name of the auxiliary variable containing the result of the expression
+        """
+        while(len(values)>1):
+            pair = []
+            pair.append(values.pop(0))
+            pair.append(values.pop(0))
+            auxName = str(pair[0])+'and'+str(pair[1])
+            values.insert(0,auxName)
+            #Constraint term: a ^ b = c => ab-2ac-2bc+3c
+            if auxName not in this.bqm.variables:
+                this.boolVarCount += 1
+                this.gadgets.append(('and', pair, auxName))
+                penalty = this.penalty('and')
+                this.bqm.add_interaction(pair[0], pair[1], penalty)
+                this.bqm.add_interaction(pair[0], auxName, -2*penalty)
+                this.bqm.add_interaction(pair[1], auxName, -2*penalty)
+                this.bqm.add_variable(auxName, 3*penalty)
         return values[0]
                     
             
@@ -135,6 +253,10 @@ class StackingQUBOGenerator:
         if this.dec_bound >= len(this.byLabel):
             return
 
+        if this.encoding == 'domainwall':
+            this.fDomainWall(t)
+            return
+
         timeSubs = []
         for c in range(0, this.binCount):
             values = []
@@ -147,7 +269,7 @@ class StackingQUBOGenerator:
                 #This is neccessary to identify the blocks correctly
                 timeSubs.append('s')
             
-        for c in range(this.dec_bound,this.binCount-(1+this.dec_bound)):
+        for c in this.inequalitySteps:
             #a AND b is simply modeled by a*b
             #Constraint for c = ab : ab-2ac-2bc+3c
             varName = 'f('+str(t)+','+str(c)+')'
@@ -162,21 +284,94 @@ class StackingQUBOGenerator:
             rightList.reverse() #Fewer auxilliary variables
             rightTerm = this.generateOr(rightList)
             
-            this.bqm.add_interaction(leftTerm, rightTerm, this.penaltyFactor)
-            this.bqm.add_interaction(leftTerm, varName, -2*this.penaltyFactor)
-            this.bqm.add_interaction(rightTerm, varName, -2*this.penaltyFactor)
-            this.bqm.add_variable(varName, 3*this.penaltyFactor)
+            this.gadgets.append(('and', [leftTerm, rightTerm], varName))
+            penalty = this.penalty('and')
+            this.bqm.add_interaction(leftTerm, rightTerm, penalty)
+            this.bqm.add_interaction(leftTerm, varName, -2*penalty)
+            this.bqm.add_interaction(rightTerm, varName, -2*penalty)
+            this.bqm.add_variable(varName, 3*penalty)
+            this.fVariables.add(varName)
+            this.boolVarCount += 1
+
+    def fDomainWall(this, t):
+        """! Generate term for f(t,c) if the plan is domain wall encoded. See also f().
+        The label has been started at time c iff the first bin of the label in any sequence has been removed
+        and it is finished iff the last bin of the label in every sequence has been removed.
+        Since bins are removed in sequence order no other bins need to be considered.
+
+        @param t Label"""
+        firsts = []
+        lasts = []
+        for sequence in this.bySequence:
+            inSequence = [index for index in sequence if index in this.byLabel[t]]
+            if len(inSequence) > 0:
+                firsts.append(inSequence[0])
+                lasts.append(inSequence[-1])
+
+        penalty = this.penalty('and')
+        for c in this.inequalitySteps:
+            varName = this.fName(t, c)
+
+            started = [this.wallName(index, c) for index in firsts if this.toFix.get((index,c)) != 0]
+            if len(started) <= 0:
+                continue #Can't be started, f(t,c) is minimized to 0 by the inequalities
+            if any(this.toFix.get((index,c)) == 1 for index in firsts):
+                started = None #Is always started
+
+            finished = [this.wallName(index, c) for index in lasts if this.toFix.get((index,c)) != 1]
+            if any(this.toFix.get((index,c)) == 0 for index in lasts):
+                finished = None #Can't be finished
+            elif len(finished) <= 0:
+                continue #Is always finished
+
+            if started is not None and started == finished and len(started) == 1:
+                continue #A single bin is started and finished at once, f = a AND NOT a is always 0
+
+            if started is None and finished is None:
+                #f = 1 => 1-f
+                this.gadgets.append(('one', [], varName))
+                this.bqm.add_variable(varName, -penalty)
+                this.bqm.offset += penalty
+            elif started is None:
+                #f = NOT b => 1-f-b+2fb
+                finishedTerm = this.generateAnd(finished)
+                this.gadgets.append(('not', [finishedTerm], varName))
+                this.bqm.add_variable(varName, -penalty)
+                this.bqm.add_variable(finishedTerm, -penalty)
+                this.bqm.add_interaction(varName, finishedTerm, 2*penalty)
+                this.bqm.offset += penalty
+            elif finished is None:
+                #f = a => f+a-2fa
+                startedTerm = this.generateOr(started)
+                this.gadgets.append(('copy', [startedTerm], varName))
+                this.bqm.add_variable(varName, penalty)
+                this.bqm.add_variable(startedTerm, penalty)
+                this.bqm.add_interaction(varName, startedTerm, -2*penalty)
+            else:
+                #f = a AND NOT b => f+a-ab-2af+2bf
+                startedTerm = this.generateOr(started)
+                finishedTerm = this.generateAnd(finished)
+                this.gadgets.append(('andnot', [startedTerm, finishedTerm], varName))
+                this.bqm.add_variable(varName, penalty)
+                this.bqm.add_variable(startedTerm, penalty)
+                this.bqm.add_interaction(startedTerm, finishedTerm, -penalty)
+                this.bqm.add_interaction(startedTerm, varName, -2*penalty)
+                this.bqm.add_interaction(finishedTerm, varName, 2*penalty)
+            this.fVariables.add(varName)
             this.boolVarCount += 1
     
-    def squareAux(this, auxName, factor=1):
+    def squareAux(this, auxName, factor=1, size=None):
         """! Calculate the square of an auxiliary variable,
         which is a natural number represented by multiple qubits
         in binary notation.
+
+        @param size Number of bits of the variable, auxSize if omitted
         """
         auxName+='_'
-        for i in range(0, this.auxSize):
+        size = this.auxSize if size is None else size
+        for i in range(0, size):
             this.bqm.add_variable(auxName+str(i), (pow(2, i)**2)*factor)
-            for j in range(i+1, this.auxSize):
+            for j in range(i+1, size):
                 this.bqm.add_interaction(auxName+str(i), auxName+str(j), pow(2,i+j+1)*factor)
 
     def sequenceOrderForSequence(this, time, sequence):
@@ -189,22 +384,27 @@ class StackingQUBOGenerator:
                         #If an element is removed at time t 
                         #elements later in the sequence can't be removed earlier than t
                         this.bqm.add_interaction(this.variableName(sequence[i], laterTime), 
-                                this.variableName(elem, time), this.penaltyFactor)
+                                this.variableName(elem, time), this.penalty('sequenceOrder'))
     
     def permutationConstraint(this):
         """! Models the PERMUTATION constraint, which ensures that 
         Each bin is only removed once and only one removal is performed
         at each point in time
         """
+        if this.encoding == 'domainwall':
+            this.domainWallPermutationConstraint()
+            return
+
         #Exactly one true over each bin(each bin only gets removed once)
         #Exactly one true term: abcd => (-a-b-c-d+2ab+2ac+2ad+2bc+2bd+2cd+1)
         #This term has a constant, meaning that that minimum energy will be reduced by -n
+        penalty = this.penalty('permutation')
         for elem in range(0, this.binCount):
             for i in range(0, this.binCount):
                 iName = this.variableName(elem,i)
-                this.bqm.add_variable(iName, -this.penaltyFactor)
+                this.bqm.add_variable(iName, -penalty)
                 for  j in range(i+1, this.binCount):
-                    this.bqm.add_interaction(iName, this.variableName(elem, j), 2*this.penaltyFactor)
+                    this.bqm.add_interaction(iName, this.variableName(elem, j), 2*penalty)
 
         #Exactly one true over each time(only one bin gets removed at each point in time)
         #This loop has the same structure as the one above, so they could be combined
@@ -212,17 +412,49 @@ class StackingQUBOGenerator:
         for time in range(0, this.binCount):
             for i in range(0, this.binCount):
                 iName = this.variableName(i,time)
-                this.bqm.add_variable(iName, -this.penaltyFactor)
+                this.bqm.add_variable(iName, -penalty)
                 for j in range(i+1, this.binCount):
-                    this.bqm.add_interaction(iName, this.variableName(j, time), 2*this.penaltyFactor)
+                    this.bqm.add_interaction(iName, this.variableName(j, time), 2*penalty)
 
-        this.bqm.offset = 2*this.binCount*this.penaltyFactor
+        this.bqm.offset = 2*this.binCount*penalty
+
+    def domainWallPermutationConstraint(this):
+        """! Models the PERMUTATION constraint for domain wall encoded plans.
+        The wall constraint ensures that d(i,t) never falls back to 0 after it was 1, so each bin is removed exactly once.
+        The count constraint ensures that exactly t+1 bins have been removed after step t,
+        so only one removal is performed at each point in time.
+        """
+        penalty = this.penalty('permutation')
+        #Wall: d(i,t) => d(i,t+1): d(i,t)-d(i,t)d(i,t+1)
+        for elem in range(0, this.binCount):
+            for time in range(0, this.binCount-2):
+                this.bqm.add_variable(this.wallName(elem, time), penalty)
+                this.bqm.add_interaction(this.wallName(elem, time), this.wallName(elem, time+1), -penalty)
+
+        #Count: (sum_i d(i,t) - (t+1))^2
+        for time in range(0, this.binCount-1):
+            for i in range(0, this.binCount):
+                iName = this.wallName(i, time)
+                this.bqm.add_variable(iName, (1-2*(time+1))*penalty)
+                for j in range(i+1, this.binCount):
+                    this.bqm.add_interaction(iName, this.wallName(j, time), 2*penalty)
+            this.bqm.offset += (time+1)**2*penalty
 
     def sequenceOrder(this):
         """! Models the SEQUENCE_ORDER constraint.
         This constraint ensures, that the bins of each
         sequence are removed in order.
         """
+        if this.encoding == 'domainwall':
+            #Consecutive bins suffice: The later bin can't be removed before the earlier one, d(b,t) => d(a,t)
+            penalty = this.penalty('sequenceOrder')
+            for sequence in this.bySequence:
+                for i in range(0, len(sequence)-1):
+                    for time in range(0, this.binCount-1):
+                        this.bqm.add_variable(this.wallName(sequence[i+1], time), penalty)
+                        this.bqm.add_interaction(this.wallName(sequence[i], time), this.wallName(sequence[i+1], time), -penalty)
+            return
+
         for time in range(0, this.binCount-1):
             for sequence in this.bySequence:
                 this.sequenceOrderForSequence(time, sequence) 
@@ -237,31 +469,83 @@ class StackingQUBOGenerator:
         the highest number of stacking places required at the same time
         """
 
-        for c in range(this.dec_bound, this.binCount-(this.dec_bound+1)):
+        penalty = this.penalty('inequality')
+        for c in this.inequalitySteps:
             #Square sum_t(f(t,c))
-            for i in range(0, len(this.byLabel)):
-                iLabel = this.labels[i]
-                this.bqm.add_variable(this.fName(iLabel, c), this.penaltyFactor)
-                for j in range(i+1, len(this.byLabel)):
-                    jLabel = this.labels[j]
-                    this.bqm.add_interaction(this.fName(iLabel,c),this.fName(jLabel,c), 2*this.penaltyFactor)
-
-            this.squareAux('s'+str(c), this.penaltyFactor)
-            this.squareAux('p', this.penaltyFactor)
+            labels = this.countedLabels(c)
+            for i in range(0, len(labels)):
+                iLabel = labels[i]
+                this.bqm.add_variable(this.fName(iLabel, c), penalty)
+                for j in range(i+1, len(labels)):
+                    jLabel = labels[j]
+                    this.bqm.add_interaction(this.fName(iLabel,c),this.fName(jLabel,c), 2*penalty)
+
+            this.squareAux('s'+str(c), penalty, this.slackSizes[c])
+            this.squareAux('p', penalty, this.objectiveSize)
             
             #This could be done in the upper loop but doing it here makes the code easier to read
-            for label in this.byLabel:
-                for i in range(0, this.auxSize):
-                    this.bqm.add_interaction(this.fName(label,c),'s'+str(c)+'_'+str(i), this.penaltyFactor*2*pow(2,i))
-                    this.bqm.add_interaction(this.fName(label,c),'p_'+str(i), -this.penaltyFactor*2*pow(2,i))
+            for label in labels:
+                for i in range(0, this.slackSizes[c]):
+                    this.bqm.add_interaction(this.fName(label,c),'s'+str(c)+'_'+str(i), penalty*2*pow(2,i))
+                for i in range(0, this.objectiveSize):
+                    this.bqm.add_interaction(this.fName(label,c),'p_'+str(i), -penalty*2*pow(2,i))
+
+            for i in range(0, this.slackSizes[c]):
+                for j in range(0, this.objectiveSize):
+                    this.bqm.add_interaction('s'+str(c)+'_'+str(i), 'p_'+str(j), -penalty*2*pow(2,i)*pow(2,j))
+
+    def countedLabels(this, c):
+        """! Return the labels whose f(t,c) is summed up at step c. All labels, with tightSlack only the labels
+        f() modeled f(t,c) for, the others can't require a stacking place at step c"""
+        if not this.tightSlack:
+            return this.labels
+        return [label for label in this.labels if this.fName(label, c) in this.fVariables]
+
+    def openLabelBounds(this):
+        """! Return a dict that maps every step c to a lower and an upper bound on the number of labels that require a
+        stacking place at step c in every valid plan. The bounds follow from the steps every bin can be removed at
+        (see fixPlanVariables()): A label can only be open if one of its bins can be removed at c or earlier and one
+        after c and it has to be open if one of its bins has to be removed at c or earlier and one after c.
+        At most c+1 bins are removed and binCount-c-1 bins remain, every open label needs one of each"""
+        earliest = {}
+        latest = {}
+        for sequence in this.bySequence:
+            for i, index in enumerate(sequence):
+                earliest[index] = i
+                latest[index] = this.binCount-len(sequence)+i
 
-            for i in range(0, this.auxSize):
-                for j in range(0, this.auxSize):
-                    this.bqm.add_interaction('s'+str(c)+'_'+str(i), 'p_'+str(j), -this.penaltyFactor*2*pow(2,i)*pow(2,j))
+        res = {}
+        for c in range(0, this.binCount):
+            lower = 0
+            upper = 0
+            for indices in this.byLabel.values():
+                if len(indices) < 2:
+                    continue
+                if min(earliest[index] for index in indices) <= c < max(latest[index] for index in indices):
+                    upper += 1
+                if min(latest[index] for index in indices) <= c < max(earliest[index] for index in indices):
+                    lower += 1
+            res[c] = (lower, min(upper, c+1, this.binCount-c-1))
+        return res
+
+    def sizeSlacks(this):
+        """! Size the numbers of the inequalities from openLabelBounds() instead of using auxSize bits for each.
+        Steps with at most dec_bound open labels aren't counted, like the steps outside of
+        [dec_bound, binCount-dec_bound-2]. p only has to reach the largest upper bound P of the counted steps and the
+        slack of step c is p minus the open labels, so it needs the bits of P minus the lower bound of step c.
+        The slack can't be narrowed to the upper bound of its own step, it is p at steps without open labels"""
+        bounds = this.openLabelBounds()
+        this.inequalitySteps = [c for c in range(this.dec_bound, this.binCount-(this.dec_bound+1)) if bounds[c][1] > this.dec_bound]
+        most = max((bounds[c][1] for c in this.inequalitySteps), default=0)
+        this.objectiveSize = max(1, most.bit_length())
+        this.slackSizes = {c:(most-bounds[c][0]).bit_length() for c in this.inequalitySteps}
 
-    
     def fixPlanVariables(this):
         """!Fixes plan variables that can never be 1 because of their position in the sequence"""
+        if this.encoding == 'domainwall':
+            this.fixWallVariables()
+            return
+
         fixed = 0
         for sequence in this.bySequence:
             #A bin that's after the first position can't be removed on the first step and so on
@@ -270,7 +554,7 @@ class StackingQUBOGenerator:
                 for c in range(0, i):
                     #this.bqm.fix_variable(this.variableName(index,c), 0)
                     this.planCount -= 1
-                    this.toFix[(index,c)] = True
+                    this.toFix[(index,c)] = 0
                     fixed+=1
             #By the same logic, the first bin has to be removed at the latest after the other sequences are exhausted and so on
             binsOutsideSequence = this.binCount - len(sequence)
@@ -278,23 +562,50 @@ class StackingQUBOGenerator:
                 for c in range(binsOutsideSequence+i+1, this.binCount):
                     #this.bqm.fix_variable(this.variableName(index, c), 0)
                     this.planCount -= 1
-                    this.toFix[(index,c)] = True
+                    this.toFix[(index,c)] = 0
                     fixed += 1
         #print("Fixed", fixed)
 
-    def generateBQM(this):
-        this.permutationConstraint()
-        this.fixPlanVariables()
-        this.sequenceOrder()
-        this.ftcConstraint()
-        this.countStackingPlacesConstraint()
+    def fixWallVariables(this):
+        """!Fixes domain wall variables whose value is determined by the position of the bin in its sequence"""
+        for sequence in this.bySequence:
+            binsOutsideSequence = this.binCount - len(sequence)
+            for i, index in enumerate(sequence):
+                #The bin at position i can't be removed before step i
+                for c in range(0, min(i, this.binCount-1)):
+                    this.planCount -= 1
+                    this.toFix[(index,c)] = 0
+                #and is removed at step binsOutsideSequence+i at the latest
+                for c in range(binsOutsideSequence+i, this.binCount-1):
+                    this.planCount -= 1
+                    this.toFix[(index,c)] = 1
 
-        for var in this.toFix:
-            this.bqm.fix_variable(this.variableName(var[0],var[1]),0)
+    def generateBQM(this):
+        with this.recorder.stage('permutationConstraint', this.bqm):
+            this.permutationConstraint()
+        with this.recorder.stage('fixPlanVariables', this.bqm):
+            this.fixPlanVariables()
+        if this.symmetry:
+            with this.recorder.stage('symmetryBreaking', this.bqm):
+                symmetry.breakBinSymmetries(this)
+        with this.recorder.stage('sequenceOrder', this.bqm):
+            this.sequenceOrder()
+        with this.recorder.stage('ftcConstraint', this.bqm):
+            this.ftcConstraint()
+        with this.recorder.stage('countStackingPlacesConstraint', this.bqm):
+            this.countStackingPlacesConstraint()
+
+        with this.recorder.stage('fixVariables', this.bqm, fixed=len(this.toFix)):
+            for var, value in this.toFix.items():
+                this.bqm.fix_variable(this.planVariableName(var[0],var[1]),value)
+        if this.symmetry:
+            with this.recorder.stage('contractBins', this.bqm, contracted=len(this.contractions)):
+                symmetry.contractBins(this)
 
         #Optimize p(Number of stacking places)
-        for i in range(0, this.auxSize):
-            this.bqm.add_variable('p_'+str(i), pow(2,i))
+        with this.recorder.stage('objective', this.bqm):
+            for i in range(0, this.objectiveSize):
+                this.bqm.add_variable('p_'+str(i), pow(2,i))
 
     def breakDownVariables(this):
         """! Output a breakdown of how many variables are created for what purpose"""
@@ -303,54 +614,264 @@ class StackingQUBOGenerator:
         coreCount = this.planCount
         print("Number of plan variables: " + str(coreCount))
         varCount -= coreCount
-        auxCount = (this.binCount-2*this.dec_bound)*this.auxSize
+        auxCount = this.objectiveSize + sum(this.slackSizes.values())
         print("Number of variables that model numbers: " + str(auxCount))
         varCount -= auxCount
         print("Number of variables that model OR and AND statements: " + str(this.boolVarCount))
+        saved = {}
+        if this.tightSlack:
+            uniformSteps = range(this.dec_bound, this.binCount-(this.dec_bound+1))
+            saved['savedNumbers'] = (len(uniformSteps)+1)*this.auxSize - auxCount
+            saved['savedCouplers'] = (inequalityCouplers({c:len(this.labels) for c in uniformSteps}, {c:this.auxSize for c in uniformSteps}, this.auxSize)
+                    - inequalityCouplers({c:len(this.countedLabels(c)) for c in this.inequalitySteps}, this.slackSizes, this.objectiveSize))
+            print("Saved by tight slack sizing: " + str(saved['savedNumbers']) + " number variables, " + str(saved['savedCouplers']) + " couplers of the inequalities")
+        this.recorder.add('breakDownVariables', total=len(this.bqm), plan=coreCount, numbers=auxCount, boolean=this.boolVarCount, **saved)
+
+    def compiledBQM(this, labels=None, refresh=False):
+        """! Returns the bqm in compressed sparse form for batched energies and flip deltas, see bqmKernels.
+        The compiled form is cached until the bqm changes
+
+        @param labels Optional order of the columns, e.g. the variables of a sampleset
+        @param refresh Compile even if the bqm didn't change, see bqmKernels.fingerprint()
+        """
+        return bqmKernels.compiled(this, this.bqm, labels, refresh)
+
+    def decodeRemovalOrder(this, sample):
+        """! Returns the bins in the order the given sample removes them,
+        or None if the plan variables don't describe a valid plan
+        (violated PERMUTATION or SEQUENCE_ORDER constraints).
+
+        @param sample Mapping of variable names to values. Fixed variables may be missing
+        """
+        order = [None]*this.binCount
+        for elem, times in this.removalTimes(sample).items():
+            if len(times) != 1 or order[times[0]] is not None:
+                return None
+            order[times[0]] = elem
+
+        position = {elem:time for time, elem in enumerate(order)}
+        for sequence in this.bySequence:
+            for i in range(0, len(sequence)-1):
+                if position[sequence[i]] > position[sequence[i+1]]:
+                    return None
+
+        return order
+
+    def sampleFromOrder(this, order):
+        """! Returns the assignment of every variable of the bqm that corresponds to the given removal order.
+        Auxiliary variables of the boolean expressions, slack variables and p are set to the values
+        that fulfill all constraints, so the energy of the assignment is the number of stacking places of the order
+        (between dec_bound and binCount-dec_bound-1).
+
+        @param order The removal order, a list of bin indices. With broken symmetries it's replaced by
+               its canonical order(see symmetry.canonicalBinOrder()), which may require fewer stacking places
+        """
+        if this.symmetry:
+            order = symmetry.canonicalBinOrder(this, order)
+        removalTime = {elem:time for time, elem in enumerate(order)}
+        values = {}
+        for elem in range(0, this.binCount):
+            for time in range(0, this.planSteps()):
+                if this.encoding == 'domainwall':
+                    values[this.wallName(elem, time)] = 1 if removalTime[elem] <= time else 0
+                else:
+                    values[this.variableName(elem, time)] = 1 if removalTime[elem] == time else 0
+
+        evaluateGadgets(this.gadgets, values)
+
+        sums = {c:sum(values.get(this.fName(label, c), 0) for label in this.byLabel) for c in this.inequalitySteps}
+        p = max(sums.values(), default=0)
+        values.update(binaryDigits('p', p, this.objectiveSize))
+        for c in this.inequalitySteps:
+            values.update(binaryDigits('s'+str(c), p-sums[c], this.slackSizes[c]))
+
+        return {var:values.get(var, 0) for var in this.bqm.variables}
+
+    def removalTimes(this, sample):
+        """! Returns a dict that maps every bin to the list of steps the sample removes it at.
+        A valid plan removes every bin at exactly one step.
+
+        @param sample Mapping of variable names to values. Fixed variables may be missing
+        """
+        sample = dict(sample) #Views of samplesets don't support get() for missing variables
+        res = {}
+        for elem in range(0, this.binCount):
+            res[elem] = []
+            if this.encoding == 'domainwall':
+                values = [sample.get(this.aliases.get(this.wallName(elem, time), this.wallName(elem, time)), this.toFix.get((elem, time), 0))
+                        for time in range(0, this.binCount-1)]
+                values.append(1)
+                #A wall that falls back to 0 has more than one rising edge
+                res[elem] = [time for time in range(0, this.binCount) if values[time] == 1 and (time == 0 or values[time-1] == 0)]
+            else:
+                for time in range(0, this.binCount):
+                    name = this.variableName(elem, time)
+                    if sample.get(this.aliases.get(name, name), 0) == 1:
+                        res[elem].append(time)
+        return res
     
-def solveDWave(sequences, num_reads, dec_bound):
+def solveDWave(sequences, num_reads, dec_bound, penaltyScales=None, encoding='onehot', warmStart=False, offline=False, recorder=None, cache=None, backend='QA', symmetry=False, rangeCompile=False, resolveChains=False, tightSlack=False, **args):
     """! Approximate a solutions of the Stacking Problem with the given sequences
-    using a DWave Quantum Annealer"""
-    test = StackingQUBOGenerator(sequences, dec_bound)
-    test.generateBQM()
+    using a DWave Quantum Annealer
+    
+    @param penaltyScales Optional per constraint family penalty factors, see penaltyCalibration
+    @param encoding Encoding of the plan variables, one of PLAN_ENCODINGS
+    @param warmStart Reverse anneal from the plan of the classical heuristics, see warmStart
+    @param offline Sample with the local stand-in of the QPU(see offlineSampler) instead of a DWaveSampler. Same as backend='OFFLINE'
+    @param recorder Optional instrumentation.Recorder that records every step. Its records are stored in sampleset.info['instrumentation']
+    @param cache Optional resultCache.ResultCache. A cached sampleset of an identical solve is returned without sampling
+    @param backend Name of the structured backend to sample with, see backends
+    @param symmetry Break the symmetries of the instance, see symmetry
+    @param rangeCompile Split the variables of the largest biases before sampling, see rangeCompiler. The report is stored in sampleset.info['rangeCompiler']
+    @param resolveChains Decide broken chains together with the one-hot structure of the plan and the energy of the bqm instead of by majority vote, see chainBreak
+    @param tightSlack Size the numbers of the inequalities from bounds on the open labels, see StackingQUBOGenerator.sizeSlacks()
+    @param **args Additional keyword arguments are forwarded to DWaveSampler.sample()"""
+    if offline:
+        backend = 'OFFLINE'
+    recorder = recorderOrNull(recorder)
+    def build():
+        generator = StackingQUBOGenerator(sequences, dec_bound, penaltyScales, encoding, recorder, symmetry, tightSlack)
+        with recorder.stage('generateBQM', generator.bqm):
+            generator.generateBQM()
+        return generator
+
+    #A hit is returned before the bqm is built
+    key = solveKey('bin', sequences, {'dec_bound':dec_bound, 'penaltyScales':penaltyScales, 'encoding':encoding, 'warmStart':warmStart, 'symmetry':symmetry, 'rangeCompile':rangeCompile, 'resolveChains':resolveChains, 'tightSlack':tightSlack},
+            backend, dict(args, num_reads=num_reads))
+    sampleset = cachedResult(cache, key, build)
+    if sampleset is not None:
+        print('Lowest energy:', sampleset.first.energy, '(cached)')
+        return sampleset
+
+    test = build()
     print("Generated bqm")
     test.breakDownVariables()
 
-    sampler = EmbeddingComposite(DWaveSampler())
-    sampleset = sampler.sample(test.bqm, num_reads=num_reads, return_embedding=True,warnings='save')
+    if warmStart:
+        import warmStart as ws
+        with recorder.stage('warmStart'):
+            args = dict(ws.reverseAnnealArgs(ws.heuristicState(test)), **args)
+
+    bqm, compiled = test.bqm, None
+    if rangeCompile:
+        with recorder.stage('rangeCompile'):
+            compiled = rangeCompiler.compileBQM(test.bqm, rangeCompiler.objectiveTerms(test))
+        rangeCompiler.printReport(compiled.report)
+        bqm = compiled.bqm
+        if 'initial_state' in args:
+            args['initial_state'] = compiled.encode(args['initial_state'])
+    if resolveChains:
+        args['chain_break_method'] = chainBreak.resolver(test, bqm)
+
+    with recorder.stage('connect', backend=backend):
+        sampler = backends.getSampler(backend)
+    with recorder.stage('sample', num_reads=num_reads):
+        sampleset = sampler.sample(bqm, num_reads=num_reads, return_embedding=True,warnings='save', **args)
+    recordSamplesetTiming(recorder, sampleset)
+    if compiled is not None:
+        sampleset = compiled.decode(sampleset)
     sampleset.info['bqm'] = test.bqm
     sampleset.info['sequences'] = sequences
-    saveSampleset(sampleset, "data/QA-")
+    sampleset.info['penaltyScales'] = test.penaltyScales
+    sampleset.info['encoding'] = test.encoding
+    sampleset.info['warmStart'] = warmStart
+    sampleset.info['symmetry'] = symmetry
+    sampleset.info['tightSlack'] = tightSlack
+    sampleset.info['rangeCompile'] = rangeCompile
+    sampleset.info['resolveChains'] = resolveChains
+    if recorder:
+        sampleset.info['instrumentation'] = recorder.records
+    with recorder.stage('saveSampleset'):
+        saveSampleset(sampleset, "data/QA-")
+    if cache is not None:
+        cache.put(key, sampleset)
 
     print('Lowest energy:', sampleset.first.energy)
-    interpretSolution(sampleset.first, test.binCount)
+    interpretSolution(sampleset.first, test.binCount, test)
     print('')
+    return sampleset
 
-def solveSimAnneal(sequences,num_reads, dec_bound):
+def solveSimAnneal(sequences,num_reads, dec_bound, penaltyScales=None, encoding='onehot', warmStart=False, recorder=None, cache=None, backend='SA', symmetry=False, workers=1, tightSlack=False, **args):
     """! Approximate a solution of the Stacking Problem with the given sequences
-        using Simulated Annealing with a QUBO-Formulation of the Energy Function"""
-    test = StackingQUBOGenerator(sequences, dec_bound)
-    test.generateBQM()
-
+        using Simulated Annealing with a QUBO-Formulation of the Energy Function
+        
+        @param penaltyScales Optional per constraint family penalty factors, see penaltyCalibration
+        @param encoding Encoding of the plan variables, one of PLAN_ENCODINGS
+        @param warmStart Start every read from the plan of the classical heuristics, see warmStart
+        @param recorder Optional instrumentation.Recorder that records every step. Its records are stored in sampleset.info['instrumentation']
+        @param cache Optional resultCache.ResultCache. A cached sampleset of an identical solve is returned without sampling
+        @param backend Name of the unstructured backend to sample with, see backends
+        @param symmetry Break the symmetries of the instance, see symmetry
+        @param workers Number of processes the reads are split across, see parallelSA. None uses every core
+        @param tightSlack Size the numbers of the inequalities from bounds on the open labels, see StackingQUBOGenerator.sizeSlacks()
+        @param **args Additional keyword arguments are forwarded to SimulatedAnnealingSampler.sample()
+        @returns [sampling time, sampleset, generator]. A result of the cache is returned with the sampling time of
+                 the solve that stored it and a newly built generator"""
+    recorder = recorderOrNull(recorder)
+    def build():
+        generator = StackingQUBOGenerator(sequences, dec_bound, penaltyScales, encoding, recorder, symmetry, tightSlack)
+        with recorder.stage('generateBQM', generator.bqm):
+            generator.generateBQM()
+        return generator
+
+    key = solveKey('bin', sequences, {'dec_bound':dec_bound, 'penaltyScales':penaltyScales, 'encoding':encoding, 'warmStart':warmStart, 'symmetry':symmetry, 'tightSlack':tightSlack},
+            backend, dict(args, num_reads=num_reads, workers=workers))
+    sampleset = None if cache is None else cache.get(key)
+    test = build()
     print("Generated bqm")
     test.breakDownVariables()
-
-    sampler = SimulatedAnnealingSampler()
-    start = time.time()
-    sampleset = sampler.sample(test.bqm, num_reads=num_reads)
-    end = time.time()
+    if sampleset is not None:
+        sampleset.info.setdefault('bqm', test.bqm)
+        print('Lowest energy:', sampleset.first.energy, '(cached)')
+        interpretSolution(sampleset.first, test.binCount, test)
+        return [sampleset.info.get('samplingTime', 0), sampleset, test]
+
+    if warmStart:
+        import warmStart as ws
+        with recorder.stage('warmStart'):
+            args = dict(ws.annealWarmStartArgs(test.bqm, ws.heuristicState(test)), **args)
+
+    with recorder.stage('sample', num_reads=num_reads):
+        start = time.time()
+        sampleset = parallelSA.sampleParallel(test.bqm, num_reads, workers, backend, **args)
+        end = time.time()
     sampleset.info['bqm'] = test.bqm
+    sampleset.info['samplingTime'] = end - start
     sampleset.info['sequences'] = sequences
-    saveSampleset(sampleset, "data/SA-")
+    sampleset.info['penaltyScales'] = test.penaltyScales
+    sampleset.info['encoding'] = test.encoding
+    sampleset.info['warmStart'] = warmStart
+    sampleset.info['symmetry'] = symmetry
+    sampleset.info['tightSlack'] = tightSlack
+    if recorder:
+        sampleset.info['instrumentation'] = recorder.records
+    with recorder.stage('saveSampleset'):
+        saveSampleset(sampleset, "data/SA-")
+    if cache is not None:
+        cache.put(key, sampleset)
 
     print('Lowest energy:', sampleset.first.energy)
     print('')
-    interpretSolution(sampleset.first, test.binCount)
+    interpretSolution(sampleset.first, test.binCount, test)
 
     return [end - start, sampleset, test]
 
-def interpretSolution(sample, binCount):
+def interpretSolution(sample, binCount, generator=None):
+    """! Prints the order in which the given sample removes the bins
+
+    @param sample The sample to interpret
+    @param binCount The number of bins of the instance
+    @param generator The generator the sample belongs to. Required to decode plans that aren't one-hot encoded
+           or whose symmetries are broken"""
     print('The order the bins are removed in is: ')
+    if generator is not None:
+        times = generator.removalTimes(sample.sample)
+        for j in range(binCount):
+            for i in range(binCount):
+                if j in times[i]:
+                    print(str(j)+':'+str(i))
+        return
+
     for j in range(binCount):
         for i in range(binCount):
             if (('x('+str(i)+','+str(j)+')') in sample.sample) and sample.sample['x('+str(i)+','+str(j)+')'] == 1:
@@ -366,16 +887,46 @@ if __name__=='__main__':
     parser.add_argument('-s', type=str, action='store', dest='seqs', 
             metavar='Sequences. Entries are separated by commas. Sequences are\
  separated by -.Labels are numbers', required = True)
-    parser.add_argument('-m', type=str, action='store', dest='method', metavar='Method to use. Either SA or QA.', required = True)
+    parser.add_argument('-m', type=str, action='store', dest='method', choices=backends.names(), help='Backend to use. '+backends.helpText(), required = True)
     parser.add_argument('-nr', type=int, action='store', dest='num_reads', metavar='Number of samples to generate.', required = True)
     parser.add_argument('-db', type=int, action='store', dest='dec_bound', metavar='Boundary for decision problem', default=1)
+    parser.add_argument('-cal', action='store_true', dest='calibrate', help='Use calibrated per constraint penalties (calibrates and caches them if necessary)')
+    parser.add_argument('-enc', type=str, action='store', dest='encoding', choices=PLAN_ENCODINGS, default='onehot', help='Encoding of the plan variables')
+    parser.add_argument('-ws', action='store_true', dest='warmStart', help='Start from the plan of the classical heuristics (reverse anneal for QA)')
+    parser.add_argument('-off', action='store_true', dest='offline', help='Use the local stand-in of the QPU for QA')
+    parser.add_argument('-sym', action='store_true', dest='symmetry', help='Break the symmetries of the instance')
+    parser.add_argument('-ts', action='store_true', dest='tightSlack', help='Size the slack of every step from bounds on the open labels (see sizeSlacks())')
+    parser.add_argument('-w', type=int, action='store', dest='workers', metavar='Number of processes the reads of SA are split across', default=1)
+    parser.add_argument('-rc', action='store_true', dest='rangeCompile', help='Split the variables of the largest biases before sampling with QA (see rangeCompiler)')
+    parser.add_argument('-rcb', action='store_true', dest='resolveChains', help='Resolve broken chains with the structure of the plan instead of majority votes with QA (see chainBreak)')
+    parser.add_argument('-cache', action='store_true', dest='cache', help='Return cached results of identical solves and cache new ones (data/cache)')
+    parser.add_argument('-force', action='store_true', dest='force', help='Recompute even if the solve is cached')
+    parser.add_argument('-instr', type=str, action='store', dest='instrumentation', metavar='Append the instrumentation records to this JSON lines file', default=None)
 
     args = parser.parse_args(sys.argv[1:])
     sequences = parseSequences(args.seqs)
+
+    penaltyScales = None
+    if args.calibrate:
+        import penaltyCalibration
+        penaltyScales = penaltyCalibration.getPenaltyScales(sequences, 'bin', dec_bound=args.dec_bound, encoding=args.encoding)
+        print('Using penalty scales', penaltyScales)
     
-    if args.method == 'SA':
-        solveSimAnneal(sequences, args.num_reads, args.dec_bound)
-    elif args.method == 'QA':
-        solveDWave(sequences, args.num_reads, args.dec_bound)
+    cache = None
+    if args.cache or args.force:
+        from resultCache import ResultCache
+        cache = ResultCache(force=args.force)
+
+    recorder = None
+    if args.instrumentation is not None:
+        from instrumentation import Recorder
+        recorder = Recorder(memory=True)
+
+    if backends.get(args.method).structured:
+        solveDWave(sequences, args.num_reads, args.dec_bound, penaltyScales, args.encoding, args.warmStart, args.offline, recorder, cache, args.method, args.symmetry, args.rangeCompile, args.resolveChains, args.tightSlack)
     else:
-        print('Method (-m) must be either SA or QA!')
+        solveSimAnneal(sequences, args.num_reads, args.dec_bound, penaltyScales, args.encoding, args.warmStart, recorder, cache, args.method, args.symmetry, args.workers, args.tightSlack)
+
+    if recorder is not None:
+        recorder.summary()
+        recorder.writeJSONLines(args.instrumentation, model='bin', method=args.method, sequences=sequences, dec_bound=args.dec_bound)
@@ -1,13 +1,27 @@
 import dimod
 import math
-from dwave.system import EmbeddingComposite, DWaveSampler
 import time
 import argparse
 import sys
-import dwave.inspector
 
-from neal.sampler import SimulatedAnnealingSampler
-from qaUtils import saveSampleset
+import backends
+import bqmKernels
+import chainBreak
+import lowerBounds
+import parallelSA
+import rangeCompiler
+import symmetry
+from qaUtils import saveSampleset, evaluateGadgets, binaryDigits, inequalityCouplers
+from instrumentation import recorderOrNull, recordSamplesetTiming
+from resultCache import solveKey, cachedResult
+
+#Names of the constraint families whose penalties can be scaled independently
+PENALTY_FAMILIES = ['permutation', 'or', 'and', 'inequality']
+
+#Supported encodings of the opening position of a pallet.
+#onehot: x(i,j) is 1 iff the pallet of label i is opened at position j
+#domainwall: d(i,j) is 1 iff the pallet of label i is opened at position j or earlier
+PLAN_ENCODINGS = ['onehot', 'domainwall']
 
 def iterN(items, n):
     """! Generator that iterates over a given collection in slices of size n.
@@ -45,13 +59,25 @@ class PalletQUBOGenerator:
         #Convert the sequenceGraph to list for conistent ordering
         this.sequenceGraph = [edge for edge in this.sequenceGraph] 
 
-    def __init__(this, sequences, autoGenerate=True, penaltyMul=50):
+    def __init__(this, sequences, autoGenerate=True, penaltyMul=50, penaltyScales=None, encoding='onehot', recorder=None, symmetry=False, tightSlack=False):
         """!
           Constructs a generator for pallet-solution bqms
         
           \param sequences List of sequences to stack from. The sequences are ordered lists of labels.
           \param autoGenerate Whether to immediately generate the full bqm during construction
+          \param penaltyMul Value to mutiply the minimum possible penalty for violation of constraints by
+          \param penaltyScales Optional dict mapping names from PENALTY_FAMILIES to factors the penalty
+                 of that constraint family is multiplied by. Missing families use the full penalty
+          \param encoding Encoding of the plan variables, one of PLAN_ENCODINGS
+          \param recorder Optional instrumentation.Recorder that records the stages of generateBQM()
+          \param symmetry Break the symmetries of interchangeable labels, see symmetry
+          \param tightSlack Size w and the slacks from the number of labels with predecessors instead of
+                 auxSize bits each, see sizeSlacks()
         """
+        if encoding not in PLAN_ENCODINGS:
+            raise ValueError('Unknown encoding '+str(encoding))
+        this.encoding = encoding
+        this.recorder = recorderOrNull(recorder)
         this.sequences = sequences
 
         labels = set()
@@ -66,9 +92,34 @@ class PalletQUBOGenerator:
        
         this.penaltyFactor = pow(2,this.auxSize)*penaltyMul #Penalty larger than maximum possible p
 
+        this.penaltyScales = {}
+        if penaltyScales is not None:
+            this.penaltyScales.update(penaltyScales)
+
+        #Boolean expressions in the order they are modeled, see qaUtils.evaluateGadgets()
+        this.gadgets = []
+
+        this.symmetry = symmetry
+        this.fixed = {} #Maps names of fixed plan variables to their value, see symmetry.breakPalletSymmetries()
+
+        #Number of bits of w and of the slack of every position
+        this.objectiveSize = this.auxSize
+        this.slackSizes = {c:this.auxSize for c in range(0, this.numLabels-1)}
+        this.tightSlack = tightSlack
+        if tightSlack:
+            this.sizeSlacks()
+
         if autoGenerate:
             this.generateBQM()
     
+    def penalty(this, family):
+        """!
+          \brief Returns the penalty used for the constraints of the given family
+
+          \param family One of PENALTY_FAMILIES
+        """
+        return this.penaltyFactor*this.penaltyScales.get(family, 1)
+
     def varName(this, i, j):
         """!
           \brief Returns the BQM-Variable name for the plan variable with the given indices
@@ -78,26 +129,67 @@ class PalletQUBOGenerator:
         """
         return 'x(' + str(i) + ',' + str(j) +')'
 
+    def wallName(this, i, j):
+        """!
+          \brief Returns the BQM-Variable name for the domain wall variable which is 1 iff
+          the pallet of label i is opened at position j or earlier
+
+          \param i Index i
+          \param j Index j
+        """
+        return 'd(' + str(i) + ',' + str(j) +')'
+
+    def oneHotGroups(this):
+        """!
+          \brief Returns the groups of plan variables of which exactly one is 1 in every valid sample(the labels at
+          every position and the positions of every label), as lists of variable names, see chainBreak.
+          Fixed variables are left out, groups with a variable fixed to 1 are dropped. Empty for the domain wall encoding
+        """
+        if this.encoding == 'domainwall':
+            return []
+        groups = [[this.varName(k, i) for i in range(0, this.numLabels)] for k in range(0, this.numLabels)]
+        groups += [[this.varName(i, k) for i in range(0, this.numLabels)] for k in range(0, this.numLabels)]
+        return [[name for name in group if name not in this.fixed] for group in groups
+                if all(this.fixed.get(name) != 1 for name in group)]
+
     def permutationConstraint(this):
         """! 
         \brief Models the constraint which ensures that each position
         is used by exactly one label and each label uses exactly one
         position"""
+        penalty = this.penalty('permutation')
+        if this.encoding == 'domainwall':
+            #Each label is opened once: d(i,j) => d(i,j+1)
+            for i in range(0, this.numLabels):
+                for j in range(0, this.numLabels-2):
+                    this.bqm.add_variable(this.wallName(i,j), penalty)
+                    this.bqm.add_interaction(this.wallName(i,j), this.wallName(i,j+1), -penalty)
+
+            #Exactly j+1 pallets are opened at position j: (sum_i d(i,j) - (j+1))^2
+            for j in range(0, this.numLabels-1):
+                for i in range(0, this.numLabels):
+                    iName = this.wallName(i,j)
+                    this.bqm.add_variable(iName, (1-2*(j+1))*penalty)
+                    for i2 in range(i+1, this.numLabels):
+                        this.bqm.add_interaction(iName, this.wallName(i2,j), 2*penalty)
+                this.bqm.offset += (j+1)**2*penalty
+            return
+
         for k in range(0, this.numLabels):
             for i in range(0, this.numLabels):
                 iName = this.varName(k, i)
                 invIName = this.varName(i,k)
 
-                this.bqm.add_variable(iName, -this.penaltyFactor)
-                this.bqm.add_variable(invIName, -this.penaltyFactor)
+                this.bqm.add_variable(iName, -penalty)
+                this.bqm.add_variable(invIName, -penalty)
                 for j in range(i+1, this.numLabels):
                     jName = this.varName(k,j)
                     invJName = this.varName(j,k)
 
-                    this.bqm.add_interaction(iName, jName, 2*this.penaltyFactor)
-                    this.bqm.add_interaction(invIName, invJName,2*this.penaltyFactor)
+                    this.bqm.add_interaction(iName, jName, 2*penalty)
+                    this.bqm.add_interaction(invIName, invJName,2*penalty)
 
-        this.bqm.offset = 2*this.penaltyFactor*this.numLabels
+        this.bqm.offset = 2*penalty*this.numLabels
     
     def modelOr(this, left, right, auxName):
         """!
@@ -107,12 +199,104 @@ class PalletQUBOGenerator:
           \param right One of the variables of the expression
           \param auxName Name of the auxiliary variable which holds the result of the expression
         """
-        this.bqm.add_variable(left, this.penaltyFactor)
-        this.bqm.add_variable(right, this.penaltyFactor)
-        this.bqm.add_variable(auxName, this.penaltyFactor)
-        this.bqm.add_interaction(left,right,this.penaltyFactor)
-        this.bqm.add_interaction(left, auxName, -2*this.penaltyFactor)
-        this.bqm.add_interaction(right, auxName, -2*this.penaltyFactor)
+        this.gadgets.append(('or', [left, right], auxName))
+        penalty = this.penalty('or')
+        this.bqm.add_variable(left, penalty)
+        this.bqm.add_variable(right, penalty)
+        this.bqm.add_variable(auxName, penalty)
+        this.bqm.add_interaction(left,right,penalty)
+        this.bqm.add_interaction(left, auxName, -2*penalty)
+        this.bqm.add_interaction(right, auxName, -2*penalty)
+
+    def modelAnd(this, left, right, auxName):
+        """!
+          \brief Models the boolean expression auxName = left AND right in the BQM
+          
+          \param left One of the variables of the expression
+          \param right One of the variables of the expression
+          \param auxName Name of the auxiliary variable which holds the result of the expression
+        """
+        this.gadgets.append(('and', [left, right], auxName))
+        penalty = this.penalty('and')
+        this.bqm.add_interaction(left, right, penalty)
+        this.bqm.add_interaction(left, auxName, -2*penalty)
+        this.bqm.add_interaction(right, auxName, -2*penalty)
+        this.bqm.add_variable(auxName, 3*penalty)
+
+    def modelAndNot(this, left, right, auxName):
+        """!
+          \brief Models the boolean expression auxName = left AND NOT right in the BQM
+          
+          \param left The variable of the expression that has to be 1
+          \param right The variable of the expression that has to be 0
+          \param auxName Name of the auxiliary variable which holds the result of the expression
+        """
+        #c = a(1-b) => c+a-ab-2ac+2bc
+        this.gadgets.append(('andnot', [left, right], auxName))
+        penalty = this.penalty('and')
+        this.bqm.add_variable(auxName, penalty)
+        this.bqm.add_variable(left, penalty)
+        this.bqm.add_interaction(left, right, -penalty)
+        this.bqm.add_interaction(left, auxName, -2*penalty)
+        this.bqm.add_interaction(right, auxName, 2*penalty)
+
+    def oName(this, i, c):
+        """!
+          \brief Returns name for auxiliary variable which is 1 iff the pallet of label i
+          is open after position c(only used by the domain wall encoding)
+        
+          \param i Label
+          \param c Value of c
+        """
+        return 'O(' + str(i) + ',' + str(c) + ')'
+
+    def predecessors(this):
+        """!
+          \brief Returns a dict that maps each label to the sorted list of labels
+          which have to be opened before its pallet can be closed
+        """
+        if not hasattr(this, 'sequenceGraph'):
+            this.constructSequenceGraph()
+
+        res = {label:[] for label in range(0, this.numLabels)}
+        for edge in this.sequenceGraph:
+            res[edge[1]].append(edge[0])
+        for label in res:
+            res[label].sort()
+        return res
+
+    def openIndicators(this):
+        """!
+          \brief Generates the expressions for O(i,c) if the plan is domain wall encoded.
+
+          The pallet of label i is open after position c iff it has been opened
+          and at least one of its predecessors in the sequence graph has not been opened yet.
+          This counts the same pallets as Y(j,c) but needs no conjunctions over positions.
+        """
+        for label, preds in this.predecessors().items():
+            if len(preds) <= 0:
+                continue
+            for c in range(0, this.numLabels-1):
+                conjunctions = [this.wallName(pred, c) for pred in preds]
+                while len(conjunctions) > 1:
+                    left = conjunctions.pop(0)
+                    right = conjunctions.pop(0)
+                    auxName = left + 'and' + right
+                    if not this.bqm.has_variable(auxName):
+                        this.modelAnd(left, right, auxName)
+                    conjunctions.insert(0, auxName)
+
+                this.modelAndNot(this.wallName(label, c), conjunctions[0], this.oName(label, c))
+
+    def countedIndicators(this, c):
+        """!
+          \brief Returns the names of the variables whose sum is the number of pallets open after position c
+
+          \param c Value of c
+        """
+        if this.encoding == 'domainwall':
+            return [this.oName(label, c) for label, preds in this.predecessors().items() if len(preds) > 0]
+        return [this.yName(j, c) for j in range(0, c+1)]
 
     def yName(this, j, c):
         """!
@@ -140,10 +324,7 @@ class PalletQUBOGenerator:
             auxName = left + 'and' + right
             #AND Bedingung
             if not this.bqm.has_variable(auxName):
-                this.bqm.add_interaction(left, right, this.penaltyFactor)
-                this.bqm.add_interaction(left, auxName, -2*this.penaltyFactor)
-                this.bqm.add_interaction(right, auxName, -2*this.penaltyFactor)
-                this.bqm.add_variable(auxName, 3*this.penaltyFactor)
+                this.modelAnd(left, right, auxName)
 
             conjunctions.append(auxName)
             test += 1
@@ -174,12 +355,17 @@ class PalletQUBOGenerator:
             this.modelOr(left,right,auxName)
         else:
             this.bqm.relabel_variables({conjunctions[0]:this.yName(j,c)})
+            this.gadgets = [(kind, inputs, this.yName(j,c) if output == conjunctions[0] else output) for kind, inputs, output in this.gadgets]
         
 
     def yjc(this):
         """!
           \brief Generates all relevant expressions for Y(j,c)
         """
+        if this.encoding == 'domainwall':
+            this.openIndicators()
+            return
+
         #Reversed to avoid having to combine variables 
         #created by recursion
         #(relabeling with an exisiting name is not permitted)
@@ -187,7 +373,7 @@ class PalletQUBOGenerator:
             for j in range(0, c+1):
                 this.y(j,c)
 
-    def squareAux(this, auxName, factor=1):
+    def squareAux(this, auxName, factor=1, size=None):
         """! 
           \brief Add expression to represent the square of an auxiliary variable,
         which is a natural number represented by multiple qubits
@@ -195,45 +381,77 @@ class PalletQUBOGenerator:
 
         \param auxName Name of the number to square
         \param factor Factor to multiply the squared variable by
+        \param size Number of bits of the variable, auxSize if omitted
         """
         auxName+='_'
-        for i in range(0, this.auxSize):
+        size = this.auxSize if size is None else size
+        for i in range(0, size):
             this.bqm.add_variable(auxName+str(i), (pow(2, i)**2)*factor)
-            for j in range(i+1, this.auxSize):
+            for j in range(i+1, size):
                 this.bqm.add_interaction(auxName+str(i), auxName+str(j), pow(2,i+j+1)*factor)
 
    
     def inequalityConstraints(this):
         """! Models the necessary inequalities to set w to the correct value"""
+        penalty = this.penalty('inequality')
         for c in range(0, this.numLabels-1):
-            for j in range(0, c+1): 
-                this.bqm.add_variable(this.yName(j,c), this.penaltyFactor)
-                for j2 in range(j+1, c+1):
-                    this.bqm.add_interaction(this.yName(j,c), this.yName(j2,c), 2*this.penaltyFactor)
-
-                for i in range(0, this.auxSize):
-                    this.bqm.add_interaction(this.yName(j,c),'s'+str(c)+'_'+str(i), this.penaltyFactor*2*pow(2,i))
-                    this.bqm.add_interaction(this.yName(j,c),'w_'+str(i), -this.penaltyFactor*2*pow(2,i))
-
-            for i in range(0, this.auxSize):
-                for j in range(0, this.auxSize):
-                    this.bqm.add_interaction('s'+str(c)+'_'+str(i), 'w_'+str(j), -this.penaltyFactor*2*pow(2,i)*pow(2,j))
-
-            this.squareAux('w', this.penaltyFactor)
-            this.squareAux('s'+str(c), this.penaltyFactor)
+            indicators = this.countedIndicators(c)
+            size = this.slackSizes[c]
+            for j in range(0, len(indicators)): 
+                this.bqm.add_variable(indicators[j], penalty)
+                for j2 in range(j+1, len(indicators)):
+                    this.bqm.add_interaction(indicators[j], indicators[j2], 2*penalty)
+
+                for i in range(0, size):
+                    this.bqm.add_interaction(indicators[j],'s'+str(c)+'_'+str(i), penalty*2*pow(2,i))
+                for i in range(0, this.objectiveSize):
+                    this.bqm.add_interaction(indicators[j],'w_'+str(i), -penalty*2*pow(2,i))
+
+            for i in range(0, size):
+                for j in range(0, this.objectiveSize):
+                    this.bqm.add_interaction('s'+str(c)+'_'+str(i), 'w_'+str(j), -penalty*2*pow(2,i)*pow(2,j))
+
+            this.squareAux('w', penalty, this.objectiveSize)
+            this.squareAux('s'+str(c), penalty, size)
+
+    def countedLabelBound(this):
+        """!
+          \brief Returns an upper bound on the number of labels that are counted at any position(opened at the position
+          or earlier with a predecessor that isn't opened yet): Only labels with predecessors are ever counted
+        """
+        return len([label for label, preds in this.predecessors().items() if len(preds) > 0])
 
+    def sizeSlacks(this):
+        """!
+          \brief Sizes w and the slacks of the inequalities from countedLabelBound() W instead of using auxSize bits for each.
+          w only has to reach W. The slack of a position is w minus the counted labels, which can be 0 at every position,
+          so every slack gets the bits of W as well. The numbers only shrink if labels without predecessors make W smaller
+          than the number of labels
+        """
+        most = this.countedLabelBound()
+        this.objectiveSize = max(1, most.bit_length())
+        this.slackSizes = {c:most.bit_length() for c in range(0, this.numLabels-1)}
 
     def generateBQM(this):
         """!
           \brief Performs all neccessary steps to fully model the problem
         """
-        this.constructSequenceGraph()
-        this.permutationConstraint()
-        this.yjc()
-        this.inequalityConstraints()
+        with this.recorder.stage('constructSequenceGraph'):
+            this.constructSequenceGraph()
+        with this.recorder.stage('permutationConstraint', this.bqm):
+            this.permutationConstraint()
+        with this.recorder.stage('yjc', this.bqm):
+            this.yjc()
+        with this.recorder.stage('inequalityConstraints', this.bqm):
+            this.inequalityConstraints()
  
-        for i in range(0, this.auxSize):
-            this.bqm.add_variable('w_'+str(i), pow(2,i))
+        with this.recorder.stage('objective', this.bqm):
+            for i in range(0, this.objectiveSize):
+                this.bqm.add_variable('w_'+str(i), pow(2,i))
+
+        if this.symmetry:
+            with this.recorder.stage('symmetryBreaking', this.bqm):
+                symmetry.breakPalletSymmetries(this)
     
     def breakDownVariables(this):
         """!
@@ -241,54 +459,131 @@ class PalletQUBOGenerator:
         """
         remaining = len(this.bqm)
         plan = this.numLabels**2
+        if this.encoding == 'domainwall':
+            plan = this.numLabels*(this.numLabels-1)
+        plan -= len(this.fixed)
         remaining -= plan
         print('Number of plan variables:', plan)
-        numbers = this.auxSize*this.numLabels
+        numbers = this.objectiveSize + sum(this.slackSizes.values())
         remaining -= numbers
         print('Number of variables that model numbers:', numbers)
         print('Number of variables that model boolean expressions:', remaining)
+        saved = {}
+        if this.tightSlack:
+            positions = range(0, this.numLabels-1)
+            counts = {c:len(this.countedIndicators(c)) for c in positions}
+            saved['savedNumbers'] = this.auxSize*this.numLabels - numbers
+            saved['savedCouplers'] = (inequalityCouplers(counts, {c:this.auxSize for c in positions}, this.auxSize)
+                    - inequalityCouplers(counts, this.slackSizes, this.objectiveSize))
+            print('Saved by tight slack sizing:', saved['savedNumbers'], 'number variables,', saved['savedCouplers'], 'couplers of the inequalities')
+        this.recorder.add('breakDownVariables', total=len(this.bqm), plan=plan, numbers=numbers, boolean=remaining, **saved)
     
     def getMaxBias(this):
         """!
           \brief Returns the biggest coupler bias
         """
-        maxKey = ''
-        maxBias = 0
-        for key1, key2 in this.bqm.iter_interactions():
-            bias =  abs(this.bqm.get_quadratic(key1, key2))
-            if bias > maxBias:
-                    maxKey = key1+','+key2 
-                    maxBias = bias
-
-        for key in this.bqm.iter_variables():
-            bias = abs(this.bqm.get_linear(key))
-            if bias > maxBias:
-                maxKey = key
-                maxBias = bias
+        stats = rangeCompiler.spectrum(this.bqm)
+        maxBias = max(stats['maxQuadratic'], stats['maxLinear'])
+        maxKey = stats.get('largest', '')
+        if isinstance(maxKey, tuple):
+            maxKey = ','.join(maxKey)
 
         print('Max bias is',maxBias,'at',maxKey)
 
         return maxBias
 
+    def compiledBQM(this, labels=None, refresh=False):
+        """!
+          \brief Returns the bqm in compressed sparse form for batched energies and flip deltas, see bqmKernels.
+          The compiled form is cached until the bqm changes
+          \param labels Optional order of the columns, e.g. the variables of a sampleset
+          \param refresh Compile even if the bqm didn't change, see bqmKernels.fingerprint()
+        """
+        return bqmKernels.compiled(this, this.bqm, labels, refresh)
+
+    def decodeOpeningOrder(this, sample):
+        """!
+          \brief Returns the labels in the order the given sample opens their pallets
+          or None if the plan variables don't describe a permutation
+
+          \param sample Mapping of variable names to values
+        """
+        order = [None]*this.numLabels
+        for i, positions in this.openingPositions(sample).items():
+            if len(positions) != 1 or order[positions[0]] is not None:
+                return None
+            order[positions[0]] = i
+
+        return order
+
+    def sampleFromOrder(this, order):
+        """!
+          \brief Returns the assignment of every variable of the bqm that corresponds to the given opening order.
+          Auxiliary variables of the boolean expressions, slack variables and w are set to the values
+          that fulfill all constraints, so the energy of the assignment is the value of w for the order.
+
+          \param order List of labels in the order their pallets are opened. With broken symmetries the twins
+                 are opened in the order of their labels instead, see symmetry.canonicalPalletOrder()
+        """
+        if this.symmetry:
+            order = symmetry.canonicalPalletOrder(this, order)
+        position = {label:j for j, label in enumerate(order)}
+        values = {}
+        for i in range(0, this.numLabels):
+            for j in range(0, this.numLabels):
+                if this.encoding == 'domainwall':
+                    values[this.wallName(i,j)] = 1 if position[i] <= j else 0
+                else:
+                    values[this.varName(i,j)] = 1 if position[i] == j else 0
+
+        evaluateGadgets(this.gadgets, values)
+
+        sums = {c:sum(values.get(name, 0) for name in this.countedIndicators(c)) for c in range(0, this.numLabels-1)}
+        w = max(sums.values(), default=0)
+        values.update(binaryDigits('w', w, this.objectiveSize))
+        for c in sums:
+            values.update(binaryDigits('s'+str(c), w-sums[c], this.slackSizes[c]))
+
+        return {var:values.get(var, 0) for var in this.bqm.variables}
+
+    def openingPositions(this, sample):
+        """!
+          \brief Returns a dict that maps every label to the list of positions the sample opens its pallet at.
+          A valid plan opens every pallet at exactly one position.
+
+          \param sample Mapping of variable names to values
+        """
+        sample = dict(sample) #Views of samplesets don't support get() for missing variables
+        res = {}
+        for i in range(0, this.numLabels):
+            if this.encoding == 'domainwall':
+                values = [sample.get(this.wallName(i,j), this.fixed.get(this.wallName(i,j), 0)) for j in range(0, this.numLabels-1)] + [1]
+                #A wall that falls back to 0 has more than one rising edge
+                res[i] = [j for j in range(0, this.numLabels) if values[j] == 1 and (j == 0 or values[j-1] == 0)]
+            else:
+                res[i] = [j for j in range(0, this.numLabels) if sample.get(this.varName(i,j), 0) == 1]
+        return res
+
     def interpretSample(this, sample):
         """!
           Interprets the solution described by the given sample
 
           \param sample The sample to examine 
         """
-        if sample.energy > (pow(2,this.auxSize)-1):
+        if sample.energy > (pow(2,this.objectiveSize)-1):
             print('WARNING: There appear to be violated constraints in the given sample,\
 making the solution invalid!')
 
         print('The pallets are opened in this order:')
+        positions = this.openingPositions(sample.sample)
         for j in range(0, this.numLabels):
             for i in range(0, this.numLabels):
-                if sample.sample[this.varName(i,j)] == 1:
+                if j in positions[i]:
                     print( str(j+1)+'.', i)
         print('The number of stacking places required is (according to the sample)', sample.energy+1)
 
 
-def solveDWave(sequences, num_reads, penaltyMul=50, **args):
+def solveDWave(sequences, num_reads, penaltyMul=50, penaltyScales=None, encoding='onehot', warmStart=False, offline=False, recorder=None, cache=None, backend='QA', symmetry=False, rangeCompile=False, resolveChains=False, tightSlack=False, **args):
     """! 
     \brief Approximate a solutions of the Stacking Problem with the given sequences
     using a DWave Quantum Annealer
@@ -296,23 +591,84 @@ def solveDWave(sequences, num_reads, penaltyMul=50, **args):
     \param sequences The sequences of the problem instance
     \param num_reads Number of samples to generate
     \param penaltyMul Value to mutiply the minimum possible penalty for violation of constraints by
+    \param penaltyScales Optional per constraint family penalty factors, see penaltyCalibration
+    \param encoding Encoding of the plan variables, one of PLAN_ENCODINGS
+    \param warmStart Reverse anneal from the opening order of the classical heuristics, see warmStart
+    \param offline Sample with the local stand-in of the QPU(see offlineSampler) instead of a DWaveSampler. Same as backend='OFFLINE'
+    \param recorder Optional instrumentation.Recorder that records every step. Its records are stored in sampleset.info['instrumentation']
+    \param cache Optional resultCache.ResultCache. A cached sampleset of an identical solve is returned without sampling
+    \param backend Name of the structured backend to sample with, see backends. The samplesets of 'QA' are shown in the inspector
+    \param symmetry Break the symmetries of interchangeable labels, see symmetry
+    \param rangeCompile Split the variables of the largest biases before sampling, see rangeCompiler. The report is stored in sampleset.info['rangeCompiler']
+    \param resolveChains Decide broken chains together with the one-hot structure of the plan and the energy of the bqm instead of by majority vote, see chainBreak
+    \param tightSlack Size the numbers of the inequalities from the number of labels with predecessors, see PalletQUBOGenerator.sizeSlacks()
     \param **args Additional keyword arguments are forwarded to DwaveSampler.sample()
     """
-
-    test = PalletQUBOGenerator(sequences, penaltyMul = penaltyMul)
+    if offline:
+        backend = 'OFFLINE'
+
+    recorder = recorderOrNull(recorder)
+    def build():
+        with recorder.stage('generateBQM'):
+            return PalletQUBOGenerator(sequences, penaltyMul = penaltyMul, penaltyScales = penaltyScales, encoding = encoding, recorder = recorder, symmetry = symmetry, tightSlack = tightSlack)
+
+    #A hit is returned before the bqm is built
+    key = solveKey('pallet', sequences, {'penaltyMul':penaltyMul, 'penaltyScales':penaltyScales, 'encoding':encoding, 'warmStart':warmStart, 'symmetry':symmetry, 'rangeCompile':rangeCompile, 'resolveChains':resolveChains, 'tightSlack':tightSlack},
+            backend, dict(args, num_reads=num_reads))
+    sampleset = cachedResult(cache, key, build)
+    if sampleset is not None:
+        print('Lowest energy:', sampleset.first.energy, '(cached)')
+        return sampleset
+
+    test = build()
     print("Generated bqm")
     print("Number of Variables: ", len(test.bqm))
    
-    sampler = EmbeddingComposite(DWaveSampler())
+    if warmStart:
+        import warmStart as ws
+        with recorder.stage('warmStart'):
+            args = dict(ws.reverseAnnealArgs(ws.heuristicState(test)), **args)
+
+    bqm, compiled = test.bqm, None
+    if rangeCompile:
+        with recorder.stage('rangeCompile'):
+            compiled = rangeCompiler.compileBQM(test.bqm, rangeCompiler.objectiveTerms(test))
+        rangeCompiler.printReport(compiled.report)
+        bqm = compiled.bqm
+        if 'initial_state' in args:
+            args['initial_state'] = compiled.encode(args['initial_state'])
+    if resolveChains:
+        args['chain_break_method'] = chainBreak.resolver(test, bqm)
+
+    with recorder.stage('connect', backend=backend):
+        sampler = backends.getSampler(backend)
 
     # parameter auto_scale=true, ist default, skaliert alle Größen in das Intervall [-1, +1]
     # Parameter chain_strength=chain_strength_value könnte was helfen
-    sampleset = sampler.sample(test.bqm, num_reads=num_reads,  return_embedding=True,warnings='save', **args)#PARAMETERS HERE
-    dwave.inspector.show(sampleset) 
+    with recorder.stage('sample', num_reads=num_reads):
+        sampleset = sampler.sample(bqm, num_reads=num_reads,  return_embedding=True,warnings='save', **args)#PARAMETERS HERE
+    recordSamplesetTiming(recorder, sampleset)
+    if backend == 'QA':
+        import dwave.inspector
+        dwave.inspector.show(sampleset)
+    if compiled is not None:
+        sampleset = compiled.decode(sampleset)
     sampleset.info['bqm'] = test.bqm
     sampleset.info['sequences'] = sequences
     sampleset.info['penaltyFactor'] = test.penaltyFactor
-    saveSampleset(sampleset, "data/pallet/QA-")
+    sampleset.info['penaltyScales'] = test.penaltyScales
+    sampleset.info['encoding'] = test.encoding
+    sampleset.info['warmStart'] = warmStart
+    sampleset.info['symmetry'] = symmetry
+    sampleset.info['tightSlack'] = tightSlack
+    sampleset.info['rangeCompile'] = rangeCompile
+    sampleset.info['resolveChains'] = resolveChains
+    if recorder:
+        sampleset.info['instrumentation'] = recorder.records
+    with recorder.stage('saveSampleset'):
+        saveSampleset(sampleset, "data/pallet/QA-")
+    if cache is not None:
+        cache.put(key, sampleset)
     #print(sampleset)
     
     print('Lowest energy:', sampleset.first.energy)
@@ -320,7 +676,7 @@ def solveDWave(sequences, num_reads, penaltyMul=50, **args):
     test.breakDownVariables()
     return sampleset
 
-def solveSimAnneal(sequences,num_reads, penaltyMul=50, **args):
+def solveSimAnneal(sequences,num_reads, penaltyMul=50, penaltyScales=None, encoding='onehot', warmStart=False, recorder=None, cache=None, backend='SA', symmetry=False, workers=1, stopAtBound=False, tightSlack=False, **args):
     """! 
 
     \brief Approximate a solution of the Stacking Problem with the given sequences
@@ -329,21 +685,72 @@ def solveSimAnneal(sequences,num_reads, penaltyMul=50, **args):
     \param sequences The sequences of the problem instance
     \param num_reads Number of samples to generate
     \param penaltyMul Value to mutiply the minimum possible penalty for violation of constraints by
+    \param penaltyScales Optional per constraint family penalty factors, see penaltyCalibration
+    \param encoding Encoding of the plan variables, one of PLAN_ENCODINGS
+    \param warmStart Start every read from the opening order of the classical heuristics, see warmStart
+    \param recorder Optional instrumentation.Recorder that records every step. Its records are stored in sampleset.info['instrumentation']
+    \param cache Optional resultCache.ResultCache. A cached sampleset of an identical solve is returned without sampling
+    \param backend Name of the unstructured backend to sample with, see backends
+    \param symmetry Break the symmetries of interchangeable labels, see symmetry
+    \param workers Number of processes the reads are split across, see parallelSA. None uses every core
+    \param stopAtBound Sample in rounds and stop once a valid sample meets the lower bound, see lowerBounds.sampleUntilBound()
+    \param tightSlack Size the numbers of the inequalities from the number of labels with predecessors, see PalletQUBOGenerator.sizeSlacks()
     \param **args Additional keyword arguments are forwarded to SimulatedAnnealingSampler.sample()
+    \returns [sampling time, sampleset, generator]. A result of the cache is returned with the sampling time of the
+             solve that stored it and a newly built generator
     """
 
-    test = PalletQUBOGenerator(sequences, penaltyMul = penaltyMul)
+    recorder = recorderOrNull(recorder)
+    def build():
+        with recorder.stage('generateBQM'):
+            return PalletQUBOGenerator(sequences, penaltyMul = penaltyMul, penaltyScales = penaltyScales, encoding = encoding, recorder = recorder, symmetry = symmetry, tightSlack = tightSlack)
+
+    key = solveKey('pallet', sequences, {'penaltyMul':penaltyMul, 'penaltyScales':penaltyScales, 'encoding':encoding, 'warmStart':warmStart, 'symmetry':symmetry, 'tightSlack':tightSlack},
+            backend, dict(args, num_reads=num_reads, workers=workers, stopAtBound=stopAtBound))
+    sampleset = None if cache is None else cache.get(key)
+    test = build()
     print("Generated bqm")
     print("Number of variables: ", len(test.bqm))
-
-    sampler = SimulatedAnnealingSampler()
-    start = time.time()
-    sampleset = sampler.sample(test.bqm, num_reads=num_reads, **args)
-    end = time.time()
+    if sampleset is not None:
+        sampleset.info.setdefault('bqm', test.bqm)
+        print('Lowest energy:', sampleset.first.energy, '(cached)')
+        test.interpretSample(sampleset.first)
+        return [sampleset.info.get('samplingTime', 0), sampleset, test]
+
+    if warmStart:
+        import warmStart as ws
+        with recorder.stage('warmStart'):
+            args = dict(ws.annealWarmStartArgs(test.bqm, ws.heuristicState(test)), **args)
+
+    def sample():
+        if not stopAtBound:
+            return parallelSA.sampleParallel(test.bqm, num_reads, workers, backend, **args)
+        bound = lowerBounds.palletLowerBound(sequences)
+        print('Lower bound on w:', bound)
+        #Every round gets its own seed, otherwise seeded rounds would repeat each other
+        sampleRound = lambda count, index: parallelSA.sampleParallel(test.bqm, count, workers, backend,
+                **(dict(args, seed=args['seed']+index) if args.get('seed') is not None else args))
+        return lowerBounds.sampleUntilBound(sampleRound, num_reads, bound, lambda sampleset: lowerBounds.bestPalletValue(test, sampleset, bound))
+
+    with recorder.stage('sample', num_reads=num_reads):
+        start = time.time()
+        sampleset = sample()
+        end = time.time()
     sampleset.info['bqm'] = test.bqm
+    sampleset.info['samplingTime'] = end - start
     sampleset.info['sequences'] = sequences
     sampleset.info['penaltyFactor'] = test.penaltyFactor
-    saveSampleset(sampleset, "data/pallet/SA-")
+    sampleset.info['penaltyScales'] = test.penaltyScales
+    sampleset.info['encoding'] = test.encoding
+    sampleset.info['warmStart'] = warmStart
+    sampleset.info['symmetry'] = symmetry
+    sampleset.info['tightSlack'] = tightSlack
+    if recorder:
+        sampleset.info['instrumentation'] = recorder.records
+    with recorder.stage('saveSampleset'):
+        saveSampleset(sampleset, "data/pallet/SA-")
+    if cache is not None:
+        cache.put(key, sampleset)
 
     print('Lowest energy:', sampleset.first.energy)
     test.interpretSample(sampleset.first)
@@ -364,18 +771,49 @@ if __name__ == '__main__':
     requiredNamed.add_argument('-s', type=str, action='store', dest='seqs', 
             metavar='Sequences. Entries are separated by commas. Sequences are\
  separated by -.Labels are numbers', required = True)
-    requiredNamed.add_argument('-m', type=str, action='store', dest='method', metavar='Method to use. Either SA or QA.', required = True)
+    requiredNamed.add_argument('-m', type=str, action='store', dest='method', choices=backends.names(), help='Backend to use. '+backends.helpText(), required = True)
     requiredNamed.add_argument('-nr', type=int, action='store', dest='num_reads', metavar='Number of samples to generate.', required = True)
 
     parser.add_argument('-p', type=int, action='store', dest='penalty', metavar='Factor to multiply lowest possible penalty A by', default = 50)
+    parser.add_argument('-cal', action='store_true', dest='calibrate', help='Use calibrated per constraint penalties (calibrates and caches them if necessary)')
+    parser.add_argument('-enc', type=str, action='store', dest='encoding', choices=PLAN_ENCODINGS, default='onehot', help='Encoding of the plan variables')
+    parser.add_argument('-ws', action='store_true', dest='warmStart', help='Start from the opening order of the classical heuristics (reverse anneal for QA)')
+    parser.add_argument('-off', action='store_true', dest='offline', help='Use the local stand-in of the QPU for QA')
+    parser.add_argument('-sym', action='store_true', dest='symmetry', help='Break the symmetries of the instance')
+    parser.add_argument('-ts', action='store_true', dest='tightSlack', help='Size w and the slacks from the number of labels with predecessors, saves bits only if some labels have none (see sizeSlacks())')
+    parser.add_argument('-w', type=int, action='store', dest='workers', metavar='Number of processes the reads of SA are split across', default=1)
+    parser.add_argument('-rc', action='store_true', dest='rangeCompile', help='Split the variables of the largest biases before sampling with QA (see rangeCompiler)')
+    parser.add_argument('-rcb', action='store_true', dest='resolveChains', help='Resolve broken chains with the structure of the plan instead of majority votes with QA (see chainBreak)')
+    parser.add_argument('-sb', action='store_true', dest='stopAtBound', help='Sample SA in rounds and stop once a valid sample meets the lower bound (see lowerBounds)')
+    parser.add_argument('-cache', action='store_true', dest='cache', help='Return cached results of identical solves and cache new ones (data/cache)')
+    parser.add_argument('-force', action='store_true', dest='force', help='Recompute even if the solve is cached')
+    parser.add_argument('-instr', type=str, action='store', dest='instrumentation', metavar='Append the instrumentation records to this JSON lines file', default=None)
 
     args = parser.parse_args(sys.argv[1:])
     sequences = parseSequences(args.seqs)
     print("Solving instance " + str(sequences))
+
+    penaltyScales = None
+    if args.calibrate:
+        import penaltyCalibration
+        penaltyScales = penaltyCalibration.getPenaltyScales(sequences, 'pallet', penaltyMul=args.penalty, encoding=args.encoding)
+        print('Using penalty scales', penaltyScales)
     
-    if args.method == 'SA':
-        solveSimAnneal(sequences, args.num_reads, args.penalty)
-    elif args.method == 'QA':
-        solveDWave(sequences, args.num_reads, args.penalty)
+    cache = None
+    if args.cache or args.force:
+        from resultCache import ResultCache
+        cache = ResultCache(force=args.force)
+
+    recorder = None
+    if args.instrumentation is not None:
+        from instrumentation import Recorder
+        recorder = Recorder(memory=True)
+
+    if backends.get(args.method).structured:
+        solveDWave(sequences, args.num_reads, args.penalty, penaltyScales, args.encoding, args.warmStart, args.offline, recorder, cache, args.method, args.symmetry, args.rangeCompile, args.resolveChains, args.tightSlack)
     else:
-        print('Method (-m) must be either SA or QA!') 
+        solveSimAnneal(sequences, args.num_reads, args.penalty, penaltyScales, args.encoding, args.warmStart, recorder, cache, args.method, args.symmetry, args.workers, args.stopAtBound, args.tightSlack)
+
+    if recorder is not None:
+        recorder.summary()
+        recorder.writeJSONLines(args.instrumentation, model='pallet', method=args.method, sequences=sequences, penaltyMul=args.penalty) 
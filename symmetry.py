@@ -0,0 +1,353 @@
+"""! Detection and breaking of symmetries of instances of the stacking problem.
+
+Equivalent optima multiply the states the sampler wanders between. The generators remove them if they are constructed
+with symmetry=True:
+
+Bin model(StackingQUBOGenerator):
+- Identical sequences are interchangeable, so the k-th bin of a sequence is removed before the k-th bin of every
+  later identical sequence. Exchanging which of the identical sequences is ahead at every step turns any plan into
+  one that fulfills this order and removes the same bins at every step.
+- Bins with the same label that are adjacent in a sequence are removed at consecutive steps. Removing the second bin
+  right after the first never opens a stacking place, so the plan variables of the second bin are contracted with
+  the ones of the first. Outside of [dec_bound, binCount-dec_bound-2] this can raise the counted stacking places up to
+  dec_bound, so the answer of the decision problem is preserved but energies below dec_bound may rise to dec_bound.
+- Both orders shrink the window of steps every bin can be removed at, the plan variables outside of it are fixed.
+
+Pallet model(PalletQUBOGenerator):
+- Labels with the same predecessors and successors in the sequence graph(twins) are interchangeable.
+  Their pallets are opened in the order of their labels, which is modeled by ordering penalties between consecutive
+  twins and by fixing the positions no twin of a class can be opened at anymore.
+
+Labels of the bin model whose bins are interchangeable only together with a permutation of the sequences aren't detected.
+Solutions of the reduced models decode with the usual functions of the generators. mapBack() maps a sampleset
+onto the bqm of a generator without symmetry breaking.
+"""
+import math
+
+import dimod
+
+def identicalSequences(sequences):
+    """! Returns the groups of indices of identical(non-empty) sequences that contain more than one sequence"""
+    groups = {}
+    for index, sequence in enumerate(sequences):
+        if len(sequence) > 0:
+            groups.setdefault(tuple(sequence), []).append(index)
+    return [group for group in groups.values() if len(group) > 1]
+
+def labelRuns(sequences, bySequence):
+    """! Returns one list per sequence with the runs of adjacent bins with the same label. A run is a list of bin indices"""
+    res = []
+    for sequence, indices in zip(sequences, bySequence):
+        runs = []
+        for position, index in enumerate(indices):
+            if position > 0 and sequence[position] == sequence[position-1]:
+                runs[-1].append(index)
+            else:
+                runs.append([index])
+        res.append(runs)
+    return res
+
+def repeatedBins(sequences, bySequence):
+    """! Returns the pairs (a, b) of bins with the same label where b directly follows a in its sequence"""
+    return [(run[i], run[i+1]) for runs in labelRuns(sequences, bySequence) for run in runs for i in range(0, len(run)-1)]
+
+def binOrderings(sequences, bySequence):
+    """! Returns the pairs (u, v) of bins where u is removed before v to break the symmetry of identical sequences"""
+    res = []
+    for group in identicalSequences(sequences):
+        for first, second in zip(group, group[1:]):
+            res += list(zip(bySequence[first], bySequence[second]))
+    return res
+
+def removalWindows(binCount, precedences):
+    """! Returns the earliest and the latest step every bin can be removed at
+
+    @param binCount Number of bins
+    @param precedences Pairs (u, v) of bins where u is removed before v. They must not contain cycles
+    @returns (list of earliest steps, list of latest steps)
+    """
+    successors = [[] for _ in range(0, binCount)]
+    predecessors = [[] for _ in range(0, binCount)]
+    for u, v in set(precedences):
+        successors[u].append(v)
+        predecessors[v].append(u)
+
+    #Topological order
+    remaining = [len(predecessors[elem]) for elem in range(0, binCount)]
+    order = [elem for elem in range(0, binCount) if remaining[elem] == 0]
+    for elem in order:
+        for succ in successors[elem]:
+            remaining[succ] -= 1
+            if remaining[succ] == 0:
+                order.append(succ)
+    if len(order) != binCount:
+        raise ValueError('The precedences contain a cycle')
+
+    #Sets of ancestors and descendants as bit masks
+    ancestors = [0]*binCount
+    for elem in order:
+        for pred in predecessors[elem]:
+            ancestors[elem] |= ancestors[pred] | (1 << pred)
+    descendants = [0]*binCount
+    for elem in reversed(order):
+        for succ in successors[elem]:
+            descendants[elem] |= descendants[succ] | (1 << succ)
+
+    earliest = [bin(mask).count('1') for mask in ancestors]
+    latest = [binCount-1-bin(mask).count('1') for mask in descendants]
+    return earliest, latest
+
+def sequencePrecedences(bySequence):
+    """! Returns the pairs of consecutive bins of every sequence"""
+    return [(indices[i], indices[i+1]) for indices in bySequence for i in range(0, len(indices)-1)]
+
+def fixPlan(generator, elem, time, value):
+    """! Adds a fixing of a plan variable of a StackingQUBOGenerator
+
+    @returns Whether the fixing is new
+    """
+    if (elem, time) in generator.toFix:
+        if generator.toFix[(elem, time)] != value:
+            raise ValueError('Contradicting fixings of bin '+str(elem)+' at step '+str(time))
+        return False
+    generator.toFix[(elem, time)] = value
+    generator.planCount -= 1
+    return True
+
+def breakBinSymmetries(generator):
+    """! Adds the symmetry breaking fixings and ordering penalties to a StackingQUBOGenerator and
+    stores the plan variables to contract in generator.contractions(see contractBins()).
+    Has to be called after fixPlanVariables() and before the f(t,c) expressions are modeled.
+    """
+    orderings = binOrderings(generator.sequences, generator.bySequence)
+    pairs = repeatedBins(generator.sequences, generator.bySequence)
+    steps = generator.planSteps()
+
+    earliest, latest = removalWindows(generator.binCount, sequencePrecedences(generator.bySequence)+orderings)
+    for elem in range(0, generator.binCount):
+        for time in range(0, steps):
+            if generator.encoding == 'domainwall':
+                if time < earliest[elem]:
+                    fixPlan(generator, elem, time, 0)
+                elif time >= latest[elem]:
+                    fixPlan(generator, elem, time, 1)
+            elif time < earliest[elem] or time > latest[elem]:
+                fixPlan(generator, elem, time, 0)
+
+    #The plan variables of b at t+1 and of a at t are equal, so their fixings are shared
+    changed = True
+    while changed:
+        changed = False
+        for a, b in pairs:
+            for time in range(0, steps-1):
+                if (a, time) in generator.toFix:
+                    changed |= fixPlan(generator, b, time+1, generator.toFix[(a, time)])
+                elif (b, time+1) in generator.toFix:
+                    changed |= fixPlan(generator, a, time, generator.toFix[(b, time+1)])
+
+    penalty = generator.penalty('sequenceOrder')
+    for u, v in orderings:
+        if generator.encoding == 'domainwall':
+            #u before v: d(v,t) => d(u,t-1): d(v,t)-d(v,t)d(u,t-1)
+            for time in range(1, steps):
+                if generator.toFix.get((v, time)) == 0 or generator.toFix.get((u, time-1)) == 1:
+                    continue
+                generator.bqm.add_variable(generator.wallName(v, time), penalty)
+                generator.bqm.add_interaction(generator.wallName(v, time), generator.wallName(u, time-1), -penalty)
+        else:
+            #Penalize v at step t and u at any later step
+            for vTime in range(0, steps):
+                if (v, vTime) in generator.toFix:
+                    continue
+                for uTime in range(vTime+1, steps):
+                    if (u, uTime) not in generator.toFix:
+                        generator.bqm.add_interaction(generator.variableName(v, vTime), generator.variableName(u, uTime), penalty)
+
+    generator.contractions = [(generator.planVariableName(a, time), generator.planVariableName(b, time+1))
+            for a, b in pairs for time in range(0, steps-1) if (a, time) not in generator.toFix]
+
+def contractBins(generator):
+    """! Contracts the plan variables stored by breakBinSymmetries() after the fixed variables have been removed.
+    The removed variables are recorded in generator.aliases, which maps them to the variable they equal.
+    """
+    for kept, removed in generator.contractions:
+        kept = generator.aliases.get(kept, kept)
+        generator.bqm.contract_variables(kept, removed)
+        generator.aliases[removed] = kept
+        generator.planCount -= 1
+
+def canonicalBinOrder(generator, order):
+    """! Returns the removal order that corresponds to the given one in the model with broken symmetries.
+    Runs of bins with the same label are removed at once and identical sequences are removed in their order.
+    The number of stacking places never increases.
+
+    @param order A valid removal order of the instance
+    """
+    runs = labelRuns(generator.sequences, generator.bySequence)
+    runOf = {}
+    for sequence, sequenceRuns in enumerate(runs):
+        for index, run in enumerate(sequenceRuns):
+            for elem in run:
+                runOf[elem] = (sequence, index)
+
+    groupOf = {}
+    for group in identicalSequences(generator.sequences):
+        progress = [0]*len(group)
+        for sequence in group:
+            groupOf[sequence] = (group, progress)
+
+    res = []
+    done = set()
+    for elem in order:
+        sequence, index = runOf[elem]
+        if (sequence, index) in done:
+            continue
+        done.add((sequence, index))
+        if sequence in groupOf:
+            #The first sequence of the group that has removed as many runs removes the next one instead
+            group, progress = groupOf[sequence]
+            member = progress.index(index)
+            progress[member] += 1
+            sequence = group[member]
+        res += runs[sequence][index]
+    return res
+
+def twinLabels(numLabels, sequenceGraph):
+    """! Returns the classes of interchangeable labels of the pallet model that contain more than one label.
+    Two labels are interchangeable if exchanging them maps the sequence graph onto itself.
+
+    @param numLabels Number of labels. Labels are 0...numLabels-1
+    @param sequenceGraph Edges of the sequence graph, see PalletQUBOGenerator.constructSequenceGraph()
+    """
+    edges = set(sequenceGraph)
+    predecessors = {label:set() for label in range(0, numLabels)}
+    successors = {label:set() for label in range(0, numLabels)}
+    for u, v in edges:
+        successors[u].add(v)
+        predecessors[v].add(u)
+
+    def twins(i, j):
+        return (predecessors[i]-{j} == predecessors[j]-{i} and successors[i]-{j} == successors[j]-{i}
+                and ((i, j) in edges) == ((j, i) in edges))
+
+    classes = []
+    for label in range(0, numLabels):
+        for cls in classes:
+            if all(twins(label, other) for other in cls):
+                cls.append(label)
+                break
+        else:
+            classes.append([label])
+    return [cls for cls in classes if len(cls) > 1]
+
+def breakPalletSymmetries(generator):
+    """! Adds the symmetry breaking fixings and ordering penalties to a PalletQUBOGenerator with a generated bqm.
+    The fixed plan variables are recorded in generator.fixed.
+    """
+    n = generator.numLabels
+    penalty = generator.penalty('permutation')
+    for cls in twinLabels(n, generator.sequenceGraph):
+        k = len(cls)
+        #The m-th twin of a class has m twins before and k-m-1 twins after it
+        for m, label in enumerate(cls):
+            for j in range(0, n):
+                if generator.encoding == 'domainwall':
+                    if j < m:
+                        generator.fixed[generator.wallName(label, j)] = 0
+                    elif n-k+m <= j < n-1:
+                        generator.fixed[generator.wallName(label, j)] = 1
+                elif j < m or j > n-k+m:
+                    generator.fixed[generator.varName(label, j)] = 0
+
+        for first, second in zip(cls, cls[1:]):
+            if generator.encoding == 'domainwall':
+                #first before second: d(second,j) => d(first,j-1)
+                for j in range(1, n-1):
+                    generator.bqm.add_variable(generator.wallName(second, j), penalty)
+                    generator.bqm.add_interaction(generator.wallName(second, j), generator.wallName(first, j-1), -penalty)
+            else:
+                for secondPosition in range(0, n):
+                    for firstPosition in range(secondPosition+1, n):
+                        generator.bqm.add_interaction(generator.varName(second, secondPosition), generator.varName(first, firstPosition), penalty)
+
+    for name, value in generator.fixed.items():
+        if name in generator.bqm.variables:
+            generator.bqm.fix_variable(name, value)
+
+def canonicalPalletOrder(generator, order):
+    """! Returns the opening order that opens the twins of every class in the order of their labels.
+    Exchanging twins doesn't change the number of stacking places.
+
+    @param order List of labels in the order their pallets are opened
+    """
+    res = list(order)
+    position = {label:j for j, label in enumerate(order)}
+    for cls in twinLabels(generator.numLabels, generator.sequenceGraph):
+        for label, j in zip(cls, sorted(position[label] for label in cls)):
+            res[j] = label
+    return res
+
+def analyze(sequences):
+    """! Returns a dict that describes the symmetries of the instance.
+    binSymmetry and palletSymmetry are the number of equivalent plans per plan that are removed by breaking
+    the symmetries of identical sequences and twin labels(without the contraction of repeated bins).
+    """
+    bySequence = []
+    index = 0
+    for sequence in sequences:
+        bySequence.append(list(range(index, index+len(sequence))))
+        index += len(sequence)
+
+    labels = sorted(set(label for sequence in sequences for label in sequence))
+    graph = set()
+    for sequence in sequences:
+        for position, label in enumerate(sequence):
+            for earlier in sequence[:position]:
+                if earlier != label:
+                    graph.add((earlier, label))
+    number = {label:i for i, label in enumerate(labels)}
+    twins = [[labels[i] for i in cls] for cls in twinLabels(len(labels), [(number[u], number[v]) for u, v in graph])]
+
+    groups = identicalSequences(sequences)
+    return {'identicalSequences':groups, 'repeatedBins':len(repeatedBins(sequences, bySequence)), 'twinLabels':twins,
+            'binSymmetry':math.prod(math.factorial(len(group)) for group in groups),
+            'palletSymmetry':math.prod(math.factorial(len(cls)) for cls in twins)}
+
+def restoreSample(generator, sample):
+    """! Returns the sample with the values of the fixed and contracted plan variables added"""
+    values = dict(sample)
+    if hasattr(generator, 'toFix'):
+        for (elem, time), value in generator.toFix.items():
+            values[generator.planVariableName(elem, time)] = value
+        for removed, kept in generator.aliases.items():
+            values[removed] = values.get(kept, 0)
+    else:
+        values.update(generator.fixed)
+    return values
+
+def mapBack(sampleset, generator, target):
+    """! Maps a sampleset of a generator with broken symmetries onto the bqm of a generator of the same instance without.
+    Samples that decode to a valid plan are replaced by the full assignment of the plan(see sampleFromOrder()),
+    the plan variables of the others are copied.
+
+    @param sampleset Sampleset of generator.bqm
+    @param generator Generator constructed with symmetry=True
+    @param target Generator of the same instance constructed with symmetry=False
+    @returns Sampleset of target.bqm with the same number of occurrences and info
+    """
+    variables = list(target.bqm.variables)
+    samples = []
+    for sample in sampleset.samples():
+        values = restoreSample(generator, sample)
+        if hasattr(generator, 'decodeRemovalOrder'):
+            order = generator.decodeRemovalOrder(values)
+        else:
+            order = generator.decodeOpeningOrder(values)
+        if order is not None:
+            values = target.sampleFromOrder(order)
+        samples.append([values.get(var, 0) for var in variables])
+
+    res = dimod.SampleSet.from_samples_bqm((samples, variables), target.bqm, num_occurrences=sampleset.record.num_occurrences)
+    res.info.update(sampleset.info)
+    res.info['bqm'] = target.bqm
+    return res
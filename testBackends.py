@@ -0,0 +1,40 @@
+import os
+import tempfile
+import subprocess
+import sys
+
+import dimod
+import backends
+import stacking
+import stackingPallet
+
+#Saved samplesets go to a temporary directory instead of data/
+os.environ['STACKING_DATA'] = tempfile.mkdtemp()
+
+#Importing the generators doesn't import the cloud client or the plotting libraries
+imported = subprocess.run([sys.executable, '-c', 'import sys, stacking, stackingPallet, batchSolve, pipeline;'
+        'print(",".join(m for m in ["dwave.system", "dwave.inspector", "matplotlib"] if m in sys.modules))'],
+        capture_output=True, text=True, check=True).stdout.strip()
+assert(imported == ''), imported
+
+assert(backends.names()[:3] == ['SA', 'QA', 'OFFLINE'])
+assert(not backends.get('SA').structured and backends.get('OFFLINE').structured)
+try:
+    backends.get('GPU')
+    assert(False)
+except ValueError:
+    pass
+
+#Structured backends are embedded unless requested otherwise
+assert(type(backends.getSampler('OFFLINE')).__name__ == 'EmbeddingComposite')
+assert(type(backends.getSampler('OFFLINE', embed=False)).__name__ == 'OfflineDWaveSampler')
+
+#Registered backends can be used by the solve functions
+backends.register('RANDOM', 'Uniformly random samples', dimod.RandomSampler)
+sampleset = stacking.solveSimAnneal([[0,1],[1,0]], 7, 1, backend='RANDOM')[1]
+assert(len(sampleset) == 7)
+sampleset = stackingPallet.solveSimAnneal([[0,1],[1,0]], 7, backend='RANDOM')[1]
+assert(len(sampleset) == 7 and sampleset.info['bqm'] is not None)
+
+offline = stackingPallet.solveDWave([[0,1],[1,0]], 10, offline=True)
+assert(offline.info['embedding_context']['embedding'] is not None)
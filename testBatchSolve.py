@@ -0,0 +1,32 @@
+from offlineSampler import OfflineDWaveSampler
+import batchSolve
+
+instances = [[[0,1],[1,0]], [[0,2,1],[1,0,2]], [[0,1,3,2],[3,1,0,2]]]
+
+#The merged bqm is the disjoint union of the instances
+generators = batchSolve.buildGenerators(instances)
+merged = batchSolve.mergeBQMs([generator.bqm for generator in generators], normalize=False)
+assert(len(merged) == sum(len(generator.bqm) for generator in generators))
+assert(merged.num_interactions == sum(generator.bqm.num_interactions for generator in generators))
+
+#The instances are embedded on disjoint qubits
+sampler = OfflineDWaveSampler(topology_shape=[6])
+embedding, end = batchSolve.embedBatch([generator.bqm for generator in generators], sampler.edgelist, seed=1)
+assert(end == 3)
+qubits = [qubit for chain in embedding.values() for qubit in chain]
+assert(len(qubits) == len(set(qubits)))
+
+#Every instance gets its own sampleset with its own energies and info
+samplesets = batchSolve.solveBatch(instances, 20, sampler=sampler, save=False, seed=1)
+assert(len(samplesets) == 3)
+for sequences, sampleset in zip(instances, samplesets):
+    assert(sampleset.info['sequences'] == sequences)
+    assert(set(sampleset.variables) == set(sampleset.info['bqm'].variables))
+    assert(all(sampleset.info['bqm'].energy(sample) == energy for sample, energy in sampleset.data(['sample', 'energy'])))
+    assert(sampleset.info['batch']['submissionSize'] == 3)
+
+#Instances that don't fit are moved to another submission
+samplesets = batchSolve.solveBatch([[[0,1],[1,0]]]*40, 5, model='bin', sampler=OfflineDWaveSampler(topology_type='chimera', topology_shape=[4,4,4]), save=False, seed=1)
+assert(len(samplesets) == 40)
+assert(samplesets[-1].info['submission'] > 0)
+assert([sampleset.info['batch']['index'] for sampleset in samplesets] == list(range(0, 40)))
@@ -0,0 +1,19 @@
+import benchmark
+
+def case(**changes):
+    metrics = {'generateTime':0.1, 'analysisTime':0.1, 'variables':100, 'interactions':500,
+               'peakMemory':10000, 'readsPerSecond':1000.0}
+    metrics.update(changes)
+    return {'meta':{}, 'cases':{'bin-l2-s2-onehot':metrics}}
+
+baseline = case()
+assert(benchmark.compare(case(), baseline) == [])
+assert(benchmark.compare(case(generateTime=0.11, peakMemory=10500, readsPerSecond=900.0), baseline) == [])
+assert(benchmark.compare(case(variables=99, interactions=400), baseline) == [])
+
+metrics = [regression[1] for regression in benchmark.compare(case(generateTime=0.2, interactions=501, readsPerSecond=500.0), baseline)]
+assert(metrics == ['generateTime', 'interactions', 'readsPerSecond'])
+
+#Differences below minDifference are noise
+baseline = case(analysisTime=0.001)
+assert(benchmark.compare(case(analysisTime=0.004), baseline) == [])
@@ -0,0 +1,62 @@
+import dimod
+import numpy as np
+
+import bqmKernels
+import collectConstStats
+from stacking import StackingQUBOGenerator
+from stackingPallet import PalletQUBOGenerator
+
+rng = np.random.default_rng(0)
+
+generator = StackingQUBOGenerator([[0,1,2,0],[1,2,0,1]], 1, encoding='domainwall')
+generator.generateBQM()
+compiled = generator.compiledBQM()
+assert(generator.compiledBQM() is compiled)
+
+#Both evaluation paths agree with dimod, also for samples with another column order
+for count in [50, bqmKernels.PAIR_SAMPLES+50]:
+    samples = (rng.random((count, len(compiled))) < 0.3).astype(np.int8)
+    labels = list(reversed(compiled.labels))
+    assert(np.allclose(compiled.energies((samples, labels)), generator.bqm.energies((samples, labels))))
+
+#SPIN bqms and samplesets
+spin = PalletQUBOGenerator([[0,1,3,2],[3,1,0,2]]).bqm.spin
+sampleset = dimod.SampleSet.from_samples_bqm((2*(rng.random((30, len(spin))) < 0.5)-1, list(spin.variables)), spin)
+assert(np.allclose(bqmKernels.CompiledBQM(spin).energies(sampleset), sampleset.record.energy))
+
+#Flip deltas are the energy changes of single flips and stay correct after flips
+rows = compiled.rows((samples[:5], labels))
+deltas = compiled.flipDeltas((samples[:5], labels))
+sample, delta = rows[0], deltas[0]
+for i in [3, 7, 3, 20]:
+    before = compiled.matrixEnergies(sample[:, None] != 0)[0]
+    expected = delta[i]
+    compiled.flip(sample, delta, i)
+    assert(np.isclose(compiled.matrixEnergies(sample[:, None] != 0)[0]-before, expected))
+assert(np.allclose(delta, compiled.flipDeltas(compiled.sampleset(rows[:1]))[0]))
+
+#A bqm compiled in the order of a sampleset shares its matrix
+partial = StackingQUBOGenerator([[0,1,2,0],[1,2,0,1]], 1, encoding='domainwall')
+partial.permutationConstraint()
+sampleset = compiled.sampleset(rows)
+collectConstStats.completePartialBQM(sampleset, partial)
+shared = partial.compiledBQM(list(sampleset.variables))
+assert(shared.labels == list(sampleset.variables))
+assert(np.allclose(shared.matrixEnergies(shared.matrix(sampleset)), partial.bqm.energies(sampleset)))
+
+#Changes of the bqm invalidate the cache
+generator.bqm.add_interaction(compiled.labels[0], compiled.labels[1], 5)
+generator.bqm.add_variable('new', 1)
+assert(generator.compiledBQM() is not compiled)
+
+#So do in place changes of biases that keep the variables, interactions and offset
+current = generator.compiledBQM()
+u, v = next(iter(generator.bqm.quadratic))
+generator.bqm.set_quadratic(u, v, generator.bqm.get_quadratic(u, v)+1)
+recompiled = generator.compiledBQM()
+assert(recompiled is not current and generator.compiledBQM() is recompiled)
+generator.bqm.set_linear(u, generator.bqm.get_linear(u)-2)
+assert(generator.compiledBQM() is not recompiled)
+samples = (rng.random((20, len(generator.bqm))) < 0.3).astype(np.int8)
+variables = list(generator.bqm.variables)
+assert(np.allclose(generator.compiledBQM().energies((samples, variables)), generator.bqm.energies((samples, variables))))
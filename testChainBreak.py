@@ -0,0 +1,70 @@
+import os
+import tempfile
+import numpy as np
+import dimod
+from dwave.embedding import unembed_sampleset
+from dwave.embedding.chain_breaks import majority_vote
+from stacking import StackingQUBOGenerator
+from stackingPallet import PalletQUBOGenerator, solveDWave
+import warmStart
+import chainBreak
+
+#Saved samplesets go to a temporary directory instead of data/
+os.environ['STACKING_DATA'] = tempfile.mkdtemp()
+
+#Vote fractions of chains of different lengths
+values = np.array([[1,0,1,1,0,0], [0,0,0,1,1,1]], dtype=bool)
+fractions = chainBreak.voteFractions(values, [[0,1], [2], [3,4,5]])
+assert(np.allclose(fractions, [[0.5, 1, 1/3], [0, 0, 1]]))
+
+#The groups of the generators are the rows and columns of the permutation
+pallet = PalletQUBOGenerator([[0,1,2],[2,1,0]])
+groups = pallet.oneHotGroups()
+assert(len(groups) == 6 and all(len(group) == 3 for group in groups))
+assert(all(var in pallet.bqm.variables for group in groups for var in group))
+assert(PalletQUBOGenerator([[0,1],[1,0]], encoding='domainwall').oneHotGroups() == [])
+generator = StackingQUBOGenerator([[0,1],[1,0]], 1)
+generator.generateBQM()
+assert(all(var in generator.bqm.variables for group in generator.oneHotGroups() for var in group))
+
+#Embed the plan of the heuristics with chains of three qubits and break chains of the plan variables.
+#Majority votes drop the opening position of label 0, the resolver restores it from the row and the column
+state = warmStart.heuristicState(pallet)
+variables = list(pallet.bqm.variables)
+embedding = {var:[(var, k) for k in range(0, 3)] for var in variables}
+order = pallet.decodeOpeningOrder(state)
+opened = pallet.varName(order[0], 0)
+wrong = pallet.varName(order[1], 0)
+reads = []
+for read in range(0, 4):
+    qubits = {qubit:state[var] for var in variables for qubit in embedding[var]}
+    qubits[(opened, 0)] = qubits[(opened, 1)] = 0
+    if read % 2 == 1:
+        qubits[(wrong, 0)] = 1
+    reads.append(qubits)
+target = dimod.SampleSet.from_samples(reads, dimod.BINARY, 0)
+majority = unembed_sampleset(target, embedding, pallet.bqm, chain_break_method=majority_vote)
+resolver = chainBreak.resolver(pallet)
+resolved = unembed_sampleset(target, embedding, pallet.bqm, chain_break_method=resolver)
+assert(chainBreak.validFraction(pallet, majority) == 0 and chainBreak.validFraction(pallet, resolved) == 1)
+assert(resolver.stats['brokenChains'] == 6 and resolver.stats['brokenReads'] == 4)
+assert(all(pallet.decodeOpeningOrder(sample) == order for sample in resolved.samples()))
+assert(resolved.first.energy == pallet.bqm.energy(state))
+
+#SPIN samples give the same plan
+spinTarget = dimod.SampleSet.from_samples([{qubit:2*value-1 for qubit, value in read.items()} for read in reads], dimod.SPIN, 0)
+spinResolved = unembed_sampleset(spinTarget, embedding, pallet.bqm, chain_break_method=resolver)
+assert(chainBreak.validFraction(pallet, spinResolved) == 1)
+
+#Reads whose majority vote is valid keep it
+intact = dimod.SampleSet.from_samples([{qubit:state[var] for var in variables for qubit in embedding[var]}], dimod.BINARY, 0)
+assert(unembed_sampleset(intact, embedding, pallet.bqm, chain_break_method=resolver).first.sample == state)
+
+#On the offline stand-in the resolver never loses valid reads of the majority vote
+res = chainBreak.compare(pallet, 50, prefactor=0.5, seed=1)
+assert(res['structureAware'] >= res['majorityVote'])
+
+#solveDWave unembeds with the resolver
+sampleset = solveDWave([[0,1],[1,0]], 10, offline=True, resolveChains=True)
+assert(sampleset.info['resolveChains'])
+assert(sampleset.info['embedding_context']['chain_break_method'] == 'structureAware')
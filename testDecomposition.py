@@ -0,0 +1,41 @@
+import random
+import heuristics
+import lowerBounds
+import decomposition
+
+#Labels that never share a sequence and labels that are only removed one after another form separate blocks
+sequences = [[0,1,0],[1,0,2,2],[3,4],[4,3,5]]
+assert(decomposition.components(sequences) == [[0,1],[2],[3,4],[5]])
+blocks = decomposition.decompose(sequences)
+assert(blocks[0]['sequences'] == [[0,1,0],[1,0]] and blocks[0]['bins'] == [0,1,2,3,4])
+assert(blocks[1]['sequences'] == [[0,0]] and blocks[1]['bins'] == [5,6])
+assert(blocks[3]['labels'] == [5] and blocks[3]['bins'] == [11])
+
+#The optimum of an instance is the maximum of the optima of its blocks
+rng = random.Random(1)
+for _ in range(0, 30):
+    sequences = [[rng.randrange(0, 6) for _ in range(0, rng.randrange(1, 4))] for _ in range(0, 3)]
+    labels = sorted(set(heuristics.binLabels(sequences)))
+    sequences = [[labels.index(label) for label in sequence] for sequence in sequences]
+    blocks = decomposition.decompose(sequences)
+    assert(lowerBounds.binStateBound(sequences) == max(lowerBounds.binStateBound(block['sequences']) for block in blocks))
+    assert(lowerBounds.palletSubsetBound(sequences) == max(lowerBounds.palletSubsetBound(block['sequences']) for block in blocks))
+
+#The concatenated plans are valid and need the maximum of the blocks
+sequences = [[0,1,2,0,1,2],[2,1,0,2],[3,4,5,3],[5,4,3,4],[6,7,6,8,8]]
+for model in decomposition.MODELS:
+    res = decomposition.solveDecomposed(sequences, model, 50, seed=1)
+    assert(res['objective'] == max(block['objective'] for block in res['blocks']))
+    assert(res['planVariables']['largestBlock'] < res['planVariables']['monolithic'])
+    if model == 'bin':
+        assert(heuristics.isValidOrder(sequences, res['plan']))
+    else:
+        assert(sorted(res['plan']) == list(range(0, 9)))
+res = decomposition.solveDecomposed(sequences, 'pallet', 50, workers=2, seed=1, tightSlack=True)
+assert(res['objective'] == decomposition.solveDecomposed(sequences, 'pallet', 50, seed=1)['objective'])
+
+#Blocks that the heuristics don't prove optimal are sampled
+value, plan, variables = decomposition.samplePlan([[0,1,2],[2,1,0]], 'pallet', 50, seed=1, tightSlack=True)
+assert(value == heuristics.palletObjective([[0,1,2],[2,1,0]], plan) and variables > 9)
+value, plan, variables = decomposition.samplePlan([[0,1,0],[1,0,1]], 'bin', 50, seed=1)
+assert(heuristics.isValidOrder([[0,1,0],[1,0,1]], plan) and value == heuristics.upperBound([[0,1,0],[1,0,1]])[0])
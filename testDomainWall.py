@@ -0,0 +1,60 @@
+from stacking import StackingQUBOGenerator
+from stackingPallet import PalletQUBOGenerator
+
+def wallSample(gen, times, steps):
+    """Domain wall sample for the given removal time of each bin"""
+    sample = {}
+    for index, time in enumerate(times):
+        for t in range(0, steps):
+            sample[gen.wallName(index, t)] = 1 if t >= time else 0
+    return sample
+
+#PERMUTATION
+gen = StackingQUBOGenerator([[0,1],[1,0]], encoding='domainwall')
+gen.permutationConstraint()
+
+sample = wallSample(gen, [0,2,1,3], 3)
+assert(gen.bqm.energy(sample) == 0)
+assert(gen.decodeRemovalOrder(sample) == [0,2,1,3])
+
+sample = wallSample(gen, [0,1,1,3], 3) #Two bins at the same time
+assert(gen.bqm.energy(sample) > 0)
+assert(gen.decodeRemovalOrder(sample) is None)
+
+sample = wallSample(gen, [0,2,1,3], 3)
+sample['d(0,1)'] = 0 #Wall falls back
+assert(gen.bqm.energy(sample) > 0)
+assert(gen.decodeRemovalOrder(sample) is None)
+
+#SEQUENCE_ORDER
+gen = StackingQUBOGenerator([[0,1,2],[2,1,0]], encoding='domainwall')
+gen.sequenceOrder()
+assert(gen.bqm.energy(wallSample(gen, [0,3,4,1,2,5], 5)) == 0)
+assert(gen.bqm.energy(wallSample(gen, [0,4,3,1,2,5], 5)) > 0)
+
+#Full model, the optimum of the one-hot and the domain wall model is the same
+for sequences in [[[0,1],[1,0]], [[0,2,1],[1,0,2]]]:
+    oneHot = StackingQUBOGenerator(sequences)
+    oneHot.generateBQM()
+    wall = StackingQUBOGenerator(sequences, encoding='domainwall')
+    wall.generateBQM()
+    assert(wall.bqm.num_interactions < oneHot.bqm.num_interactions)
+    assert(len(wall.bqm) < len(oneHot.bqm))
+
+#Labels with a single bin are started and finished at once and never need a stacking place
+oneHot = StackingQUBOGenerator([[0,1,2,0],[1,3,2]], 0)
+oneHot.generateBQM()
+wall = StackingQUBOGenerator([[0,1,2,0],[1,3,2]], 0, encoding='domainwall')
+wall.generateBQM()
+for order in [[0,1,2,3,4,5,6], [4,5,0,6,1,2,3]]:
+    assert(wall.bqm.energy(wall.sampleFromOrder(order)) == oneHot.bqm.energy(oneHot.sampleFromOrder(order)))
+
+#Pallet
+gen = PalletQUBOGenerator([[0,1,3,2],[3,1,0,2]], autoGenerate=False, encoding='domainwall')
+gen.permutationConstraint()
+sample = wallSample(gen, [2,1,3,0], 3)
+assert(gen.bqm.energy(sample) == 0)
+assert(gen.decodeOpeningOrder(sample) == [3,1,0,2])
+sample = wallSample(gen, [2,2,3,0], 3)
+assert(gen.bqm.energy(sample) > 0)
+assert(gen.decodeOpeningOrder(sample) is None)
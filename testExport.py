@@ -0,0 +1,61 @@
+import os
+import tempfile
+
+import dimod
+import numpy as np
+
+from stackingPallet import PalletQUBOGenerator
+import qaUtils
+
+directory = tempfile.mkdtemp()
+bqm = PalletQUBOGenerator([[0,1,3,2],[3,1,0,2]]).bqm
+bqm.offset = 1.5
+
+#The archives contain the same bqm in both layouts
+for layout in ['coo', 'csr']:
+    path = os.path.join(directory, 'bqm-'+layout+'.npz')
+    qaUtils.exportNPZ(path, bqm, layout)
+    assert(qaUtils.importNPZ(path) == bqm)
+
+#Labels keep their type and spin bqms stay spin bqms
+mixed = dimod.BinaryQuadraticModel({1:0.5, 0:-1, 'a':2, ('x',(1,2)):1, 2.5:0, (3,):-3}, {(1,0):-2, ('a',('x',(1,2))):1.5, (0,2.5):1}, 0.25, 'SPIN')
+for layout in ['coo', 'csr']:
+    path = os.path.join(directory, 'mixed-'+layout+'.npz')
+    qaUtils.exportNPZ(path, mixed, layout)
+    imported = qaUtils.importNPZ(path)
+    assert(imported.vartype is dimod.SPIN and imported == mixed)
+    assert(list(imported.variables) == list(mixed.variables))
+    assert(qaUtils.AdjacencyIndex.fromNPZ(path).labels == list(mixed.variables))
+try:
+    qaUtils.exportNPZ(os.path.join(directory, 'frozen.npz'), dimod.BinaryQuadraticModel({frozenset([1]):1}, {}, 0, 'BINARY'))
+    assert(False)
+except ValueError:
+    pass
+
+#Text formats: one line per nonzero entry and the header
+linear = sum(1 for bias in bqm.linear.values() if bias != 0)
+path = os.path.join(directory, 'bqm.mtx')
+qaUtils.exportMatrixMarket(path, bqm)
+lines = [line for line in open(path) if not line.startswith('%')]
+assert(lines[0].split() == [str(len(bqm)), str(len(bqm)), str(linear+bqm.num_interactions)])
+assert(len(lines) == 1+linear+bqm.num_interactions)
+
+path = os.path.join(directory, 'bqm.qubo')
+qaUtils.exportQubo(path, bqm)
+lines = [line.split() for line in open(path) if not line.startswith('c')]
+assert(lines[0] == ['p', 'qubo', '0', str(len(bqm)), str(linear), str(bqm.num_interactions)])
+labels = list(bqm.variables)
+energy = 1.5
+sample = {var:int(i%3 == 0) for i, var in enumerate(labels)}
+for i, j, value in lines[1:]:
+    energy += float(value)*sample[labels[int(i)]]*sample[labels[int(j)]]
+assert(abs(energy-bqm.energy(sample)) < 1e-9)
+
+#The dense view is limited to small bqms
+small = dimod.BinaryQuadraticModel({'a':1, 'b':-2.5}, {('a','b'):3}, 0, 'BINARY')
+assert(qaUtils.denseView(small) == ' ,a,b\na,1,3\nb, ,-2.5\n')
+try:
+    qaUtils.denseView(bqm, maxVariables=10)
+    assert(False)
+except ValueError:
+    pass
@@ -0,0 +1,26 @@
+import heuristics
+import lowerBounds
+from instanceGenerator import generalSequences
+
+sequences = [[0,1,0],[2,1,2]]
+assert(heuristics.binIndices(sequences) == [[0,1,2],[3,4,5]])
+assert(heuristics.binLabels(sequences) == [0,1,0,2,1,2])
+assert(heuristics.isValidOrder(sequences, [0,3,1,4,2,5]))
+assert(not heuristics.isValidOrder(sequences, [1,0,3,4,2,5]) and not heuristics.isValidOrder(sequences, [0,1,2,3,4]))
+
+#Labels 0 and 2 are open while label 1 is removed
+assert(heuristics.stackingPlacesProfile(sequences, [0,3,1,4,2,5]) == [1,2,3,2,1,0])
+assert(heuristics.stackingPlaces(sequences, [0,1,2,3,4,5]) == 2)
+assert(heuristics.trivialLowerBound(sequences) == 1 and heuristics.trivialLowerBound([[0,1],[2]]) == 0)
+assert(heuristics.openingOrder(sequences, [3,0,1,4,2,5]) == [2,0,1])
+assert(heuristics.palletObjective([[0,1,2],[2,1,0]], [0,1,2]) == 2)
+
+#The heuristic plans are valid and never beat the exact optimum of the bin or the pallet model
+for seed in range(0, 10):
+    sequences = generalSequences(3, 4, 10, seed=seed)
+    assert(heuristics.isValidOrder(sequences, heuristics.greedyRemovalOrder(sequences)))
+    assert(all(heuristics.isValidOrder(sequences, order) for order in heuristics.serialRemovalOrders(sequences)))
+    places, order = heuristics.upperBound(sequences)
+    assert(heuristics.stackingPlaces(sequences, order) == places >= lowerBounds.binStateBound(sequences))
+    value, labelOrder = heuristics.palletUpperBound(sequences)
+    assert(heuristics.palletObjective(sequences, labelOrder) == value >= lowerBounds.palletSubsetBound(sequences))
@@ -0,0 +1,39 @@
+import os
+import tempfile
+from collections import Counter
+
+import instanceGenerator
+
+#The same seed gives the same instance
+assert(instanceGenerator.twoSequences(4, 3, 7) == instanceGenerator.twoSequences(4, 3, 7))
+assert(instanceGenerator.generalSequences(3, 5, 40, 1.0, 0.5, 3) == instanceGenerator.generalSequences(3, 5, 40, 1.0, 0.5, 3))
+
+#twoSequences contains every label labelSize times
+counts = Counter(label for sequence in instanceGenerator.twoSequences(4, 3, 1) for label in sequence)
+assert(counts == {label:3 for label in range(0, 4)})
+
+#General instances use every label and distribute the bins evenly over the sequences
+sequences = instanceGenerator.generalSequences(3, 6, 50, skew=1.5, seed=2)
+assert(sorted(len(sequence) for sequence in sequences) == [16, 17, 17])
+counts = Counter(label for sequence in sequences for label in sequence)
+assert(set(counts) == set(range(0, 6)))
+assert(counts[0] > counts[5]) #Skewed towards the first labels
+
+#Without interleaving, the bins of a label are next to each other in every sequence
+for sequence in instanceGenerator.generalSequences(2, 5, 30, interleaving=0.0, seed=4):
+    seen = []
+    for label in sequence:
+        if len(seen) == 0 or seen[-1] != label:
+            assert(label not in seen)
+            seen.append(label)
+
+#Corpora are written and read one instance at a time
+grid = {'numSequences':[2, 3], 'labelCount':[4], 'binCount':[12, 20], 'skew':[0.0], 'interleaving':[1.0]}
+for name in ['corpus.jsonl', 'corpus.jsonl.gz']:
+    path = os.path.join(tempfile.mkdtemp(), name)
+    assert(instanceGenerator.writeCorpus(path, instanceGenerator.generateFamily('general', grid, repeats=2)) == 8)
+    instances = list(instanceGenerator.readCorpus(path))
+    assert(len(instances) == 8)
+    assert(len(set(instance['id'] for instance in instances)) == 8)
+    assert(instances == list(instanceGenerator.generateFamily('general', grid, repeats=2)))
+    assert(len(list(instanceGenerator.readSequences(path, lambda instance: instance['params']['numSequences'] == 3))) == 4)
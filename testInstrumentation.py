@@ -0,0 +1,46 @@
+import json
+import os
+import tempfile
+
+from stacking import StackingQUBOGenerator
+from stackingPallet import PalletQUBOGenerator
+import stacking
+import instrumentation
+
+#Saved samplesets go to a temporary directory instead of data/
+os.environ['STACKING_DATA'] = tempfile.mkdtemp()
+
+#Every stage of the bin generator is recorded with the size of the bqm after it
+recorder = instrumentation.Recorder(memory=True)
+gen = StackingQUBOGenerator([[0,1,2,0],[2,1,0,1]], 0, recorder=recorder)
+with recorder.stage('generateBQM', gen.bqm):
+    gen.generateBQM()
+stages = [record['stage'] for record in recorder.records]
+assert(stages == ['permutationConstraint', 'fixPlanVariables', 'sequenceOrder', 'ftcConstraint',
+                  'countStackingPlacesConstraint', 'fixVariables', 'objective', 'generateBQM'])
+assert(recorder.records[-2]['variables'] == len(gen.bqm))
+assert(sum(record['variablesAdded'] for record in recorder.records[:-1]) == len(gen.bqm))
+assert(recorder.records[-1]['variablesAdded'] == len(gen.bqm))
+assert(all(record['wall'] >= 0 and record['cpu'] >= 0 for record in recorder.records))
+#The peak of the enclosing stage covers the peaks of the nested ones
+assert(recorder.records[-1]['memoryPeak'] >= max(record['memoryPeak'] for record in recorder.records[:-1]))
+
+recorder = instrumentation.Recorder()
+gen = PalletQUBOGenerator([[0,1,3,2],[3,1,0,2]], recorder=recorder)
+assert([record['stage'] for record in recorder.records] == ['constructSequenceGraph', 'permutationConstraint', 'yjc', 'inequalityConstraints', 'objective'])
+assert('memoryDelta' not in recorder.records[0])
+
+#Disabled instrumentation records nothing
+gen = StackingQUBOGenerator([[0,1],[1,0]])
+gen.generateBQM()
+assert(gen.recorder is instrumentation.NULL_RECORDER and len(instrumentation.NULL_RECORDER.records) == 0)
+
+#The records of a solve are attached to the sampleset and can be exported
+recorder = instrumentation.Recorder()
+res = stacking.solveSimAnneal([[0,1],[1,0]], 10, 0, recorder=recorder)
+assert(res[1].info['instrumentation'] is recorder.records)
+assert('sample' in [record['stage'] for record in recorder.records])
+path = os.path.join(tempfile.mkdtemp(), 'records.jsonl')
+recorder.writeJSONLines(path, run=1)
+lines = [json.loads(line) for line in open(path)]
+assert(len(lines) == len(recorder.records) and all(line['run'] == 1 for line in lines))
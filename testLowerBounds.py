@@ -0,0 +1,61 @@
+import os
+import tempfile
+import itertools
+
+import heuristics
+import lowerBounds
+import optimizeStacking
+import stackingPallet
+from instanceGenerator import generalSequences
+
+#Saved samplesets go to a temporary directory instead of data/
+os.environ['STACKING_DATA'] = tempfile.mkdtemp()
+
+def binOptimum(sequences):
+    """! Minimum number of stacking places over every removal order"""
+    indices = heuristics.binIndices(sequences)
+    binCount = sum(len(sequence) for sequence in sequences)
+    best = None
+    for choice in itertools.product(range(0, len(sequences)), repeat=binCount):
+        heads = [0]*len(sequences)
+        order = []
+        for s in choice:
+            if heads[s] >= len(indices[s]):
+                break
+            order.append(indices[s][heads[s]])
+            heads[s] += 1
+        if len(order) == binCount:
+            places = heuristics.stackingPlaces(sequences, order)
+            best = places if best is None else min(best, places)
+    return best
+
+def palletOptimum(sequences):
+    labels = sorted(set(heuristics.binLabels(sequences)))
+    return min(heuristics.palletObjective(sequences, list(order)) for order in itertools.permutations(labels))
+
+#Interleaved labels have to share stacking places, labels with a single bin never need one
+assert(lowerBounds.overlapBound([[0,1,2,0,1,2]]) == 3 and lowerBounds.overlapBound([[3,1,2]]) == 0)
+assert(lowerBounds.palletCliqueBound([[0,1,2],[2,1,0]]) == 2 and lowerBounds.palletCliqueBound([[0,1],[1,2]]) == 0)
+assert(lowerBounds.hasPrecedenceCycle([[0,1],[1,2],[2,0]]) and lowerBounds.palletCliqueBound([[0,1],[1,2],[2,0]]) == 1)
+
+#The combinatorial bounds are valid and the exact bounds are the optimum
+for seed in range(0, 12):
+    sequences = generalSequences(2+seed%2, 4, 7, seed=seed)
+    binBest, palletBest = binOptimum(sequences), palletOptimum(sequences)
+    assert(max(heuristics.trivialLowerBound(sequences), lowerBounds.overlapBound(sequences)) <= binBest)
+    assert(lowerBounds.binStateBound(sequences) == binBest == lowerBounds.binLowerBound(sequences))
+    assert(lowerBounds.palletCliqueBound(sequences) <= palletBest)
+    assert(lowerBounds.palletSubsetBound(sequences) == palletBest == lowerBounds.palletLowerBound(sequences))
+assert(lowerBounds.binStateBound(generalSequences(3, 8, 30, seed=0), 100) is None)
+assert(lowerBounds.palletSubsetBound(generalSequences(3, 8, 30, seed=0), 4) is None)
+
+#A bisection whose bounds meet needs no solver call
+sequences = [[0,1,2,0,1,2],[2,1,0]]
+res = optimizeStacking.minimizeStackingPlaces(sequences, 10, verbose=False)
+assert(res['calls'] == 0 and res['places'] == 3 and heuristics.stackingPlaces(sequences, res['order']) == 3)
+
+#The solve stops after the first round that meets the bound
+res = stackingPallet.solveSimAnneal([[0,1,2],[2,1,0]], 40, warmStart=True, stopAtBound=True, seed=1)
+info = res[1].info['lowerBound']
+assert(info['bound'] == 2 and info['best'] == 2 and info['stoppedEarly'] and info['num_reads'] == 10)
+assert(res[1].record.num_occurrences.sum() == 10 and res[1].first.energy == 2)
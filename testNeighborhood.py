@@ -0,0 +1,36 @@
+import os
+import tempfile
+
+import dimod
+
+from stackingPallet import PalletQUBOGenerator
+import qaUtils
+
+#Path a-b-c-d and an isolated variable e
+bqm = dimod.BinaryQuadraticModel({'a':1, 'b':2, 'c':3, 'd':4, 'e':5}, {('a','b'):-1, ('b','c'):-2, ('c','d'):-3}, 0, 'BINARY')
+index = qaUtils.AdjacencyIndex.fromBQM(bqm)
+assert(set(index.subgraph(['a'], 0).variables) == {'a'})
+assert(set(index.subgraph(['a'], 2).variables) == {'a', 'b', 'c'})
+assert(set(index.subgraph(['a', 'd'], 1).variables) == {'a', 'b', 'c', 'd'})
+assert(set(index.subgraph(['e'], 3).variables) == {'e'})
+part = index.subgraph(['b'], 1)
+assert(part.get_quadratic('a', 'b') == -1 and part.get_quadratic('b', 'c') == -2)
+assert(part.num_interactions == 2 and part.get_linear('c') == 3)
+
+#One hop matches the induced subgraph of the variable and its neighbors
+bqm = PalletQUBOGenerator([[0,1,3,2],[3,1,0,2]]).bqm
+var = next(iter(bqm.variables))
+part = qaUtils.extractNeighborhood(bqm, var)
+expected = {var} | set(bqm.adj[var])
+assert(set(part.variables) == expected)
+for u, v in bqm.quadratic:
+    if u in expected and v in expected:
+        assert(part.get_quadratic(u, v) == bqm.get_quadratic(u, v))
+assert(part.num_interactions == sum(1 for u, v in bqm.quadratic if u in expected and v in expected))
+
+#Saved samplesets get a sidecar archive the index can be loaded from
+sampleset = dimod.SampleSet.from_samples([{v:0 for v in bqm.variables}], 'BINARY', [0])
+sampleset.info['bqm'] = bqm
+path = qaUtils.saveSampleset(sampleset, os.path.join(tempfile.mkdtemp(), 'SA-'))
+assert(os.path.exists(qaUtils.sidecarPath(path)))
+assert(qaUtils.loadAdjacencyIndex(path).subgraph([var], 2) == qaUtils.extractNeighborhood(bqm, var, 2))
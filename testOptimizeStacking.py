@@ -0,0 +1,37 @@
+import math
+
+import dimod
+import heuristics
+import lowerBounds
+import optimizeStacking
+from instanceGenerator import generalSequences
+
+#On small instances the exact bound is proven, the result is the optimum after a logarithmic number of solver calls
+closedGaps = 0
+for seed in (0, 1, 17, 22, 23):
+    sequences = generalSequences(3, 4, 12, seed=seed)
+    exact = lowerBounds.binStateBound(sequences)
+    heuristic = heuristics.upperBound(sequences)[0]
+    res = optimizeStacking.minimizeStackingPlaces(sequences, 20, verbose=False, seed=seed)
+    assert(res['lowerBound'] == exact and exact <= res['places'] <= heuristic)
+    assert(heuristics.isValidOrder(sequences, res['order']) and heuristics.stackingPlaces(sequences, res['order']) == res['places'])
+    assert(res['optimal'] == (res['places'] == exact))
+    assert(res['calls'] <= math.ceil(math.log2(heuristic-exact+1)))
+    if heuristic == exact:
+        assert(res['calls'] == 0 and res['optimal'])
+    elif res['optimal']:
+        closedGaps += 1
+assert(closedGaps > 0)
+
+#A sampler that never finds a plan doesn't raise the lower bound, the heuristic plan is reported as an upper bound
+class RandomSampler(dimod.RandomSampler):
+    def sample(this, bqm, num_reads=1, **args):
+        return super().sample(bqm, num_reads=num_reads, seed=1)
+
+sequences = [[1,3,0,1,2],[1,2,2,0,0]]
+exact = lowerBounds.binStateBound(sequences)
+heuristic = heuristics.upperBound(sequences)[0]
+assert(exact < heuristic)
+res = optimizeStacking.minimizeStackingPlaces(sequences, 1, sampler=RandomSampler(), verbose=False, stateLimit=0)
+assert(res['places'] == heuristic and not res['optimal'] and res['lowerBound'] <= exact)
+assert(res['unresolved'] == heuristic-1 and all(places is None for _, places in res['history']))
@@ -0,0 +1,36 @@
+import os
+import tempfile
+import numpy as np
+
+import parallelSA
+import stacking
+import stackingPallet
+from stackingPallet import PalletQUBOGenerator
+
+#Saved samplesets go to a temporary directory instead of data/
+os.environ['STACKING_DATA'] = tempfile.mkdtemp()
+
+assert(parallelSA.shardReads(10, 4) == [3,3,2,2] and parallelSA.shardReads(2, 4) == [1,1])
+assert(len(set(parallelSA.shardSeeds(1, 4))) == 4 and parallelSA.shardSeeds(1, 4) == parallelSA.shardSeeds(1, 4))
+
+#The bqm survives the shared memory block
+bqm = PalletQUBOGenerator([[0,1,3,2],[3,1,0,2]]).bqm
+block, description = parallelSA.shareBQM(bqm)
+try:
+    assert(parallelSA.readBQM(block.buf, description) == bqm)
+finally:
+    block.close()
+    block.unlink()
+
+#Shards are merged into one aggregated sampleset with the requested number of reads and reproducible for a seed
+sampleset = parallelSA.sampleParallel(bqm, 40, workers=3, seed=7)
+again = parallelSA.sampleParallel(bqm, 40, workers=3, seed=7)
+assert(sampleset.record.num_occurrences.sum() == 40 and len(sampleset.info['parallel']['shards']) == 3)
+assert(len(sampleset) == len({tuple(sample) for sample in sampleset.record.sample}))
+assert(np.allclose(sampleset.record.energy, bqm.energies(sampleset)))
+assert((sampleset.record.sample == again.record.sample).all())
+
+res = stacking.solveSimAnneal([[0,1],[1,0]], 12, 1, workers=2, seed=3)
+assert(res[1].record.num_occurrences.sum() == 12 and res[1].info['parallel']['workers'] == 2)
+res = stackingPallet.solveSimAnneal([[0,1,2],[2,1,0]], 12, warmStart=True, workers=2, seed=3)
+assert(res[1].record.num_occurrences.sum() == 12 and res[1].first.energy == 2)
@@ -0,0 +1,33 @@
+import json
+import os
+import tempfile
+
+from neal.sampler import SimulatedAnnealingSampler
+import penaltyCalibration
+
+sequences = [[0,1,0],[1,0,1]]
+path = os.path.join(tempfile.mkdtemp(), 'calibration.json')
+args = {'num_reads':50, 'num_sweeps':100, 'steps':3, 'seed':1}
+
+#Every family gets a scale of at most 1, the optimum stays the lowest energy of a valid plan at the calibrated scales
+for model, encoding in (('bin', 'onehot'), ('pallet', 'onehot'), ('pallet', 'domainwall')):
+    optimum = penaltyCalibration.referenceOptimum(sequences, model, 200, seed=1, encoding=encoding)
+    scales = penaltyCalibration.getPenaltyScales(sequences, model, path=path, encoding=encoding, optimum=optimum, **args)
+    assert(set(scales) == set(penaltyCalibration.penaltyFamilies(model)) and all(0 < scale <= 1 for scale in scales.values()))
+    assert(min(scales.values()) < 1)
+    generator = penaltyCalibration.buildGenerator(sequences, model, scales, encoding=encoding)
+    sampleset = SimulatedAnnealingSampler().sample(generator.bqm, num_reads=100, seed=2)
+    assert(penaltyCalibration.isSafe(generator, sampleset, optimum))
+    assert(sampleset.first.energy == optimum and penaltyCalibration.decodePlan(generator, sampleset.first.sample) is not None)
+
+#The classes are cached per encoding, the second call is served from the cache file
+with open(path) as cacheFile:
+    cache = json.load(cacheFile)
+assert(set(cache) == {'bin-k2-l2-n6-db1', 'pallet-k2-l2-n6-p50', 'pallet-k2-l2-n6-p50-domainwall'})
+
+def fail(*args, **kwargs):
+    raise AssertionError('Calibrated again')
+calibrate = penaltyCalibration.calibrate
+penaltyCalibration.calibrate = fail
+assert(penaltyCalibration.getPenaltyScales(sequences, 'bin', path=path) == cache['bin-k2-l2-n6-db1'])
+penaltyCalibration.calibrate = calibrate
@@ -0,0 +1,32 @@
+import time
+
+from neal.sampler import SimulatedAnnealingSampler
+from offlineSampler import OfflineDWaveSampler
+import pipeline
+
+class SlowSampler(SimulatedAnnealingSampler):
+    """Simulated annealing that takes as long as a round trip to a QPU"""
+    def sample(self, bqm, **kwargs):
+        time.sleep(0.2)
+        return super().sample(bqm, **kwargs)
+
+instances = [[[0,1],[1,0]], [[0,2,1],[1,0,2]], [[0,1,3,2],[3,1,0,2]], [[1,2,1,0],[1,0,2,0]]]
+
+#The results are in the order of the instances and carry their info
+samplesets = pipeline.solveAll(instances, 10, sampler=SlowSampler(), save=False)
+assert([sampleset.info['sequences'] for sampleset in samplesets] == instances)
+for sampleset in samplesets:
+    assert(set(sampleset.variables) == set(sampleset.info['bqm'].variables))
+
+#The next instance is generated while the current one is sampled
+timings = [sampleset.info['pipeline'] for sampleset in samplesets]
+for current, following in zip(timings, timings[1:]):
+    assert(following['generate'][1] < current['sample'][1])
+#Only one instance is sampled at a time
+for current, following in zip(timings, timings[1:]):
+    assert(following['sample'][0] >= current['sample'][1])
+
+#Structured samplers get an embedding stage
+samplesets = pipeline.solveAll(instances[:2], 10, sampler=OfflineDWaveSampler(topology_shape=[6]), model='bin', save=False)
+assert(all('embed' in sampleset.info['pipeline'] for sampleset in samplesets))
+assert(all(sampleset.info['bqm'].energy(sampleset.first.sample) == sampleset.first.energy for sampleset in samplesets))
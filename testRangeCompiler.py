@@ -0,0 +1,41 @@
+import os
+import tempfile
+import dimod
+from stacking import StackingQUBOGenerator
+from stackingPallet import PalletQUBOGenerator, solveDWave
+import rangeCompiler
+
+#Saved samplesets go to a temporary directory instead of data/
+os.environ['STACKING_DATA'] = tempfile.mkdtemp()
+
+assert(rangeCompiler.termClass('x(0,1)') == 'plan' and rangeCompiler.termClass('s3_1#0') == 'number')
+assert(rangeCompiler.termClass('w_2') == 'number' and rangeCompiler.termClass('and(x(0,1),x(1,2))') == 'boolean')
+
+#A strong coupler determines the scaling. Splitting its variable lowers the scale and keeps the ground states
+bqm = dimod.BinaryQuadraticModel({'a':1, 'b':-2, 'c':0.5, 'd':1},
+        {('a','b'):-40, ('b','c'):3, ('c','d'):-2, ('a','d'):1.5, ('b','d'):-1}, 0, 'BINARY')
+compiled = rangeCompiler.compileBQM(bqm, rangeBudget=2, maxCopies=6)
+assert(len(compiled.copies) > 0)
+assert(compiled.report['after']['scale'] < compiled.report['before']['scale'])
+exact = dimod.ExactSolver()
+ground = exact.sample(bqm).first
+decoded = compiled.decode(exact.sample(compiled.bqm).lowest())
+assert(set(decoded.variables) == set(bqm.variables) and decoded.info['brokenCopies'] == 0)
+assert(decoded.first.energy == ground.energy and decoded.first.sample == ground.sample)
+assert(compiled.bqm.energy(compiled.encode(ground.sample)) == exact.sample(compiled.bqm).first.energy)
+
+#The report covers every class of terms of the generators
+generator = StackingQUBOGenerator([[1,1,0,2],[2,0,0]], 1, encoding='domainwall')
+generator.generateBQM()
+report = rangeCompiler.precisionReport(generator.bqm.change_vartype(dimod.SPIN, inplace=False), rangeCompiler.objectiveTerms(generator))
+assert({'h:plan', 'h:number', 'objective'} <= set(report['classes']))
+assert(report['classes']['objective']['count'] == 1 and report['scale'] > 0)
+
+pallet = PalletQUBOGenerator([[0,1,3,2],[3,1,0,2]])
+stats = rangeCompiler.spectrum(pallet.bqm)
+assert(pallet.getMaxBias() == max(stats['maxLinear'], stats['maxQuadratic']))
+
+#solveDWave samples the compiled model and returns samples of the bqm of the generator
+sampleset = solveDWave([[0,1],[1,0]], 10, offline=True, rangeCompile=True)
+assert(set(sampleset.variables) == set(sampleset.info['bqm'].variables))
+assert('rangeCompiler' in sampleset.info and sampleset.info['rangeCompile'])
@@ -0,0 +1,58 @@
+import os
+import tempfile
+
+import stacking
+import stackingPallet
+import resultCache
+
+#Saved samplesets go to a temporary directory instead of data/
+os.environ['STACKING_DATA'] = tempfile.mkdtemp()
+
+cache = resultCache.ResultCache(tempfile.mkdtemp())
+
+#Identical solves hit the cache, different parameters don't
+first = stacking.solveSimAnneal([[0,1],[1,0]], 10, 0, cache=cache, seed=5)[1]
+second = stacking.solveSimAnneal([[0,1],[1,0]], 10, 0, cache=cache, seed=5)[1]
+assert('cacheHit' not in first.info and second.info['cacheHit'])
+assert((first.record.sample == second.record.sample).all())
+assert(second.info['sequences'] == [[0,1],[1,0]])
+third = stacking.solveSimAnneal([[0,1],[1,0]], 10, 0, cache=cache, seed=6)[1]
+assert('cacheHit' not in third.info)
+assert(len(cache.entries()) == 2)
+
+pallet = stackingPallet.solveSimAnneal([[0,1],[1,0]], 10, cache=cache, seed=5)[1]
+assert('cacheHit' not in pallet.info)
+
+#Keys don't depend on the order of parameters
+assert(resultCache.solveKey('bin', [[0,1]], {'a':1, 'b':2}, 'SA', {'seed':1, 'num_reads':2})
+        == resultCache.solveKey('bin', [[0,1]], {'b':2, 'a':1}, 'SA', {'num_reads':2, 'seed':1}))
+assert(resultCache.solveKey('bin', [[0,1]], {}, 'SA', {'seed':1}) != resultCache.solveKey('pallet', [[0,1]], {}, 'SA', {'seed':1}))
+
+#Forced solves are recomputed
+forced = resultCache.ResultCache(cache.directory, force=True)
+assert('cacheHit' not in stacking.solveSimAnneal([[0,1],[1,0]], 10, 0, cache=forced, seed=5)[1].info)
+
+#The least recently used entries are evicted first
+entries = cache.entries()
+os.utime(entries[0][2], (0, 0))
+small = resultCache.ResultCache(cache.directory, maxBytes=cache.size()-1)
+small.evict()
+assert(len(small.entries()) == len(entries)-1)
+assert(entries[0][2] not in [path for _, _, path in small.entries()])
+
+#Hits are returned with the generator and the sampling time of the stored solve, entries without a bqm get it rebuilt
+hit = stacking.solveSimAnneal([[0,1],[1,0]], 10, 0, cache=cache, seed=5)
+assert(hit[1].info['cacheHit'] and hit[2].bqm == hit[1].info['bqm'] and hit[1].info['bqm'].num_variables > 0)
+assert(hit[0] == hit[1].info['samplingTime'] > 0)
+key = resultCache.solveKey('pallet', [[0,1],[1,0]], {'penaltyMul':50, 'penaltyScales':None, 'encoding':'onehot', 'warmStart':False, 'symmetry':False, 'tightSlack':False},
+        'SA', {'seed':7, 'num_reads':10, 'workers':1, 'stopAtBound':False})
+stripped = pallet.copy()
+del stripped.info['bqm']
+cache.put(key, stripped)
+hit = stackingPallet.solveSimAnneal([[0,1],[1,0]], 10, cache=cache, seed=7)
+assert(hit[1].info['cacheHit'] and hit[1].info['bqm'] == stackingPallet.PalletQUBOGenerator([[0,1],[1,0]]).bqm)
+assert(hit[2].bqm == hit[1].info['bqm'] and hit[0] == pallet.info['samplingTime'])
+
+#The code version covers every module of this directory the solvers import
+assert({'stacking.py', 'stackingPallet.py', 'parallelSA.py', 'lowerBounds.py', 'chainBreak.py', 'warmStart.py', 'offlineSampler.py'}
+        <= set(resultCache.codeModules()))
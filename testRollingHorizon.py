@@ -0,0 +1,53 @@
+import itertools
+
+import heuristics
+from rollingHorizon import IncrementalPalletGenerator, RollingHorizon
+from stackingPallet import PalletQUBOGenerator
+
+def sameBQM(a, b):
+    """! Returns whether the bqms have the same nonzero biases up to rounding"""
+    if set(a.variables) != set(b.variables) or abs(a.offset-b.offset) > 1e-9:
+        return False
+    if any(abs(a.get_linear(var)-b.get_linear(var)) > 1e-9 for var in a.variables):
+        return False
+    left = {frozenset(key):bias for key, bias in a.quadratic.items() if bias != 0}
+    right = {frozenset(key):bias for key, bias in b.quadratic.items() if bias != 0}
+    return left.keys() == right.keys() and all(abs(left[key]-right[key]) <= 1e-9 for key in left)
+
+def energiesMatch(generator):
+    """! Checks that every opening order that respects the committed pallets has the energy w"""
+    for order in itertools.permutations(range(0, generator.numLabels)):
+        order = list(order)
+        if order[:len(generator.committed)] == generator.committed:
+            assert(generator.bqm.energy(generator.sampleFromOrder(order)) == heuristics.palletObjective(generator.sequences, order))
+            assert(generator.decodeOpeningOrder(generator.sampleFromOrder(order)) == order)
+
+#Predecessors that extend the sorted chains and new labels give the bqm of a full rebuild
+generator = IncrementalPalletGenerator([[0,1,2,3,4],[4,3]])
+for s, label in [(1,2), (1,1), (1,0), (0,5), (2,6)]:
+    assert(generator.appendBin(s, label))
+    assert(sameBQM(generator.bqm, PalletQUBOGenerator(generator.sequences, encoding='domainwall').bqm))
+assert(not generator.appendBin(0, 7)) #w needs another bit
+assert(generator.sequences == [[0,1,2,3,4,5],[4,3,2,1,0],[6]])
+
+#Other orders of the chains and committed pallets keep the energies
+generator = IncrementalPalletGenerator([[0,1,2],[2,1,0]])
+generator.commit([2])
+energiesMatch(generator)
+for s, label in [(0,1), (2,3), (1,0), (2,0)]:
+    generator.appendBin(s, label)
+    energiesMatch(generator)
+generator.commit([0])
+energiesMatch(generator)
+assert(all(name not in generator.bqm.variables for name in generator.fixed))
+
+#The plans respect the committed pallets and w is rebuilt with more bits when needed
+horizon = RollingHorizon([[0,1,2],[2,1,0],[3,0]], num_reads=20, seed=1)
+order, w, _ = horizon.solve()
+assert(sorted(order) == [0,1,2,3] and w == heuristics.palletObjective(horizon.generator.sequences, order))
+committed = horizon.commit(2)
+for s, label in [(0,4), (1,5), (2,6), (3,7), (1,3)]:
+    horizon.append(s, label)
+    order, w, _ = horizon.solve()
+    assert(order[:2] == committed and sorted(order) == list(range(0, horizon.generator.numLabels)))
+assert(horizon.generator.auxSize == 4 and horizon.generator.committed == committed)
@@ -1,7 +1,12 @@
 import stackingPallet
 import collectConstStatsPallet
+import resultCache
+import sys
 import numpy as np
 
+#-cache returns the results of identical earlier runs(data/cache) instead of sampling again, -force recomputes them
+cache = resultCache.ResultCache(force='-force' in sys.argv) if '-cache' in sys.argv else None
+
 instances = [[[0,1],[1,0]],
         [[0,1,3,2],[3,1,0,2]],
         [[0,2,5,1,3,4,3,1,2,3,4,5,3,1,5],[4,5,1,2,3,4,3,1,5,4,5,1,1,3,4]],
@@ -10,7 +15,7 @@ instances = [[[0,1],[1,0]],
 
 for instance in instances:
     print(instance)
-    res = stackingPallet.solveSimAnneal(instance, 1000)
+    res = stackingPallet.solveSimAnneal(instance, 1000, cache=cache)
     ss = res[1]
     correct = np.sum(ss.record['energy'] < 10)
     print(correct)
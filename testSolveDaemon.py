@@ -0,0 +1,83 @@
+import os
+import tempfile
+import threading
+
+import solveClient
+import solveDaemon
+
+address = os.path.join(tempfile.mkdtemp(), 'daemon.sock')
+server = solveDaemon.createServer(address)
+thread = threading.Thread(target=server.serve_forever)
+thread.start()
+
+try:
+    with solveClient.SolveClient(address) as client:
+        assert(client.request({'op':'ping'}) == {'ok':True})
+
+        #The second solve of an instance reuses the generator
+        first = client.solve([[0,1,2],[2,1,0]], num_reads=20, seed=1, bounds=True)
+        second = client.solve([[0,1,2],[2,1,0]], num_reads=20, seed=1)
+        assert(first['ok'] and first['objective'] == 2 and sorted(first['order']) == [0,1,2] and first['energy'] == 2)
+        assert(first['bounds'] == {'lower':2, 'upper':2})
+        assert(not first['cached']['generator'] and second['cached']['generator'])
+        assert(second['order'] == first['order'])
+
+        res = client.solve([[0,1,2,0],[2,1,0,1]], model='bin', num_reads=50, dec_bound=2, seed=1, warmStart=True)
+        assert(res['ok'] and res['objective'] == 3 and sorted(res['order']) == list(range(0, 8)))
+
+        #Structured backends embed once per bqm
+        res = client.solve([[0,1],[1,0]], method='OFFLINE', num_reads=10)
+        again = client.solve([[0,1],[1,0]], method='OFFLINE', num_reads=10)
+        assert(res['ok'] and res['objective'] == 1 and res['cached']['embedding'] is False and again['cached']['embedding'])
+
+        #Errors don't close the connection
+        assert(not client.request({'op':'solve'})['ok'])
+        assert(not client.solve([[0,1]], model='unknown')['ok'])
+        assert(not client.request([{'op':'ping'}])['ok'] and not client.request('ping')['ok'] and not client.request(None)['ok'])
+
+        #Symmetry, tight slacks and penalty scales are part of the generator
+        plain = client.solve([[0,1,0,1],[1,0,1,0]], num_reads=20, seed=1)
+        broken = client.solve([[0,1,0,1],[1,0,1,0]], num_reads=20, seed=1, symmetry=True, tightSlack=True,
+                              penaltyScales={'permutation':0.5})
+        assert(broken['ok'] and not broken['cached']['generator'] and broken['variables'] < plain['variables'])
+        assert(broken['objective'] == plain['objective'] == 1 and sorted(broken['order']) == [0,1])
+        assert(client.request({'op':'bounds', 'model':'bin', 'sequences':[[0,1,0],[1,0,1]]}) == {'lower':2, 'upper':2, 'ok':True})
+        stats = client.request({'op':'stats'})
+        assert(stats['requests'] == 9 and stats['generators']['hits'] == 2 and stats['embeddings']['entries'] == 1)
+
+    #The generator is built with the options of the request
+    daemon = solveDaemon.SolveDaemon()
+    request = {'sequences':[[0,1,2,0],[2,1,0,1]], 'model':'bin', 'dec_bound':2, 'symmetry':True, 'tightSlack':True,
+               'penaltyScales':{'or':0.5}}
+    generator = daemon.buildGenerator(request)
+    assert(generator.symmetry and generator.tightSlack and generator.penaltyScales == {'or':0.5})
+    keys = {daemon.generatorKey(dict(request, **change)) for change in [{}, {'symmetry':False}, {'tightSlack':False}, {'penaltyScales':None}]}
+    assert(len(keys) == 4)
+    assert(daemon.handle([1, 2]) == {'ok':False, 'error':'Request must be a JSON object, got list'})
+
+    #Only loopback addresses and socket files are used
+    assert(solveDaemon.parseAddress('127.0.0.1:9000') == ('tcp', ('127.0.0.1', 9000)))
+    assert(solveDaemon.parseAddress('localhost:9000') == ('tcp', ('localhost', 9000)))
+    for host in ['0.0.0.0', '192.168.1.2', 'example.org']:
+        try:
+            solveDaemon.parseAddress(host+':9000')
+            assert(False)
+        except ValueError:
+            pass
+    results = os.path.join(os.path.dirname(address), 'results.dat')
+    with open(results, 'w') as data:
+        data.write('results')
+    try:
+        solveDaemon.createServer(results)
+        assert(False)
+    except FileExistsError:
+        pass
+    with open(results) as data:
+        assert(data.read() == 'results')
+
+    assert(solveClient.request({'op':'shutdown'}, address) == {'ok':True})
+    thread.join(10)
+    assert(not thread.is_alive())
+finally:
+    server.shutdown()
+    server.server_close()
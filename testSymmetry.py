@@ -0,0 +1,99 @@
+import itertools
+
+import dimod
+from stacking import StackingQUBOGenerator
+from stackingPallet import PalletQUBOGenerator
+import symmetry
+
+def removalOrders(generator):
+    """! Generates every removal order that respects the sequences"""
+    for order in itertools.permutations(range(0, generator.binCount)):
+        time = {elem:t for t, elem in enumerate(order)}
+        if all(time[a] < time[b] for a, b in symmetry.sequencePrecedences(generator.bySequence)):
+            yield list(order)
+
+#Detection
+assert(symmetry.identicalSequences([[0,1],[2],[0,1],[0,1]]) == [[0,2,3]])
+assert(symmetry.repeatedBins([[0,0,1,1,1]], [[0,1,2,3,4]]) == [(0,1), (2,3), (3,4)])
+assert(symmetry.twinLabels(3, [(0,1),(1,0),(0,2),(1,2)]) == [[0,1]])
+assert(symmetry.removalWindows(3, [(0,1)]) == ([0,1,0], [1,2,2]))
+report = symmetry.analyze([[0,1,2],[2,1,0]])
+assert(report['twinLabels'] == [[0,1,2]] and report['palletSymmetry'] == 6 and report['binSymmetry'] == 1)
+
+#The reduced bin models are smaller and keep the optimum. Every plan maps to a canonical plan that decodes again
+for encoding in ['onehot', 'domainwall']:
+    for sequences in [[[0,1,0],[0,1,0]], [[1,1,0,2],[2,0,0]]]:
+        full = StackingQUBOGenerator(sequences, 0, encoding=encoding)
+        full.generateBQM()
+        reduced = StackingQUBOGenerator(sequences, 0, encoding=encoding, symmetry=True)
+        reduced.generateBQM()
+        assert(len(reduced.bqm) < len(full.bqm))
+
+        optimum = min(full.bqm.energy(full.sampleFromOrder(order)) for order in removalOrders(full))
+        energies = []
+        for order in removalOrders(full):
+            state = reduced.sampleFromOrder(order)
+            energies.append(reduced.bqm.energy(state))
+            assert(energies[-1] <= full.bqm.energy(full.sampleFromOrder(order)))
+            assert(reduced.decodeRemovalOrder(state) == symmetry.canonicalBinOrder(reduced, order))
+        assert(min(energies) == optimum)
+
+#The ground states of a reduced model are canonical plans
+generator = StackingQUBOGenerator([[0,1,0],[0,1,0]], 1, encoding='domainwall', symmetry=True)
+generator.generateBQM()
+ground = dimod.ExactSolver().sample(generator.bqm).lowest()
+for sample in ground.samples():
+    order = generator.decodeRemovalOrder(sample)
+    assert(order is not None and symmetry.canonicalBinOrder(generator, order) == order)
+    assert(order.index(0) < order.index(3))
+
+#Twins are opened in the order of their labels, which leaves one of the six optima
+for encoding in ['onehot', 'domainwall']:
+    full = PalletQUBOGenerator([[0,1,2],[2,1,0]], encoding=encoding)
+    reduced = PalletQUBOGenerator([[0,1,2],[2,1,0]], encoding=encoding, symmetry=True)
+    assert(len(reduced.bqm) < len(full.bqm))
+    for order in itertools.permutations(range(0, 3)):
+        assert(reduced.bqm.energy(reduced.sampleFromOrder(list(order))) == full.bqm.energy(full.sampleFromOrder(list(order))))
+ground = dimod.ExactSolver().sample(reduced.bqm).lowest()
+assert(len(ground) == 1 and reduced.decodeOpeningOrder(ground.first.sample) == [0,1,2])
+
+#Samplesets are mapped onto the bqm of the full model
+mapped = symmetry.mapBack(ground, reduced, full)
+assert(set(mapped.variables) == set(full.bqm.variables))
+assert(mapped.first.energy == ground.first.energy)
+assert(full.decodeOpeningOrder(mapped.first.sample) == [0,1,2])
+
+#The constraint statistics apply the same fixings, contractions and orderings: Canonical plans are free of violations
+import os
+import tempfile
+import collectConstStats
+import collectConstStatsPallet
+import stacking
+import stackingPallet
+
+os.environ['STACKING_DATA'] = tempfile.mkdtemp()
+
+def statsSampleset(generator, states):
+    sampleset = dimod.SampleSet.from_samples_bqm(states, generator.bqm)
+    sampleset.info.update({'sequences':generator.sequences, 'encoding':generator.encoding, 'symmetry':True})
+    return sampleset
+
+for encoding in ['onehot', 'domainwall']:
+    reduced = StackingQUBOGenerator([[1,1,0,2],[2,0,0]], 0, encoding=encoding, symmetry=True)
+    reduced.generateBQM()
+    states = [reduced.sampleFromOrder(order) for order in removalOrders(reduced)]
+    states.append(dict(states[0], **{'p_'+str(i):0 for i in range(0, reduced.objectiveSize)}))
+    stats = collectConstStats.calcConstraintStats(statsSampleset(reduced, states), 0)
+    assert(stats == {'Permutation':0, 'SequenceOrder':0, 'f(t,c)':0, 'Count':1})
+
+    reduced = PalletQUBOGenerator([[0,1,2,3],[3,2,1,0]], encoding=encoding, symmetry=True)
+    states = [reduced.sampleFromOrder(list(order)) for order in itertools.permutations(range(0, 4))]
+    states.append(dict(states[0], **{'w_'+str(i):0 for i in range(0, reduced.objectiveSize)}))
+    stats = collectConstStatsPallet.calcConstraintStats(statsSampleset(reduced, states))
+    assert(stats == {'Permutation':0, 'Y(j,c)':0, 'Count':1})
+
+#Samplesets of the solvers carry the option
+_, sampleset, _ = stacking.solveSimAnneal([[0,1,0],[0,1,0]], 20, 1, symmetry=True, seed=1)
+assert(sum(collectConstStats.calcConstraintStats(sampleset).values()) <= 4*20)
+_, sampleset, _ = stackingPallet.solveSimAnneal([[0,1,2],[2,1,0]], 20, symmetry=True, seed=1)
+assert(sum(collectConstStatsPallet.calcConstraintStats(sampleset).values()) <= 3*20)
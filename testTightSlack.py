@@ -0,0 +1,90 @@
+import os
+import tempfile
+import itertools
+import neal
+import heuristics
+import rangeCompiler
+from qaUtils import inequalityCouplers
+from stacking import StackingQUBOGenerator, solveSimAnneal
+from stackingPallet import PalletQUBOGenerator
+
+#Saved samplesets go to a temporary directory instead of data/
+os.environ['STACKING_DATA'] = tempfile.mkdtemp()
+
+#Coupler count of one step with 2 summed variables, 1 slack bit and 2 bits of p: 1+2*3+2+0 and the square of p
+assert(inequalityCouplers({0:2}, {0:1}, 2) == 10)
+
+#The bounds of the bin model hold for every valid plan
+sequences = [[0,1,0],[2,1,2]]
+generator = StackingQUBOGenerator(sequences, 1)
+bounds = generator.openLabelBounds()
+for order in itertools.permutations(range(0, generator.binCount)):
+    position = {elem:time for time, elem in enumerate(order)}
+    if any(position[s[i]] > position[s[i+1]] for s in generator.bySequence for i in range(0, len(s)-1)):
+        continue
+    for c in range(0, generator.binCount):
+        removed = set(order[:c+1])
+        openLabels = [label for label, indices in generator.byLabel.items() if 0 < len(removed & set(indices)) < len(indices)]
+        assert(bounds[c][0] <= len(openLabels) <= bounds[c][1])
+
+#A single sequence fixes the plan: The labels that are open at every step are known, the slacks shrink to the gap to the busiest step
+single = StackingQUBOGenerator([[0,1,2,3,0,1,2,3]], 1, tightSlack=True)
+assert(single.openLabelBounds()[3] == (4, 4) and single.slackSizes[3] == 0)
+assert(single.objectiveSize == 3 and single.slackSizes[1] == 2)
+
+#Every valid plan has the same energy with tight slacks as with uniform ones, the bqm gets smaller
+for sequences, dec_bound in (([[0,1,2,0],[2,1,0,1]], 1), ([[0,1,2,1],[3,0,3,2]], 0)):
+    uniform = StackingQUBOGenerator(sequences, dec_bound)
+    uniform.generateBQM()
+    tight = StackingQUBOGenerator(sequences, dec_bound, tightSlack=True)
+    tight.generateBQM()
+    assert(len(tight.bqm) <= len(uniform.bqm) and tight.bqm.num_interactions <= uniform.bqm.num_interactions)
+    for order in itertools.permutations(range(0, uniform.binCount)):
+        state = uniform.sampleFromOrder(list(order))
+        if uniform.decodeRemovalOrder(state) is None:
+            continue
+        assert(uniform.bqm.energy(state) == tight.bqm.energy(tight.sampleFromOrder(list(order))))
+    assert(set(rangeCompiler.objectiveTerms(tight)) <= set(tight.bqm.variables))
+
+_, sampleset, _ = solveSimAnneal([[0,1,2,0],[2,1,0,1]], 50, 1, tightSlack=True, seed=1)
+assert(sampleset.info['tightSlack'] and sampleset.first.energy == heuristics.upperBound([[0,1,2,0],[2,1,0,1]])[0])
+
+#Pallet model: w and the slacks only need the bits of the number of labels with predecessors
+sequences = [[0,1,2,3],[3,2,1,0],[4,5,6,7]]
+uniform = PalletQUBOGenerator(sequences)
+tight = PalletQUBOGenerator(sequences, tightSlack=True)
+assert(tight.objectiveSize == 3 and uniform.objectiveSize == 4)
+assert(tight.countedLabelBound() == 7 and set(tight.slackSizes.values()) == {3})
+assert(len(tight.bqm) == len(uniform.bqm)-8)
+for order in itertools.islice(itertools.permutations(range(0, 8)), 0, 40320, 97):
+    assert(uniform.bqm.energy(uniform.sampleFromOrder(list(order))) == tight.bqm.energy(tight.sampleFromOrder(list(order))))
+best = neal.SimulatedAnnealingSampler().sample(PalletQUBOGenerator([[0,1,2],[2,1,0]], tightSlack=True).bqm, num_reads=50, seed=1).first
+assert(best.energy == heuristics.palletUpperBound([[0,1,2],[2,1,0]])[0])
+
+#The constraint statistics model the tight slacks: Plans are free of violations, a too small p violates the count
+import dimod
+import collectConstStats
+import collectConstStatsPallet
+import stackingPallet
+
+def statsSampleset(generator, states):
+    sampleset = dimod.SampleSet.from_samples_bqm(states, generator.bqm)
+    sampleset.info.update({'sequences':generator.sequences, 'encoding':generator.encoding, 'tightSlack':generator.tightSlack})
+    return sampleset
+
+tight = StackingQUBOGenerator([[0,1,2,0],[2,1,0,1]], 1, tightSlack=True)
+tight.generateBQM()
+states = [tight.sampleFromOrder(order) for order in ([0,4,1,5,2,6,3,7], [4,5,6,0,1,2,3,7])]
+states[1] = dict(states[1], **{'p_'+str(i):0 for i in range(0, tight.objectiveSize)})
+stats = collectConstStats.calcConstraintStats(statsSampleset(tight, states))
+assert(stats == {'Permutation':0, 'SequenceOrder':0, 'f(t,c)':0, 'Count':1})
+
+tight = PalletQUBOGenerator([[0,1,2,3],[3,2,1,0],[4,5,6,7]], tightSlack=True)
+states = [tight.sampleFromOrder(list(range(0, 8))), tight.sampleFromOrder([4,5,6,7,3,2,1,0])]
+states[1] = dict(states[1], **{'w_'+str(i):0 for i in range(0, tight.objectiveSize)})
+stats = collectConstStatsPallet.calcConstraintStats(statsSampleset(tight, states))
+assert(stats == {'Permutation':0, 'Y(j,c)':0, 'Count':1})
+
+#Samplesets of the solvers carry the option
+_, sampleset, _ = stackingPallet.solveSimAnneal([[0,1,2,3],[3,2,1,0],[4,5,6,7]], 20, tightSlack=True, seed=1)
+assert(sum(collectConstStatsPallet.calcConstraintStats(sampleset).values()) <= 3*20)
@@ -0,0 +1,56 @@
+import os
+import pickle
+import tempfile
+
+import dimod
+import numpy as np
+
+import ttsAnalysis
+
+#TTS of a single read and of reads that fail half of the time
+assert(np.isclose(ttsAnalysis.tts(0.5, 2.0), 2*np.log(0.01)/np.log(0.5)))
+assert(ttsAnalysis.tts(1.0, 2.0) == 2.0 and ttsAnalysis.tts(0.995, 2.0) == 2.0 and ttsAnalysis.tts(0.0, 2.0) == np.inf)
+
+#10 reads: 3 at energy 1, 5 at energy 2, 2 at energy 5. One read takes 1 ms on the QPU
+bqm = dimod.BinaryQuadraticModel({'a':1, 'b':1}, {('a','b'):3}, 0, dimod.BINARY)
+sampleset = dimod.SampleSet.from_samples([{'a':1, 'b':0}, {'a':1, 'b':1}, {'a':0, 'b':1}], dimod.BINARY, [1, 2, 5],
+        num_occurrences=[3, 5, 2], info={'timing':{'qpu_sampling_time':10000.0}})
+assert(np.isclose(ttsAnalysis.readTime(sampleset), 0.001))
+levels = ttsAnalysis.energyLevels(sampleset)
+assert(list(levels[0]) == [1, 2, 5] and list(levels[1]) == [3, 5, 2])
+
+res = ttsAnalysis.analyze(sampleset, seed=0)
+assert(res['target'] == 1 and res['p'] == 0.3 and res['pLow'] <= 0.3 <= res['pHigh'] and res['reads'] == 10)
+assert(res['ttsLow'] <= res['tts'] <= res['ttsHigh'] and len(res['ttsReplicates']) == ttsAnalysis.RESAMPLES)
+assert(np.isclose(res['tts'], 0.001*np.log(0.01)/np.log(0.7)))
+again = ttsAnalysis.analyze(sampleset, seed=0)
+assert(again['pLow'] == res['pLow'] and again['pHigh'] == res['pHigh'])
+
+#Time to target curve: Higher targets are reached sooner
+curve = ttsAnalysis.timeToTarget(sampleset, [0, 1, 2, 5], resamples=200, seed=1)
+assert(list(curve['p']) == [0, 0.3, 0.8, 1.0] and (np.diff(curve['tts']) <= 0).all() and curve['tts'][0] == np.inf)
+assert(curve['ttsReplicates'].shape == (200, 4) and (curve['ttsReplicates'][:, 3] == 0.001).all())
+
+#Scaling fits recover the exponent of exact curves
+sizes = np.array([4, 6, 8, 10])
+fit = ttsAnalysis.fitScaling(sizes, 2*np.exp(0.5*sizes))
+assert(np.isclose(fit['slope'], 0.5) and np.isclose(fit['intercept'], np.log(2)) and np.isclose(fit['r2'], 1))
+fit = ttsAnalysis.fitScaling(sizes, 3*sizes**2.0, 'polynomial', replicates=np.outer(3*sizes**2.0, [1, 2, 4]))
+assert(np.isclose(fit['slope'], 2) and np.isclose(fit['slopeLow'], 2) and np.isclose(fit['slopeHigh'], 2))
+assert(np.isnan(ttsAnalysis.fitScaling([4, 4], [1, 2])['slope']))
+
+#A catalog of the samplesets of a directory. The pallet instance has the known optimum w=2
+with tempfile.TemporaryDirectory() as directory:
+    pallet = dimod.SampleSet.from_samples([{'a':0}, {'a':1}], dimod.BINARY, [2, 3], num_occurrences=[4, 6],
+            info={'sequences':[[0,1,2],[2,1,0]], 'penaltyFactor':10, 'timing':{'sampling_ns':10**7}})
+    binModel = dimod.SampleSet.from_samples([{'a':0}, {'a':1}], dimod.BINARY, [7, 9], num_occurrences=[1, 1],
+            info={'sequences':[[0,1],[1,0]], 'parallel':{'shards':[{'time':0.5}, {'time':0.5}]}})
+    for name, stored in [('pallet.dat', pallet), ('bin.dat', binModel), ('binAgain.dat', binModel)]:
+        with open(os.path.join(directory, name), 'wb') as out:
+            pickle.dump(stored.to_serializable(), out)
+    rows = {os.path.basename(row['path']):row for row in ttsAnalysis.analyzeCatalog([directory], resamples=100, seed=0)}
+    assert(rows['pallet.dat']['model'] == 'pallet' and rows['pallet.dat']['target'] == 2 and rows['pallet.dat']['p'] == 0.4)
+    assert(np.isclose(rows['pallet.dat']['readTime'], 0.001) and rows['pallet.dat']['size'] == 6)
+    assert(rows['bin.dat']['target'] == 7 and rows['bin.dat']['p'] == 0.5 and rows['bin.dat']['readTime'] == 0.5)
+    curves = ttsAnalysis.scalingCurves(rows.values())
+    assert(set(curves) == {('pallet', 'SA', 'onehot'), ('bin', 'SA', 'onehot')})
@@ -0,0 +1,32 @@
+from stacking import StackingQUBOGenerator
+from stackingPallet import PalletQUBOGenerator
+import heuristics
+import warmStart
+
+#The heuristic state is a full assignment whose energy is the value of the heuristic plan
+sequences = [[0,1,2,0],[2,1,0,1]]
+for encoding in ['onehot', 'domainwall']:
+    gen = StackingQUBOGenerator(sequences, 0, encoding=encoding)
+    gen.generateBQM()
+    state = warmStart.heuristicState(gen)
+    assert(set(state) == set(gen.bqm.variables))
+    places, order = heuristics.upperBound(sequences)
+    assert(gen.decodeRemovalOrder(state) == order)
+    assert(gen.bqm.energy(state) == places)
+
+    gen = PalletQUBOGenerator([[0,1,3,2],[3,1,0,2]], encoding=encoding)
+    state = warmStart.heuristicState(gen)
+    value, labelOrder = heuristics.palletUpperBound(gen.sequences)
+    assert(gen.decodeOpeningOrder(state) == labelOrder)
+    assert(gen.bqm.energy(state) == value)
+
+#Arguments of the samplers
+gen = StackingQUBOGenerator(sequences, 0)
+gen.generateBQM()
+state = warmStart.heuristicState(gen)
+args = warmStart.annealWarmStartArgs(gen.bqm, state)
+assert(args['initial_states_generator'] == 'tile')
+assert(args['beta_range'][0] < args['beta_range'][1])
+args = warmStart.reverseAnnealArgs(state, 0.4)
+assert(args['anneal_schedule'][0] == [0.0, 1.0] and args['anneal_schedule'][-1][1] == 1.0)
+assert(min(point[1] for point in args['anneal_schedule']) == 0.4)
@@ -0,0 +1,294 @@
+"""! Time-to-solution analysis of stored samplesets.
+
+A read succeeds if its energy is at most the target energy, by default the optimum of the instance. With the success
+probability p and the time t of one read, the time to reach the target with the given confidence(99%) is
+    TTS = t * log(1-0.99)/log(1-p),
+and t if p is at least the confidence. The time of a read is taken from the timing info of the sampleset: the QPU
+sampling time for QA, the sampling time of the shards or of the sampler for SA(see readTime()).
+
+Confidence intervals are bootstrapped: The reads are resampled with replacement by drawing the occurrences of the
+distinct energy levels from one multinomial distribution per replicate. All replicates are drawn at once and every
+target of a time-to-target curve is evaluated on the same replicates.
+
+Scaling curves fit log(TTS) linearly against the instance size(exponential scaling) or its logarithm(polynomial
+scaling). The fit is repeated on every bootstrap replicate, which gives the confidence interval of the exponent.
+
+Example:
+    python ttsAnalysis.py data/pallet -fit exponential
+"""
+import glob
+import json
+import os
+
+import numpy as np
+
+import lowerBounds
+import qaUtils
+
+#Default confidence of TTS
+CONFIDENCE = 0.99
+
+#Default number of bootstrap replicates
+RESAMPLES = 1000
+
+#Energies up to this distance above the target count as success
+TOLERANCE = 1e-9
+
+def energyLevels(sampleset):
+    """! Returns the sorted distinct energies of the sampleset and the number of reads of each"""
+    energies, inverse = np.unique(sampleset.record.energy, return_inverse=True)
+    return energies, np.bincount(inverse.ravel(), weights=sampleset.record.num_occurrences, minlength=len(energies)).astype(np.int64)
+
+def readTime(sampleset):
+    """! Returns the time of one read in seconds or None if the sampleset has no timing info"""
+    reads = int(np.sum(sampleset.record.num_occurrences))
+    timing = sampleset.info.get('timing', {})
+    if 'qpu_sampling_time' in timing:
+        return timing['qpu_sampling_time']*1e-6/reads
+    if 'parallel' in sampleset.info:
+        return sum(shard['time'] for shard in sampleset.info['parallel']['shards'])/reads
+    if 'sampling_ns' in timing:
+        return timing['sampling_ns']*1e-9/reads
+    return None
+
+def modelName(sampleset):
+    """! Returns 'pallet' or 'bin'. Only samplesets of the pallet model store their penalty factor"""
+    return 'pallet' if 'penaltyFactor' in sampleset.info else 'bin'
+
+def solverName(sampleset):
+    """! Returns 'QA' or 'SA' depending on the timing info of the sampleset"""
+    return 'QA' if 'qpu_sampling_time' in sampleset.info.get('timing', {}) else 'SA'
+
+def optimumEnergy(sampleset):
+    """! Returns the optimal energy if it is known classically or None.
+    Valid samples of the pallet model have the energy w, whose optimum is known for small instances"""
+    if modelName(sampleset) == 'pallet' and 'sequences' in sampleset.info:
+        return lowerBounds.palletSubsetBound(sampleset.info['sequences'])
+    return None
+
+def tts(p, time, confidence=CONFIDENCE):
+    """! Returns the time to solution for the success probabilities p(number or array). Infinite if p is 0"""
+    p = np.asarray(p, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        res = time*np.log(1-confidence)/np.log1p(-np.minimum(p, 1))
+    res = np.where(p >= confidence, time, res)
+    return np.where(p <= 0, np.inf, res)
+
+def bootstrapCounts(counts, resamples=RESAMPLES, rng=None):
+    """! Resamples the reads with replacement
+
+    @param counts Number of reads of every energy level
+    @returns Matrix with the number of reads of every energy level(columns) for every replicate(rows)
+    """
+    rng = np.random.default_rng(rng)
+    total = int(np.sum(counts))
+    return rng.multinomial(total, np.asarray(counts)/total, size=resamples)
+
+def interval(values, alpha):
+    """! Returns the percentile interval of the replicates that contains 1-alpha of them"""
+    return np.percentile(values, [100*alpha/2, 100*(1-alpha/2)], axis=0)
+
+def timeToTarget(sampleset, targets, time=None, confidence=CONFIDENCE, resamples=RESAMPLES, alpha=0.05, seed=None):
+    """! Returns the success probability and time to reach every target energy with bootstrapped confidence intervals
+
+    @param targets List of target energies
+    @param time Time of one read in seconds. Taken from the timing info if omitted, 1 if there is none
+    @param confidence Probability TTS refers to
+    @param resamples Number of bootstrap replicates
+    @param alpha 1-alpha is the coverage of the intervals
+    @returns dict of arrays with one entry per target: 'p', 'pLow', 'pHigh', 'tts', 'ttsLow', 'ttsHigh'.
+             'ttsReplicates' contains the TTS of every replicate(rows) and target(columns)
+    """
+    energies, counts = energyLevels(sampleset)
+    return levelTimeToTarget(energies, counts, targets, readTime(sampleset) if time is None else time,
+                             confidence, resamples, alpha, seed)
+
+def levelTimeToTarget(energies, counts, targets, time=None, confidence=CONFIDENCE, resamples=RESAMPLES, alpha=0.05, seed=None):
+    """! timeToTarget() for the energy levels of a sampleset, see energyLevels()"""
+    total = counts.sum()
+    time = 1.0 if time is None else time
+
+    #Reads at most as high as every target, for the observed reads and every replicate
+    below = np.searchsorted(energies, np.asarray(targets, dtype=np.float64)+TOLERANCE, side='right')
+    cumulative = np.concatenate([[0], np.cumsum(counts)])
+    p = cumulative[below]/total
+    replicates = np.concatenate([np.zeros((resamples, 1), dtype=np.int64),
+                                 np.cumsum(bootstrapCounts(counts, resamples, seed), axis=1)], axis=1)[:, below]/total
+    pLow, pHigh = interval(replicates, alpha)
+    ttsReplicates = tts(replicates, time, confidence)
+    #The TTS decreases with p, so the bounds of p give the interval of TTS
+    return {'p':p, 'pLow':pLow, 'pHigh':pHigh, 'tts':tts(p, time, confidence), 'ttsLow':tts(pHigh, time, confidence),
+            'ttsHigh':tts(pLow, time, confidence), 'readTime':time, 'reads':int(total), 'ttsReplicates':ttsReplicates}
+
+def analyze(sampleset, target=None, time=None, confidence=CONFIDENCE, resamples=RESAMPLES, alpha=0.05, seed=None):
+    """! Returns the success probability and TTS of one sampleset with bootstrapped confidence intervals
+
+    @param target Target energy. The optimum(see optimumEnergy()) or else the lowest energy of the sampleset if omitted
+    @returns dict with the target, the number of reads, the time of a read, 'p', 'pLow', 'pHigh', 'tts', 'ttsLow',
+             'ttsHigh' and the TTS of every replicate('ttsReplicates')
+    """
+    if target is None:
+        target = optimumEnergy(sampleset)
+    if target is None:
+        target = float(sampleset.first.energy)
+    return single(timeToTarget(sampleset, [target], time, confidence, resamples, alpha, seed), target)
+
+def single(res, target):
+    """! Returns the results of timeToTarget() for a single target as numbers"""
+    summary = {key:(float(value[0]) if isinstance(value, np.ndarray) and value.ndim == 1 else value) for key, value in res.items()}
+    summary['ttsReplicates'] = res['ttsReplicates'][:, 0]
+    summary['target'] = target
+    return summary
+
+def instanceSize(sampleset, size='bins'):
+    """! Returns the size of the instance of the sampleset
+
+    @param size 'bins', 'labels', 'sequences' or 'variables'(of the bqm)
+    """
+    sequences = sampleset.info.get('sequences', [])
+    if size == 'bins':
+        return sum(len(sequence) for sequence in sequences)
+    if size == 'labels':
+        return len({label for sequence in sequences for label in sequence})
+    if size == 'sequences':
+        return len(sequences)
+    if size == 'variables':
+        return len(sampleset.info['bqm']) if 'bqm' in sampleset.info else len(sampleset.variables)
+    raise ValueError('Unknown size '+str(size))
+
+def catalogPaths(sources, pattern='*.dat'):
+    """! Returns the paths of the stored samplesets of the given files and directories(searched recursively)"""
+    paths = []
+    for source in sources:
+        if os.path.isdir(source):
+            paths += sorted(glob.glob(os.path.join(source, '**', pattern), recursive=True))
+        else:
+            paths.append(source)
+    return paths
+
+def analyzeCatalog(sources, target='optimum', size='bins', confidence=CONFIDENCE, resamples=RESAMPLES, alpha=0.05, seed=None):
+    """! Analyzes every stored sampleset of the given files and directories, see catalogPaths()
+
+    Every sampleset is loaded once. Only its energy levels and metadata are kept, so large catalogs fit into memory.
+
+    @param target 'optimum': The optimum if it is known, else the lowest energy of any sampleset of the instance.
+           'best': The lowest energy of any sampleset of the instance. A number: That energy for every sampleset
+    @param size Measure of the instance size, see instanceSize()
+    @returns List with one dict per sampleset: 'path', 'model', 'solver', 'encoding', 'sequences', 'size' and
+             the results of analyze()
+    """
+    entries = []
+    for path in catalogPaths(sources):
+        sampleset = qaUtils.loadSampleset(path)
+        energies, counts = energyLevels(sampleset)
+        entry = {'path':path, 'model':modelName(sampleset), 'solver':solverName(sampleset),
+                 'encoding':sampleset.info.get('encoding', 'onehot'), 'sequences':sampleset.info.get('sequences'),
+                 'size':instanceSize(sampleset, size), 'readTime':readTime(sampleset),
+                 'optimum':optimumEnergy(sampleset) if target == 'optimum' else None}
+        #Only the energy levels are needed from here on
+        entries.append((entry, energies, counts))
+
+    best = {}
+    for entry, energies, _ in entries:
+        instance = (entry['model'], json.dumps(entry['sequences']))
+        best[instance] = min(best.get(instance, np.inf), float(energies[0]))
+
+    rng = np.random.default_rng(seed)
+    res = []
+    for entry, energies, counts in entries:
+        goal = entry.pop('optimum')
+        if not isinstance(target, str):
+            goal = target
+        elif goal is None:
+            goal = best[(entry['model'], json.dumps(entry['sequences']))]
+        entry.update(single(levelTimeToTarget(energies, counts, [goal], entry['readTime'], confidence, resamples, alpha, rng), goal))
+        res.append(entry)
+    return res
+
+def fitScaling(sizes, values, kind='exponential', replicates=None, alpha=0.05):
+    """! Fits log(values) linearly against the sizes(exponential) or their logarithm(polynomial).
+    Infinite values are left out
+
+    @param replicates Optional matrix of bootstrap replicates of the values with one row per size.
+           The fit is repeated for every replicate(column) to get the confidence interval of the exponent
+    @returns dict with the kind, the exponent('slope') and the constant factor('intercept') of the fit
+             in the natural logarithm, the coefficient of determination('r2') and 'slopeLow', 'slopeHigh'
+    """
+    x = np.asarray(sizes, dtype=np.float64)
+    if kind == 'polynomial':
+        x = np.log(x)
+    elif kind != 'exponential':
+        raise ValueError('Unknown kind of fit '+str(kind))
+
+    def fit(matrix):
+        """! Least squares fit of every column of matrix, leaving out the entries that aren't finite"""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            y = np.log(matrix)
+        weights = np.isfinite(y)
+        y = np.where(weights, y, 0)
+        count = weights.sum(axis=0)
+        sx, sy = (weights*x[:, None]).sum(axis=0), y.sum(axis=0)
+        sxx, sxy = (weights*x[:, None]**2).sum(axis=0), (y*x[:, None]).sum(axis=0)
+        #Without two different sizes there is no slope
+        spread = count*sxx-sx**2
+        with np.errstate(divide='ignore', invalid='ignore'):
+            slope = np.where(spread > 1e-12, (count*sxy-sx*sy)/spread, np.nan)
+            intercept = (sy-slope*sx)/count
+        return slope, intercept, y, weights
+
+    slope, intercept, y, weights = fit(np.asarray(values, dtype=np.float64)[:, None])
+    res = {'kind':kind, 'slope':float(slope[0]), 'intercept':float(intercept[0]), 'points':int(weights.sum()), 'r2':np.nan}
+    if np.isfinite(slope[0]):
+        residual = np.sum(weights*(y-intercept-slope*x[:, None])**2)
+        spread = np.sum(weights*(y-y[weights].mean())**2)
+        res['r2'] = float(1-residual/spread) if spread > 0 else 1.0
+    if replicates is not None:
+        slopes = fit(np.asarray(replicates, dtype=np.float64))[0]
+        slopes = slopes[np.isfinite(slopes)]
+        if len(slopes) > 0:
+            res['slopeLow'], res['slopeHigh'] = [float(value) for value in interval(slopes, alpha)]
+    return res
+
+def scalingCurves(rows, kind='exponential', key=('model', 'solver', 'encoding'), alpha=0.05):
+    """! Fits the TTS of every group of rows of analyzeCatalog() against the instance size
+
+    @param key Fields of the rows that identify a group
+    @returns dict that maps the values of the key fields to the result of fitScaling()
+    """
+    groups = {}
+    for row in rows:
+        groups.setdefault(tuple(row[field] for field in key), []).append(row)
+    return {group:fitScaling([row['size'] for row in members], [row['tts'] for row in members], kind,
+                             np.array([row['ttsReplicates'] for row in members]), alpha)
+            for group, members in groups.items()}
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description='Compute the time to solution of stored samplesets with bootstrapped confidence intervals')
+    parser.add_argument('sources', type=str, nargs='+', help='Samplesets or directories of samplesets')
+    parser.add_argument('-t', type=str, action='store', dest='target', default='optimum',
+            help='Target energy: optimum, best(lowest energy found for the instance) or a number')
+    parser.add_argument('-c', type=float, action='store', dest='confidence', default=CONFIDENCE, help='Confidence of TTS')
+    parser.add_argument('-r', type=int, action='store', dest='resamples', default=RESAMPLES, help='Number of bootstrap replicates')
+    parser.add_argument('-size', type=str, action='store', dest='size', choices=['bins', 'labels', 'sequences', 'variables'], default='bins')
+    parser.add_argument('-fit', type=str, action='store', dest='fit', choices=['exponential', 'polynomial'], default=None,
+            help='Fit the TTS of every model, solver and encoding against the instance size')
+    parser.add_argument('-seed', type=int, action='store', dest='seed', default=None)
+    parser.add_argument('-o', type=str, action='store', dest='output', default=None, help='Write the results to this JSON lines file')
+
+    args = parser.parse_args(sys.argv[1:])
+    target = args.target if args.target in ('optimum', 'best') else float(args.target)
+    rows = analyzeCatalog(args.sources, target, args.size, args.confidence, args.resamples, seed=args.seed)
+    for row in rows:
+        print('{} {:<6} {:<3} size {:>3} p {:.4f} [{:.4f}, {:.4f}] TTS {:.4g}s [{:.4g}, {:.4g}]'.format(row['path'],
+              row['model'], row['solver'], row['size'], row['p'], row['pLow'], row['pHigh'], row['tts'], row['ttsLow'], row['ttsHigh']))
+    if args.fit is not None:
+        for group, fit in scalingCurves(rows, args.fit).items():
+            print(' '.join(group), fit)
+    if args.output is not None:
+        with open(args.output, 'w') as out:
+            for row in rows:
+                out.write(json.dumps({key:(float(value) if isinstance(value, np.floating) else value)
+                                      for key, value in row.items() if key != 'ttsReplicates'})+'\n')
@@ -0,0 +1,48 @@
+"""! Warm starts for the samplers, seeded from the classical heuristics.
+
+The heuristic plan is mapped to a full assignment of the generated bqm(see sampleFromOrder() of the generators),
+which then serves as the initial state of simulated annealing or of a reverse anneal on the QPU.
+"""
+from neal.sampler import default_beta_range
+
+import heuristics
+
+#Point of the reverse anneal schedule. Smaller values move further away from the initial state
+DEFAULT_REVERSE_POINT = 0.5
+
+def heuristicState(generator):
+    """! Returns the assignment of every variable of the generator's bqm for the best heuristic plan
+
+    @param generator A StackingQUBOGenerator with a generated bqm or a PalletQUBOGenerator
+    """
+    if hasattr(generator, 'decodeRemovalOrder'):
+        order = heuristics.upperBound(generator.sequences)[1]
+    else:
+        order = heuristics.palletUpperBound(generator.sequences)[1]
+    return generator.sampleFromOrder(order)
+
+def annealWarmStartArgs(bqm, state, reversePoint=DEFAULT_REVERSE_POINT):
+    """! Returns the keyword arguments for SimulatedAnnealingSampler.sample() that start every read from the given state.
+    The annealing starts at a temperature between the default hot and cold temperature, like
+    a reverse anneal that only goes back to reversePoint.
+
+    @param bqm The bqm that will be sampled
+    @param state Assignment of every variable of the bqm
+    @param reversePoint Value in [0,1]. 0 starts at the default hot temperature, 1 at the cold temperature
+    """
+    variables = list(bqm.variables)
+    hot, cold = default_beta_range(bqm)
+    return {'initial_states':([[state[var] for var in variables]], variables),
+            'initial_states_generator':'tile',
+            'beta_range':(hot**(1-reversePoint)*cold**reversePoint, cold)}
+
+def reverseAnnealArgs(state, reversePoint=DEFAULT_REVERSE_POINT, rampTime=5, pauseTime=10):
+    """! Returns the keyword arguments for DWaveSampler.sample() that reverse anneal from the given state
+
+    @param state Assignment of every variable of the (logical) bqm. EmbeddingComposite spreads it over the chains
+    @param reversePoint Anneal fraction s the schedule goes back to
+    @param rampTime Time in microseconds to go back to reversePoint and forward again
+    @param pauseTime Time in microseconds spent at reversePoint
+    """
+    schedule = [[0.0, 1.0], [rampTime, reversePoint], [rampTime+pauseTime, reversePoint], [2*rampTime+pauseTime, 1.0]]
+    return {'initial_state':state, 'anneal_schedule':schedule, 'reinitialize_state':True}